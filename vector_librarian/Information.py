@@ -11,6 +11,7 @@ from authentication import (
 
 
 def app() -> None:
+    client.warm_up()
     st.set_page_config(
         page_title="Vector Librarian",
         page_icon="📚",
@@ -1,22 +1,25 @@
-import openai
-import weaviate
+import json
+
 import streamlit as st
 
+import client
+
 
 def connect_to_openai(openai_api_key: str) -> None:
     """Try to connect to OpenAI using the API key.
     Set the state variable OPENAI_STATUS based on the outcome
     """
+    import openai
+
+    from backend.connections import connection_manager
+
     try:
-        openai.api_key = openai_api_key
-        openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[dict(role="user", content="hello")],
-        )
+        connection_manager().validate_openai_key(openai_api_key)
     except Exception as e:
         st.session_state["OPENAI_STATUS"] = "error", e
         return
-    
+
+    openai.api_key = openai_api_key
     st.session_state["OPENAI_STATUS"] = "success", None
 
 
@@ -46,31 +49,102 @@ def openai_connection_status():
         st.warning("Visit `Information` to connect to OpenAI")
 
 
+def execution_breakdown():
+    """Time spent in the slowest nodes, branches and external requests of the last
+    client call of this session, with the trace and the process metrics to download
+    """
+    if run_trace := client.last_trace():
+        st.session_state["LAST_TRACE"] = run_trace
+    run_trace = st.session_state.get("LAST_TRACE")
+    if run_trace is None:
+        return
+
+    breakdown = run_trace.breakdown()
+    with st.expander(f"⏱️ `{breakdown['name']}` took {breakdown['seconds']:.2f} s"):
+        st.dataframe(
+            [
+                dict(node=node_name, calls=stats["calls"], seconds=round(stats["seconds"], 3))
+                for node_name, stats in list(breakdown["nodes"].items())[:8]
+            ],
+            hide_index=True,
+            use_container_width=True,
+        )
+        for group, stats in breakdown["branches"].items():
+            st.caption(
+                f"`{group}`: {stats['branches']} branches, slowest {stats['seconds_max']:.2f} s"
+            )
+        for service, stats in breakdown["services"].items():
+            tokens = (
+                f", {stats['prompt_tokens']} prompt + {stats['completion_tokens']} completion tokens"
+                if "prompt_tokens" in stats else ""
+            )
+            st.caption(f"{service}: {stats['requests']} requests in {stats['seconds']:.2f} s{tokens}")
+        left, right = st.columns(2)
+        left.download_button(
+            "JSON trace", json.dumps(run_trace.to_dict()), file_name="trace.json", mime="application/json"
+        )
+        right.download_button("Metrics", client.metrics_text(), file_name="metrics.txt", mime="text/plain")
+
+
+def embed_pdf(pdf_base64: str, height: int = 800) -> None:
+    """Display a PDF encoded as base64 in an embedded viewer"""
+    st.markdown(
+        f'<embed src="data:application/pdf;base64,{pdf_base64}" width=100% height={height} type="application/pdf">',
+        unsafe_allow_html=True,
+    )
+
+
+def citation_viewer(dr, chunks: list[dict], key: str) -> None:
+    """Select one of the chunks cited by an answer and display the pages around it, not its whole document"""
+    cited = [chunk for chunk in chunks if chunk.get("page_start") is not None]
+    if not cited:
+        return
+
+    chunk = st.selectbox(
+        "Open a citation",
+        [None] + cited,
+        format_func=lambda c: "" if c is None else (
+            f"{c['document_file_name']}, chunk {c['chunk_index']} (page {c['page_start'] + 1})"
+        ),
+        key=key,
+    )
+    if chunk is None:
+        return
+
+    from backend.blob_store import BlobNotFoundError
+
+    try:
+        pages = client.read_document_pages(
+            dr=dr,
+            weaviate_client=st.session_state.get("WEAVIATE_CLIENT"),
+            document_id=chunk["document_id"],
+            page_start=chunk["page_start"],
+            page_end=chunk["page_end"],
+        )
+    except BlobNotFoundError:
+        st.warning(f"{chunk['document_file_name']}: {client.PDF_NOT_AVAILABLE}")
+        return
+    st.caption(f"Pages {pages['first_page'] + 1} to {pages['last_page'] + 1} of {pages['n_pages']}")
+    embed_pdf(pages["pdf_base64"], height=600)
+
+
 def connect_to_weaviate(weaviate_url, weaviate_api_key, is_default_instance):
     """Try to connect to Weaviate using the URL and API key.
     Set the state variable WEAVIATE_STATUS based on the outcome.
     If the credentials are provided by the user set the 
+    The client is shared by all sessions connecting with the same credentials, see `ConnectionManager`
     """
+    from backend.connections import connection_manager
+
     try:
-        weaviate_client = weaviate.Client(
-            url=weaviate_url, 
-            auth_client_secret=weaviate.AuthApiKey(api_key=weaviate_api_key),
-        )
+        weaviate_client = connection_manager().weaviate_client(weaviate_url, weaviate_api_key)
     except Exception as e:
         st.session_state["WEAVIATE_STATUS"] = "error", e
         return
 
-    if weaviate_client.is_live() and weaviate_client.is_ready():
-        st.session_state["WEAVIATE_CLIENT"] = weaviate_client
-
-        if is_default_instance:
-            st.session_state["WEAVIATE_DEFAULT_INSTANCE"] = True
-            st.session_state["WEAVIATE_STATUS"] = "success", None
-        else:
-            st.session_state["WEAVIATE_DEFAULT_INSTANCE"] = False
-            st.session_state["WEAVIATE_STATUS"] = "success", None
-    else:
-        st.session_state["WEAVIATE_STATUS"] = "error", ConnectionError("Weaviate server is not ready.")
+    st.session_state["WEAVIATE_CLIENT"] = weaviate_client
+    st.session_state["WEAVIATE_DEFAULT_INSTANCE"] = is_default_instance
+    st.session_state["WEAVIATE_STATUS"] = "success", None
 
 
 def user_auth_weaviate():
@@ -0,0 +1,134 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+from backend import instrumentation
+
+
+@dataclass
+class _Entry:
+    query: str
+    vector: np.ndarray
+    fields: tuple
+    created_at: float
+    answer: dict
+
+
+def normalize_query(query: str) -> str:
+    """Query in lower case with its whitespace collapsed, so that trivially different queries match"""
+    return " ".join(query.lower().split())
+
+
+class AnswerCache:
+    """In-memory cache of RAG answers;
+    A stored answer is returned for the same query, once normalized, made with the same key fields
+    (alpha, top k, corpus and version of the corpus, read from the store so that ingestion by
+    any process changes it), or with a `similarity_threshold`, for a query whose embedding has
+    a cosine similarity of at least the threshold with its query.
+    Entries expire after `ttl_seconds` and the least recently used are evicted beyond
+    `max_entries`. Safe to share between threads
+    """
+
+    def __init__(self, ttl_seconds: float = 3600.0, max_entries: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now: float) -> None:
+        expired = [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def _match(
+        self, query: str, query_vector: np.ndarray, fields: tuple, similarity_threshold: float | None
+    ) -> int | None:
+        candidates = [(key, entry) for key, entry in self._entries.items() if entry.fields == fields]
+        for key, entry in candidates:
+            if entry.query == query:
+                return key
+        if similarity_threshold is None or not candidates:
+            return None
+        similarities = np.stack([entry.vector for _, entry in candidates]) @ query_vector
+        best = int(np.argmax(similarities))
+        return candidates[best][0] if similarities[best] >= similarity_threshold else None
+
+    def get(
+        self,
+        rag_query: str,
+        query_vector: np.ndarray,
+        corpus_id: str,
+        corpus_version: str,
+        hybrid_search_alpha: float,
+        retrieve_top_k: int,
+        similarity_threshold: float | None = None,
+    ) -> dict | None:
+        """Return a copy of the answer of the same query, or of the most similar one if its similarity
+        reaches `similarity_threshold`, or None; None matches the same query only
+        """
+        query_vector = _unit(query_vector)
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            key = self._match(
+                normalize_query(rag_query),
+                query_vector,
+                (float(hybrid_search_alpha), int(retrieve_top_k), corpus_id, corpus_version),
+                similarity_threshold,
+            )
+            if key is None:
+                self.misses += 1
+                answer = None
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                answer = copy.deepcopy(self._entries[key].answer)
+
+        instrumentation.METRICS.inc("answer_cache_requests_total", result="miss" if answer is None else "hit")
+        return answer
+
+    def put(
+        self,
+        rag_query: str,
+        query_vector: np.ndarray,
+        corpus_id: str,
+        corpus_version: str,
+        hybrid_search_alpha: float,
+        retrieve_top_k: int,
+        answer: dict,
+    ) -> None:
+        """Store the answer of a query computed on `corpus_version` of the corpus;
+        It only matches queries made on the same version
+        """
+        with self._lock:
+            self._entries[self._next_key] = _Entry(
+                query=normalize_query(rag_query),
+                vector=_unit(query_vector),
+                fields=(float(hybrid_search_alpha), int(retrieve_top_k), corpus_id, corpus_version),
+                created_at=time.monotonic(),
+                answer=copy.deepcopy(answer),
+            )
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=self.hits / requests if requests else 0.0,
+                entries=len(self._entries),
+            )
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1)
@@ -1,46 +1,90 @@
+import logging
+import re
 from pathlib import Path
 
 import arxiv
 from streamlit.runtime.uploaded_file_manager import UploadedFile
-from hamilton.htypes import Collect, Parallelizable
 
+from backend.downloader import DownloadRequest, PdfDownloader, cached_path
 
-def arxiv_to_download(arxiv_ids: list[str], data_dir: str | Path) -> Parallelizable[arxiv.Result]:
-    """Iterate over arxiv search resulsts for given arxiv ids"""
-    for arxiv_result in arxiv.Search(id_list=arxiv_ids).results():
-        yield arxiv_result
+logger = logging.getLogger(__name__)
 
 
 def created_data_dir(data_dir: str | Path) -> str:
-    """Create the directory to download PDFs if it doesn't exist already;
-    NOTE. if you try to create it in the Parallelizable threads, you could face race conditions
-    """
+    """Create the directory to download PDFs if it doesn't exist already"""
     data_dir = Path(data_dir)
-    if data_dir.exists():
-        data_dir.mkdir(parents=True)
-
+    data_dir.mkdir(parents=True, exist_ok=True)
     return str(data_dir)
 
 
-def download_arxiv_pdf(arxiv_to_download: arxiv.Result, created_data_dir: str) -> str:
-    """Download the PDF for the arxiv resutl and return PDF path"""
-    return arxiv_to_download.download_pdf()  # dirpath=created_data_dir)
+def _arxiv_pdf_path(data_dir: str, short_id: str) -> Path:
+    """Cache location of the PDF of an arxiv article, keyed by its id and version"""
+    return Path(data_dir) / f"{short_id.replace('/', '_')}.pdf"
+
+
+def _has_version(arxiv_id: str) -> bool:
+    return re.search(r"v\d+$", arxiv_id) is not None
+
+
+def _without_version(arxiv_id: str) -> str:
+    return re.sub(r"v\d+$", "", arxiv_id)
+
+
+def arxiv_to_download(arxiv_ids: list[str], created_data_dir: str) -> list[DownloadRequest]:
+    """Resolve arxiv ids to the PDF files to download;
+    Ids with an explicit version that are already cached don't need to query arxiv,
+    the other ids are resolved by a single search request. Results are matched to ids by their
+    short id, an id without version matching any version; ids without a result are logged and skipped
+    """
+    requests = {}
+    ids_to_search = []
+    for arxiv_id in arxiv_ids:
+        path = _arxiv_pdf_path(created_data_dir, arxiv_id)
+        if _has_version(arxiv_id) and cached_path(path):
+            requests[arxiv_id] = DownloadRequest(url="", path=path)
+        else:
+            ids_to_search.append(arxiv_id)
+
+    if ids_to_search:
+        search = arxiv.Search(id_list=ids_to_search, max_results=len(ids_to_search))
+        results = {}
+        for arxiv_result in search.results():
+            short_id = arxiv_result.get_short_id()
+            results[short_id] = arxiv_result
+            results.setdefault(_without_version(short_id), arxiv_result)
 
+        not_found = []
+        for arxiv_id in ids_to_search:
+            arxiv_result = results.get(arxiv_id)
+            if arxiv_result is None:
+                not_found.append(arxiv_id)
+                continue
+            requests[arxiv_id] = DownloadRequest(
+                url=arxiv_result.pdf_url,
+                path=_arxiv_pdf_path(created_data_dir, arxiv_result.get_short_id()),
+            )
+        if not_found:
+            logger.warning("No arxiv article found for ids %s", ", ".join(not_found))
 
-def arxiv_pdf_path(download_arxiv_pdf: str) -> str:
-    """Extend the PDF path to its full path"""
-    return str(Path(download_arxiv_pdf).absolute())
+    return [requests[arxiv_id] for arxiv_id in arxiv_ids if arxiv_id in requests]
 
 
-def arxiv_pdf_path_collection(arxiv_pdf_path: Collect[str]) -> list[str]:
-    """Collect local PDF files full path"""
-    return arxiv_pdf_path
+def arxiv_pdf_path_collection(
+    arxiv_to_download: list[DownloadRequest],
+    arxiv_max_concurrent_downloads: int = 8,
+    arxiv_max_connections_per_host: int = 4,
+) -> list[str]:
+    """Download the PDF files concurrently, reusing cached files, and return their full path"""
+    downloader = PdfDownloader(
+        max_workers=arxiv_max_concurrent_downloads,
+        max_connections_per_host=arxiv_max_connections_per_host,
+    )
+    return [str(path.absolute()) for path in downloader.download_many(arxiv_to_download)]
 
 
 def local_pdfs(arxiv_pdf_path_collection: list[str]) -> list[str | UploadedFile]:
     """List of local PDF files, either string paths or in-memory files (on the FastAPI server)
     NOTE. This function is overriden by the driver to use arbitrary local PDFs and
-    don't need to query arxiv. It is necessary because Parallelizable and Collect nodes
-    cannot be overriden safely at the moment (sf-hamilton==1.26.0)
+    don't need to query arxiv.
     """
-    return arxiv_pdf_path_collection
\ No newline at end of file
+    return arxiv_pdf_path_collection
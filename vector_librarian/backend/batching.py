@@ -0,0 +1,133 @@
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+
+import numpy as np
+import openai
+
+
+@dataclass
+class _EmbeddingRequest:
+    text: str
+    n_tokens: int
+    model_name: str
+    future: Future = field(default_factory=Future)
+    # context of the caller, so that a request is traced with the run of its first text
+    context: contextvars.Context = field(default_factory=contextvars.copy_context)
+
+
+class EmbeddingBatcher:
+    """Pack the texts of all concurrent callers into OpenAI embedding requests sized by a
+    token budget; requests run on a bounded pool and each caller gets its vectors back in order.
+
+    `embed_fn(texts, model_name)` is the function doing a single request, e.g.
+    `backend.ingestion._get_embeddings__openai`
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[list[str], str], np.ndarray],
+        max_batch_tokens: int = 100_000,
+        max_batch_size: int = 2048,
+        max_concurrent_requests: int = 4,
+        linger_seconds: float = 0.02,
+    ):
+        self.embed_fn = embed_fn
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.linger_seconds = linger_seconds
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_concurrent_requests, thread_name_prefix="embedding-request"
+        )
+        self._pending: list[_EmbeddingRequest] = []
+        self._pending_tokens = 0
+        self._condition = threading.Condition()
+        self._dispatcher: threading.Thread | None = None
+
+    def embed(
+        self, texts: list[str], model_name: str, token_counts: list[int]
+    ) -> np.ndarray:
+        """Queue texts for embedding and block until all their vectors are available;
+        `token_counts` is the number of tokens of each text, used to size requests.
+        Return a 2-D float32 array with one row per text
+        """
+        requests = [
+            _EmbeddingRequest(text=text, n_tokens=n_tokens, model_name=model_name)
+            for text, n_tokens in zip(texts, token_counts, strict=True)
+        ]
+        with self._condition:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch_forever, name="embedding-batcher", daemon=True
+                )
+                self._dispatcher.start()
+            self._pending.extend(requests)
+            self._pending_tokens += sum(request.n_tokens for request in requests)
+            self._condition.notify()
+
+        vectors = [request.future.result() for request in requests]
+        return np.stack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+    def _dispatch_forever(self) -> None:
+        """Wait for pending texts, linger briefly so other documents can join, then submit batches"""
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                self._condition.wait_for(
+                    lambda: self._pending_tokens >= self.max_batch_tokens,
+                    timeout=self.linger_seconds,
+                )
+                pending, self._pending, self._pending_tokens = self._pending, [], 0
+
+            for batch in self._pack(pending):
+                self._pool.submit(self._run_batch, batch)
+
+    def _pack(self, requests: list[_EmbeddingRequest]) -> list[list[_EmbeddingRequest]]:
+        """Group requests by model, then split them in order into batches that respect
+        both the token budget and the maximum number of inputs per request
+        """
+        by_model: dict[str, list[_EmbeddingRequest]] = {}
+        for request in requests:
+            by_model.setdefault(request.model_name, []).append(request)
+
+        batches = []
+        for model_requests in by_model.values():
+            batch, batch_tokens = [], 0
+            for request in model_requests:
+                if batch and (
+                    batch_tokens + request.n_tokens > self.max_batch_tokens
+                    or len(batch) >= self.max_batch_size
+                ):
+                    batches.append(batch)
+                    batch, batch_tokens = [], 0
+                batch.append(request)
+                batch_tokens += request.n_tokens
+            batches.append(batch)
+        return batches
+
+    def _run_batch(self, batch: list[_EmbeddingRequest]) -> None:
+        """Send one request; if OpenAI rejects its input, e.g. a text over the token limit, split it
+        in halves so that only the failing sub-batch is retried and the other texts get their vectors.
+        Other errors, e.g. authentication, quota or connection errors, fail the whole batch at once
+        """
+        try:
+            vectors = batch[0].context.run(
+                self.embed_fn, [request.text for request in batch], batch[0].model_name
+            )
+        except openai.error.InvalidRequestError as e:
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            middle = len(batch) // 2
+            self._run_batch(batch[:middle])
+            self._run_batch(batch[middle:])
+            return
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        for request, vector in zip(batch, vectors):
+            request.future.set_result(vector)
@@ -0,0 +1,67 @@
+import contextlib
+import hashlib
+import mmap
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterator
+
+
+class BlobNotFoundError(FileNotFoundError):
+    """The blob isn't in this store, e.g. it was stored on the local disk of another server"""
+
+
+class BlobStore:
+    """Content-addressed store of files on the local disk, keyed by their SHA-256;
+    Files are written once, atomically, and read back through memory maps
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    def path(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256
+
+    def contains(self, sha256: str) -> bool:
+        return self.path(sha256).exists()
+
+    def put(self, data: bytes | memoryview, sha256: str | None = None) -> str:
+        """Store data if it isn't already stored and return its SHA-256"""
+        sha256 = sha256 or hashlib.sha256(data).hexdigest()
+        path = self.path(sha256)
+        if path.exists():
+            return sha256
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first, so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        return sha256
+
+    @contextlib.contextmanager
+    def open(self, sha256: str) -> Iterator[mmap.mmap | bytes]:
+        """Memory-map a stored blob; the map is only valid inside the context;
+        Raise BlobNotFoundError if the blob isn't stored here
+        """
+        try:
+            f = open(self.path(sha256), "rb")
+        except FileNotFoundError:
+            raise BlobNotFoundError(f"Blob {sha256} is not stored in {self.root}") from None
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+    def iter_bytes(self, sha256: str, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+        """Stream a stored blob in chunks of `chunk_size` bytes"""
+        with self.open(sha256) as mapped:
+            for start in range(0, len(mapped), chunk_size):
+                yield mapped[start : start + chunk_size]
@@ -0,0 +1,67 @@
+import csv
+import json
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+
+
+def read_queries(path: str | Path) -> list[dict]:
+    """Read the queries of a bulk run as dicts with `id` and `query`, in file order;
+    A `.jsonl` file has one query per line, either a string or an object with `query` and optionally `id`.
+    Other files are read as CSV with a `query` column, or the first column, and optionally an `id` column.
+    Queries without id are numbered by their position, blank queries are skipped
+    """
+    path = Path(path)
+    with path.open(newline="", encoding="utf-8") as f:
+        if path.suffix.lower() == ".jsonl":
+            rows = [json.loads(line) for line in f if line.strip()]
+            rows = [row if isinstance(row, dict) else dict(query=row) for row in rows]
+        else:
+            reader = csv.DictReader(f)
+            query_column = "query" if "query" in (reader.fieldnames or []) else (reader.fieldnames or [None])[0]
+            rows = [dict(row, query=row[query_column]) for row in reader]
+
+    return [
+        dict(id=row.get("id") or str(idx), query=str(row["query"]).strip())
+        for idx, row in enumerate(rows)
+        if row.get("query") and str(row["query"]).strip()
+    ]
+
+
+class SharedSummaries:
+    """Map-step summaries shared by the queries of a bulk run, so that a chunk retrieved by
+    several queries is summarized once; the first query to claim a chunk summarizes it, the
+    others wait for its summary. Safe to share between threads
+    """
+
+    def __init__(self):
+        self._summaries: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = dict(summarized=0, shared=0)
+
+    def claim(self, chunks: list[dict]) -> tuple[list[dict], dict[str, Future]]:
+        """Split chunks without summary into those the caller must summarize, then `resolve`,
+        and the futures of the summaries of the other chunks, by chunk id
+        """
+        owned, waiting = [], {}
+        with self._lock:
+            for chunk in chunks:
+                if chunk["chunk_id"] in self._summaries:
+                    waiting[chunk["chunk_id"]] = self._summaries[chunk["chunk_id"]]
+                else:
+                    self._summaries[chunk["chunk_id"]] = Future()
+                    owned.append(chunk)
+            self.stats["summarized"] += len(owned)
+            self.stats["shared"] += len(waiting)
+        return owned, waiting
+
+    def resolve(self, chunks: list[dict], summarized: list[dict] | None, error: BaseException | None = None) -> None:
+        """Publish the summaries of claimed chunks, or the error that prevented them"""
+        summaries = {chunk["chunk_id"]: chunk["summary"] for chunk in summarized or []}
+        with self._lock:
+            futures = [(chunk["chunk_id"], self._summaries[chunk["chunk_id"]]) for chunk in chunks]
+        for chunk_id, future in futures:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(summaries[chunk_id])
@@ -0,0 +1,56 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class ByteLRUCache:
+    """In-memory cache of bytes or strings bounded by their total size; the least recently used
+    entries are evicted beyond `max_bytes`, and a value larger than the cache isn't kept.
+    Safe to share between threads
+    """
+
+    def __init__(self, max_bytes: int = 256 << 20):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, bytes | str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> bytes | str | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: bytes | str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= len(self._entries.pop(key))
+            if len(value) > self.max_bytes:
+                return
+            self._entries[key] = value
+            self.total_bytes += len(value)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+    def get_or_put(self, key: Hashable, compute: Callable[[], bytes | str]) -> bytes | str:
+        """Return the cached value of `key`, or compute, cache and return it;
+        Concurrent misses of the same key may compute it more than once
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                hits=self.hits, misses=self.misses, entries=len(self._entries), total_bytes=self.total_bytes
+            )
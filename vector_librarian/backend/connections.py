@@ -0,0 +1,106 @@
+import collections
+import functools
+import hashlib
+import threading
+import time
+
+import weaviate
+
+from backend import instrumentation, openai_io
+
+
+def credential_hash(secret: str | None) -> str:
+    """SHA-256 of a credential, so that clients are pooled without keeping secrets as keys"""
+    return hashlib.sha256((secret or "").encode()).hexdigest()
+
+
+class ConnectionManager:
+    """Clients shared by all Streamlit sessions of the process, one per (URL, credential hash);
+    Health checks and OpenAI key validations that succeeded are reused for `health_ttl_seconds`,
+    so connecting a session makes no request while they are recent. Sessions connecting with the
+    same credentials at once wait for a single client creation or check instead of each making their own.
+    At most `max_clients` Weaviate clients are kept, the least recently used are dropped
+    """
+
+    def __init__(self, health_ttl_seconds: float = 30.0, max_clients: int = 128):
+        self.health_ttl_seconds = health_ttl_seconds
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._key_locks: dict[tuple, threading.Lock] = {}
+        self._clients: collections.OrderedDict[tuple, weaviate.Client] = collections.OrderedDict()
+        self._checked_at: dict[tuple, float] = {}
+
+    def _key_lock(self, key: tuple) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _is_fresh(self, key: tuple) -> bool:
+        checked_at = self._checked_at.get(key)
+        return checked_at is not None and time.monotonic() - checked_at < self.health_ttl_seconds
+
+    def _checked(self, key: tuple, check: str) -> bool:
+        """Whether a check of `key` succeeded within the TTL; count the cache hits and misses"""
+        fresh = self._is_fresh(key)
+        instrumentation.METRICS.inc("connection_checks_total", check=check, result="cached" if fresh else "checked")
+        return fresh
+
+    def _pooled_client(self, key: tuple, weaviate_url: str, weaviate_api_key: str) -> weaviate.Client:
+        with self._lock:
+            if key in self._clients:
+                self._clients.move_to_end(key)
+                return self._clients[key]
+
+        # creating a client requests the server, outside of the lock of the pool
+        with instrumentation.weaviate_request("connect"):
+            client = weaviate.Client(
+                url=weaviate_url,
+                auth_client_secret=weaviate.AuthApiKey(api_key=weaviate_api_key),
+            )
+        with self._lock:
+            self._clients[key] = client
+            while len(self._clients) > self.max_clients:
+                evicted, _ = self._clients.popitem(last=False)
+                self._checked_at.pop(evicted, None)
+                self._key_locks.pop(evicted, None)
+        return client
+
+    def weaviate_client(self, weaviate_url: str, weaviate_api_key: str) -> weaviate.Client:
+        """Shared client of the Weaviate instance, live and ready as of the last `health_ttl_seconds`;
+        Raise ConnectionError if the server is not ready
+        """
+        key = ("weaviate", weaviate_url, credential_hash(weaviate_api_key))
+        with self._key_lock(key):
+            client = self._pooled_client(key, weaviate_url, weaviate_api_key)
+            if self._checked(key, "weaviate"):
+                return client
+
+            with instrumentation.weaviate_request("health_check"):
+                healthy = client.is_live() and client.is_ready()
+            if not healthy:
+                raise ConnectionError("Weaviate server is not ready.")
+            self._checked_at[key] = time.monotonic()
+        return client
+
+    def weaviate_url(self, weaviate_client: weaviate.Client) -> str | None:
+        """URL of a client of the pool, None for clients it didn't create"""
+        with self._lock:
+            return next((key[1] for key, client in self._clients.items() if client is weaviate_client), None)
+
+    def validate_openai_key(self, openai_api_key: str) -> None:
+        """Check that OpenAI accepts the API key by listing its models, unless it did in the last
+        `health_ttl_seconds`; Raise `openai.error.AuthenticationError` if it doesn't
+        """
+        key = ("openai", credential_hash(openai_api_key))
+        with self._key_lock(key):
+            if self._checked(key, "openai"):
+                return
+
+            client = openai_io.openai_client()
+            client.run(client.list_models(api_key=openai_api_key))
+            self._checked_at[key] = time.monotonic()
+
+
+@functools.lru_cache
+def connection_manager() -> ConnectionManager:
+    """Connection manager shared by all sessions of the process"""
+    return ConnectionManager()
@@ -0,0 +1,138 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS document (
+    corpus_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    pdf_size INTEGER,
+    n_chunks INTEGER,
+    PRIMARY KEY (corpus_id, id)
+);
+CREATE INDEX IF NOT EXISTS document_file_name ON document (corpus_id, file_name COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS corpus (
+    id TEXT PRIMARY KEY,
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS corpus_version (
+    id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+_BUMP_VERSION = (
+    "INSERT INTO corpus_version VALUES (?, 1) ON CONFLICT (id) DO UPDATE SET version = version + 1"
+)
+
+_UPSERT = (
+    "INSERT INTO document VALUES (?, ?, ?, ?, ?)"
+    " ON CONFLICT (corpus_id, id) DO UPDATE SET file_name = excluded.file_name,"
+    " pdf_size = COALESCE(excluded.pdf_size, pdf_size), n_chunks = COALESCE(excluded.n_chunks, n_chunks)"
+)
+
+
+def _rows(corpus_id: str, documents: Iterable[dict]) -> Iterable[tuple]:
+    for document in documents:
+        yield (
+            corpus_id,
+            document["document_id"],
+            document["file_name"],
+            document.get("pdf_size"),
+            document.get("n_chunks"),
+        )
+
+
+class DocumentCatalog:
+    """Local catalog of the stored documents of each corpus: id, `file_name`, `pdf_size` and `n_chunks`;
+    It is filled once per corpus by walking the vector store with `sync`, then kept up to date by
+    ingestion with `add`, so that listing or searching documents by name doesn't query the vector store.
+    Sizes or chunk counts the vector store doesn't know are kept from ingestion, or missing.
+    The version of a corpus is bumped by each `add` and `sync`.
+    Safe to share between threads and processes
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._connection = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def __getstate__(self) -> dict:
+        """Pickle the location only, so the catalog can be sent to process-based executors"""
+        return dict(path=self.path)
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    def is_synced(self, corpus_id: str) -> bool:
+        """Whether the documents of the corpus were listed into the catalog at least once"""
+        with self._lock:
+            row = self._connection.execute("SELECT 1 FROM corpus WHERE id = ?", (corpus_id,)).fetchone()
+        return row is not None
+
+    def sync(self, corpus_id: str, documents: Iterable[dict]) -> int:
+        """Replace the documents of the corpus by those listed from the vector store, dicts with
+        `document_id`, `file_name` and optionally `pdf_size` and `n_chunks`; return their number
+        """
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TEMP TABLE IF NOT EXISTS listed (id TEXT PRIMARY KEY)")
+            self._connection.execute("DELETE FROM listed")
+            n_documents = 0
+            for row in _rows(corpus_id, documents):
+                self._connection.execute(_UPSERT, row)
+                self._connection.execute("INSERT OR IGNORE INTO listed VALUES (?)", (row[1],))
+                n_documents += 1
+            self._connection.execute(
+                "DELETE FROM document WHERE corpus_id = ? AND id NOT IN (SELECT id FROM listed)", (corpus_id,)
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO corpus VALUES (?, ?)", (corpus_id, time.time())
+            )
+            self._connection.execute(_BUMP_VERSION, (corpus_id,))
+        return n_documents
+
+    def add(self, corpus_id: str, documents: list[dict]) -> None:
+        """Add or update documents just stored in the corpus"""
+        with self._lock, self._connection:
+            self._connection.executemany(_UPSERT, _rows(corpus_id, documents))
+            self._connection.execute(_BUMP_VERSION, (corpus_id,))
+
+    def version(self, corpus_id: str) -> int:
+        """Number of times documents were added to the corpus or listed from the vector store, 0 before"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT version FROM corpus_version WHERE id = ?", (corpus_id,)
+            ).fetchone()
+        return 0 if row is None else row[0]
+
+    def search(self, corpus_id: str, name_query: str = "", limit: int = 50) -> list[dict]:
+        """Documents of the corpus whose `file_name` contains `name_query`, ignoring case, by name"""
+        pattern = "%" + name_query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, file_name, pdf_size, n_chunks FROM document"
+                " WHERE corpus_id = ? AND file_name LIKE ? ESCAPE '\\'"
+                " ORDER BY file_name COLLATE NOCASE, id LIMIT ?",
+                (corpus_id, pattern, limit),
+            ).fetchall()
+        return [
+            dict(document_id=id_, file_name=file_name, pdf_size=pdf_size, n_chunks=n_chunks)
+            for id_, file_name, pdf_size, n_chunks in rows
+        ]
+
+    def count(self, corpus_id: str) -> int:
+        with self._lock:
+            (n_documents,) = self._connection.execute(
+                "SELECT COUNT(*) FROM document WHERE corpus_id = ?", (corpus_id,)
+            ).fetchone()
+        return n_documents
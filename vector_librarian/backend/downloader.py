@@ -0,0 +1,140 @@
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+@dataclass(frozen=True)
+class DownloadRequest:
+    """File to download from `url` into the cache at `path`"""
+
+    url: str
+    path: Path
+
+
+def _metadata_path(path: Path) -> Path:
+    return path.with_name(path.name + ".json")
+
+
+def _file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def cached_path(path: Path, verify_sha256: bool = False) -> Path | None:
+    """Return `path` if it was completely downloaded and still has its recorded size,
+    and optionally its recorded SHA-256
+    """
+    metadata_path = _metadata_path(path)
+    if not (path.exists() and metadata_path.exists()):
+        return None
+    metadata = json.loads(metadata_path.read_text())
+    if path.stat().st_size != metadata["size"]:
+        return None
+    if verify_sha256 and _file_sha256(path) != metadata["sha256"]:
+        return None
+    return path
+
+
+class PdfDownloader:
+    """Download files concurrently over pooled HTTP connections into a local cache;
+    Cached files are returned without any request, partial files are resumed with a
+    `Range` request, and completed files are checked against the size announced by the
+    server before their size and SHA-256 are recorded next to them
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        max_connections_per_host: int = 4,
+        timeout: float = 60.0,
+        chunk_size: int = 1 << 16,
+        verify_cached_sha256: bool = False,
+    ):
+        self.max_workers = max_workers
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.verify_cached_sha256 = verify_cached_sha256
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=max_connections_per_host)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._host_slots: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def download_many(self, requests_: list[DownloadRequest]) -> list[Path]:
+        """Download files concurrently; return their local paths in the order of the requests;
+        Requests for the same path are downloaded once, so they don't write the same partial file
+        """
+        unique_requests = list({request.path: request for request in requests_}.values())
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            paths = dict(zip(
+                (request.path for request in unique_requests), pool.map(self.download, unique_requests)
+            ))
+        return [paths[request.path] for request in requests_]
+
+    def download(self, request: DownloadRequest) -> Path:
+        """Download a single file, or return it directly if it is cached"""
+        if path := cached_path(request.path, verify_sha256=self.verify_cached_sha256):
+            return path
+
+        with self._host_slot(urlparse(request.url).netloc):
+            self._fetch(request)
+        return request.path
+
+    def _host_slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_connections_per_host)
+            return self._host_slots[host]
+
+    def _fetch(self, request: DownloadRequest) -> None:
+        """Stream the file to `<path>.part`, resuming a previous partial download if any"""
+        request.path.parent.mkdir(parents=True, exist_ok=True)
+        part_path = request.path.with_name(request.path.name + ".part")
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        # ask for the raw bytes, so that the file size matches the size announced by the server
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+
+        with self._session.get(request.url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416:
+                # the partial file can't be resumed, e.g. the remote file changed
+                part_path.unlink()
+                return self._fetch(request)
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                expected_size = int(response.headers["Content-Range"].rpartition("/")[2])
+            else:
+                offset = 0
+                content_length = response.headers.get("Content-Length")
+                expected_size = int(content_length) if content_length else None
+
+            with open(part_path, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+
+        size = part_path.stat().st_size
+        if expected_size is not None and size != expected_size:
+            if size > expected_size:
+                part_path.unlink()
+            # a shorter file is kept, so the next attempt resumes it
+            raise IOError(f"Downloaded {size} bytes from {request.url}, expected {expected_size}")
+
+        sha256 = _file_sha256(part_path)
+        part_path.replace(request.path)
+        _metadata_path(request.path).write_text(
+            json.dumps(dict(url=request.url, size=size, sha256=sha256))
+        )
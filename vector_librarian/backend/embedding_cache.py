@@ -0,0 +1,131 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embedding (
+    key BLOB PRIMARY KEY,
+    vector BLOB NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS embedding_last_access ON embedding (last_access);
+CREATE TABLE IF NOT EXISTS cache_size (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total_bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_size VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS embedding_inserted AFTER INSERT ON embedding BEGIN
+    UPDATE cache_size SET total_bytes = total_bytes + length(NEW.vector) WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS embedding_deleted AFTER DELETE ON embedding BEGIN
+    UPDATE cache_size SET total_bytes = total_bytes - length(OLD.vector) WHERE id = 0;
+END;
+"""
+
+
+def _normalize(text: str) -> str:
+    """Unicode NFC with runs of whitespace collapsed, so trivially different texts share an entry"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def _cache_key(model_name: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model_name}\0{_normalize(text)}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """On-disk cache of embedding vectors keyed by (model name, hash of normalized text);
+    Vectors are stored as float32 blobs in SQLite and the least recently used entries are
+    evicted once the cache grows over `max_bytes`. Safe to share between threads and processes
+    """
+
+    def __init__(self, path: str | Path, max_bytes: int = 1 << 30):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def __getstate__(self) -> dict:
+        """Pickle the location only, so the cache can be sent to process-based executors"""
+        return dict(path=self.path, max_bytes=self.max_bytes)
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    def get_many(self, model_name: str, texts: list[str]) -> list[np.ndarray | None]:
+        """Get the cached vector of each text, or None when it isn't cached"""
+        keys = [_cache_key(model_name, text) for text in texts]
+        found = {}
+        with self._lock, self._connection:
+            # stay below SQLite's limit on the number of host parameters
+            for start in range(0, len(keys), 500):
+                batch = list(set(keys[start : start + 500]))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embedding WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                found.update(rows)
+            self._connection.executemany(
+                "UPDATE embedding SET last_access = ? WHERE key = ?",
+                [(time.time(), key) for key in found],
+            )
+
+            vectors = [
+                np.frombuffer(found[key], dtype=np.float32) if key in found else None
+                for key in keys
+            ]
+            n_hits = sum(vector is not None for vector in vectors)
+            self.hits += n_hits
+            self.misses += len(vectors) - n_hits
+        return vectors
+
+    def put_many(self, model_name: str, texts: list[str], vectors: np.ndarray) -> None:
+        """Store the vector of each text, then evict entries if the cache is over its size"""
+        now = time.time()
+        rows = [
+            (_cache_key(model_name, text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors, strict=True)
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO embedding VALUES (?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET last_access = excluded.last_access",
+                rows,
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until the cache fits in `max_bytes`"""
+        (total_bytes,) = self._connection.execute("SELECT total_bytes FROM cache_size").fetchone()
+        if total_bytes <= self.max_bytes:
+            return
+
+        (n_entries,) = self._connection.execute("SELECT COUNT(*) FROM embedding").fetchone()
+        bytes_per_entry = total_bytes / max(n_entries, 1)
+        n_evicted = int((total_bytes - self.max_bytes) / bytes_per_entry) + 1
+        self._connection.execute(
+            "DELETE FROM embedding WHERE key IN"
+            " (SELECT key FROM embedding ORDER BY last_access LIMIT ?)",
+            (n_evicted,),
+        )
+
+    def stats(self) -> dict:
+        """Hit/miss counters of this process and the current size of the cache"""
+        with self._lock:
+            (total_bytes,) = self._connection.execute("SELECT total_bytes FROM cache_size").fetchone()
+            (n_entries,) = self._connection.execute("SELECT COUNT(*) FROM embedding").fetchone()
+        return dict(hits=self.hits, misses=self.misses, entries=n_entries, total_bytes=total_bytes)
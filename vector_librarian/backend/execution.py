@@ -0,0 +1,184 @@
+import contextvars
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+import cloudpickle
+from hamilton.execution import executors
+from hamilton.execution.grouping import NodeGroupPurpose, TaskImplementation
+
+EXECUTION_STRATEGIES = ("thread", "process", "synchronous")
+
+_current_task: contextvars.ContextVar[TaskImplementation | None] = contextvars.ContextVar(
+    "current_task", default=None
+)
+
+
+def current_task() -> TaskImplementation | None:
+    """Hamilton task whose nodes are executing in this context, if any"""
+    return _current_task.get()
+
+
+def _execute_task(task: TaskImplementation) -> dict:
+    token = _current_task.set(task)
+    try:
+        return executors.base_execute_task(task)
+    finally:
+        _current_task.reset(token)
+
+
+def _openai_config() -> dict:
+    """OpenAI settings of this process, which `authentication.connect_to_openai` sets at runtime"""
+    import openai
+
+    return dict(api_key=openai.api_key, api_base=openai.api_base, organization=openai.organization)
+
+
+def _execute_pickled_task(pickled_task: bytes, openai_config: dict) -> dict:
+    import openai
+
+    # spawned workers don't inherit the settings of the parent, and the key may change between runs
+    for name, value in openai_config.items():
+        setattr(openai, name, value)
+    return _execute_task(cloudpickle.loads(pickled_task))
+
+
+@functools.lru_cache
+def _process_pool(max_workers: int, initializer: Callable | None, initargs: tuple) -> ProcessPoolExecutor:
+    """Process pool shared by all runs of this process, so workers import the
+    modules and load the tokenizer once instead of once per `execute`
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+        initargs=initargs,
+    )
+
+
+class SynchronousExecutor(executors.SynchronousLocalTaskExecutor):
+    """Run tasks one by one in the calling thread"""
+
+    def submit_task(self, task: TaskImplementation) -> executors.TaskFuture:
+        result = _execute_task(task)
+        return executors.TaskFuture(
+            get_state=lambda: executors.TaskState.SUCCESSFUL, get_result=lambda: result
+        )
+
+
+class ThreadExecutor(executors.MultiThreadingExecutor):
+    """Run tasks on a thread pool, in a copy of the context of the thread submitting them,
+    so that context variables of the run (e.g. its trace) are visible to the nodes
+    """
+
+    def submit_task(self, task: TaskImplementation) -> executors.TaskFuture:
+        future = self.pool.submit(contextvars.copy_context().run, _execute_task, task)
+        self.active_futures.append(future)
+        return executors.TaskFutureWrappingPythonFuture(future)
+
+
+class SpawnProcessExecutor(executors.MultiProcessingExecutor):
+    """Run tasks in a pool of spawned processes;
+    Workers are spawned rather than forked because tasks are submitted while other
+    threads (embedding batcher, extraction pool) are running. Tasks are serialized with
+    cloudpickle, since they reference closures of Hamilton decorators that pickle can't
+    handle. The OpenAI settings of the parent at submission are sent with each task, and
+    `initializer` runs once in each worker
+    """
+
+    def __init__(self, max_tasks: int, initializer: Callable | None = None, initargs: tuple = ()):
+        super().__init__(max_tasks=max_tasks)
+        self.initializer = initializer
+        self.initargs = initargs
+
+    def create_pool(self) -> ProcessPoolExecutor:
+        return _process_pool(self.max_tasks, self.initializer, self.initargs)
+
+    def finalize(self) -> None:
+        """Keep the shared pool running for the next runs"""
+        self.initialized = False
+
+    def submit_task(self, task: TaskImplementation) -> executors.TaskFuture:
+        future = self.pool.submit(_execute_pickled_task, cloudpickle.dumps(task), _openai_config())
+        self.active_futures.append(future)
+        return executors.TaskFutureWrappingPythonFuture(future)
+
+
+def task_executor(strategy: str, max_workers: int = 4) -> executors.TaskExecutor:
+    """Create the executor of an execution strategy;
+    "thread" for I/O-bound branches (OpenAI, arXiv, Weaviate calls),
+    "process" for CPU-bound branches (PDF parsing, chunking),
+    "synchronous" to run branches one by one in the calling thread, e.g. for debugging
+    """
+    if strategy == "thread":
+        return ThreadExecutor(max_tasks=max_workers)
+    if strategy == "process":
+        return SpawnProcessExecutor(max_tasks=max_workers)
+    if strategy == "synchronous":
+        return SynchronousExecutor()
+    raise ValueError(f"Unknown execution strategy {strategy!r}, expected one of {EXECUTION_STRATEGIES}")
+
+
+class NodeGroupExecutionManager(executors.ExecutionManager):
+    """Run the branches of each `Parallelizable` node on the executor of its node group;
+    A node group is named after its `Parallelizable` node, e.g. "pdf_file".
+    Branches of groups absent from `node_group_executors` run on `default_executor`, and
+    nodes outside of branches run synchronously in the calling thread.
+    A driver can run concurrently, e.g. from several Streamlit sessions: executors are started
+    by the first active run and finalized by the last one, and their worker limits are shared
+    """
+
+    def __init__(
+        self,
+        default_executor: executors.TaskExecutor,
+        node_group_executors: dict[str, executors.TaskExecutor] | None = None,
+    ):
+        self.local_executor = SynchronousExecutor()
+        self.default_executor = default_executor
+        self.node_group_executors = node_group_executors or {}
+        unique_executors = {
+            id(executor): executor
+            for executor in [self.local_executor, default_executor, *self.node_group_executors.values()]
+        }
+        super().__init__(list(unique_executors.values()))
+        self._active_runs = 0
+        self._lock = threading.Lock()
+
+    def init(self) -> None:
+        with self._lock:
+            if self._active_runs == 0:
+                super().init()
+            self._active_runs += 1
+
+    def finalize(self) -> None:
+        with self._lock:
+            self._active_runs -= 1
+            if self._active_runs == 0:
+                super().finalize()
+
+    def get_executor_for_task(self, task: TaskImplementation) -> executors.TaskExecutor:
+        if task.purpose != NodeGroupPurpose.EXECUTE_BLOCK:
+            return self.local_executor
+        # branches of a `Parallelizable` node `x` are grouped in tasks with base id "block-x"
+        node_group = task.base_id.removeprefix("block-")
+        return self.node_group_executors.get(node_group, self.default_executor)
+
+
+def execution_manager(
+    strategy: str = "thread",
+    max_workers: int = 4,
+    node_groups: dict[str, tuple[str, int]] | None = None,
+) -> NodeGroupExecutionManager:
+    """Create an execution manager running branches with `strategy` on `max_workers` workers;
+    `node_groups` routes the branches of specific `Parallelizable` nodes to their own
+    (strategy, max_workers), e.g. `{"pdf_file": ("process", 8)}`
+    """
+    return NodeGroupExecutionManager(
+        default_executor=task_executor(strategy, max_workers),
+        node_group_executors={
+            node_group: task_executor(group_strategy, group_max_workers)
+            for node_group, (group_strategy, group_max_workers) in (node_groups or {}).items()
+        },
+    )
@@ -1,22 +1,113 @@
-import base64
+import bisect
+import copyreg
+import functools
+import hashlib
 import io
+import logging
+import threading
 from pathlib import Path
-from typing import Generator
-import openai
-import pypdf
+from typing import Callable, Generator, Iterable, Iterator
+import numpy as np
+import regex
 from streamlit.runtime.uploaded_file_manager import UploadedFile
 import tiktoken
 import weaviate
 from weaviate.util import generate_uuid5
 
+from hamilton.function_modifiers import config, extract_fields
 from hamilton.htypes import Collect, Parallelizable
 
+from backend.batching import EmbeddingBatcher
+from backend import instrumentation, openai_io
+from backend.blob_store import BlobStore
+from backend.document_catalog import DocumentCatalog
+from backend.embedding_cache import EmbeddingCache
+from backend.local_store import LocalStore
+from backend.pdf_extraction import PdfExtractionError, PdfPageStream
 
-def pdf_file(
+logger = logging.getLogger(__name__)
+
+
+def _read_pdf_bytes(pdf_file: str | UploadedFile) -> bytes:
+    """Read the bytes of a PDF file passed either as path or in-memory"""
+    if isinstance(pdf_file, str):
+        return Path(pdf_file).read_bytes()
+    elif isinstance(pdf_file, UploadedFile):
+        return pdf_file.getvalue()
+    else:
+        raise TypeError
+
+
+def _stored_pdf_sha256(weaviate_client: weaviate.Client, hashes: list[str]) -> set[str]:
+    """Return the hashes among `hashes` that belong to a `Document` stored in Weaviate"""
+    stored = set()
+    for start in range(0, len(hashes), 100):
+        operands = [
+            {"path": ["pdf_sha256"], "operator": "Equal", "valueText": sha256}
+            for sha256 in hashes[start : start + 100]
+        ]
+        where = operands[0] if len(operands) == 1 else {"operator": "Or", "operands": operands}
+        with instrumentation.weaviate_request("stored_pdf_sha256"):
+            response = (
+                weaviate_client.query
+                .get("Document", ["pdf_sha256"])
+                .with_where(where)
+                .with_limit(len(operands))
+                .do()
+            )
+        stored.update(document["pdf_sha256"] for document in response["data"]["Get"]["Document"])
+    return stored
+
+
+def _pdf_files_not_stored(
+    local_pdfs: list[str | UploadedFile], stored_pdf_sha256: Callable[[list[str]], set[str]]
+) -> list[str | UploadedFile]:
+    """Hash the bytes of each PDF file and drop those already stored, or passed twice"""
+    hashes = [hashlib.sha256(_read_pdf_bytes(pdf_file)).hexdigest() for pdf_file in local_pdfs]
+    seen = stored_pdf_sha256(list(set(hashes))) if hashes else set()
+    to_ingest = []
+    for pdf_file, sha256 in zip(local_pdfs, hashes):
+        if sha256 not in seen:
+            seen.add(sha256)
+            to_ingest.append(pdf_file)
+    return to_ingest
+
+
+@config.when_not(vector_store="local")
+def pdf_files_to_ingest__weaviate(
+    local_pdfs: list[str | UploadedFile],
+    weaviate_client: weaviate.Client,
+    skip_stored_documents: bool = True,
+) -> list[str | UploadedFile]:
+    """Hash the bytes of each PDF file and drop those already stored in Weaviate,
+    or passed twice, before they are parsed, chunked and embedded
+    """
+    if not skip_stored_documents:
+        return local_pdfs
+    return _pdf_files_not_stored(
+        local_pdfs, lambda hashes: _stored_pdf_sha256(weaviate_client, hashes)
+    )
+
+
+@config.when(vector_store="local")
+def pdf_files_to_ingest__local(
     local_pdfs: list[str | UploadedFile],
+    local_store: LocalStore,
+    skip_stored_documents: bool = True,
+) -> list[str | UploadedFile]:
+    """Hash the bytes of each PDF file and drop those already in the local store,
+    or passed twice, before they are parsed, chunked and embedded
+    """
+    if not skip_stored_documents:
+        return local_pdfs
+    return _pdf_files_not_stored(local_pdfs, local_store.stored_pdf_sha256)
+
+
+def pdf_file(
+    pdf_files_to_ingest: list[str | UploadedFile],
 ) -> Parallelizable[str | UploadedFile]:
     """Iterate over local PDF files, either string paths or in-memory files (on the Streamlit server)"""
-    for pdf_file in local_pdfs:
+    for pdf_file in pdf_files_to_ingest:
         yield pdf_file
 
 
@@ -24,12 +115,28 @@ def pdf_content(pdf_file: str | UploadedFile) -> io.BytesIO:
     """Read the content of the PDF file as a bytes buffer that will be passed to a PDF reader;
     The implementation differs if the file is passed as path or in-memory
     """
-    if isinstance(pdf_file, str):
-        return io.BytesIO(Path(pdf_file).read_bytes())
-    elif isinstance(pdf_file, UploadedFile):
-        return io.BytesIO(pdf_file.read())
-    else:
-        raise TypeError
+    return io.BytesIO(_read_pdf_bytes(pdf_file))
+
+
+def pdf_sha256(pdf_content: io.BytesIO) -> str:
+    """Content address of the PDF file, used as key in the blob store"""
+    with pdf_content.getbuffer() as buffer:
+        return hashlib.sha256(buffer).hexdigest()
+
+
+def blob_store(blob_store_dir: str = "./data/blobs") -> BlobStore:
+    """Local store of the PDF files, referenced by `Document` objects through their SHA-256"""
+    return BlobStore(blob_store_dir)
+
+
+def local_store(local_store_dir: str = "./data/local_store") -> LocalStore:
+    """In-process vector and BM25 store used instead of Weaviate with `vector_store="local"`"""
+    return _open_local_store(local_store_dir)
+
+
+@functools.lru_cache
+def _open_local_store(path: str) -> LocalStore:
+    return LocalStore(path)
 
 
 def file_name(pdf_file: str | UploadedFile) -> str:
@@ -46,13 +153,26 @@ def file_name(pdf_file: str | UploadedFile) -> str:
     return file_path.stem
 
 
-def raw_text(pdf_content: io.BytesIO) -> str:
+def pdf_pages(
+    pdf_content: io.BytesIO,
+    pdf_extraction_workers: int = 4,
+    pdf_page_timeout: float = 30.0,
+) -> PdfPageStream:
+    """Stream the text of the PDF page by page; page ranges of large PDFs are extracted
+    in parallel by a process pool, and pages that fail or time out are marked as skipped
+    """
+    return PdfPageStream(
+        pdf_content.getvalue(),
+        max_workers=pdf_extraction_workers,
+        page_timeout=pdf_page_timeout,
+    )
+
+
+def raw_text(pdf_pages: PdfPageStream) -> str:
     """Read local PDF files and return the raw text as string;
     Throw exception if unable to read PDF
     """
-    reader = pypdf.PdfReader(pdf_content)
-    pdf_text = " ".join((page.extract_text() for page in reader.pages))
-    return pdf_text
+    return pdf_pages.text
 
 
 def tokenizer(tokenizer_encoding: str = "cl100k_base") -> tiktoken.core.Encoding:
@@ -60,120 +180,489 @@ def tokenizer(tokenizer_encoding: str = "cl100k_base") -> tiktoken.core.Encoding
     return tiktoken.get_encoding(tokenizer_encoding)
 
 
+# encodings hold a native BPE object; pickle them by name so that branches
+# depending on the tokenizer can run in process-based executors
+copyreg.pickle(tiktoken.core.Encoding, lambda encoding: (tiktoken.get_encoding, (encoding.name,)))
+
+
+def _encode_segments(
+    segments: Iterable[str], tokenizer: tiktoken.core.Encoding
+) -> Generator[list[int], None, None]:
+    """Encode a text arriving in segments, e.g. page by page;
+    The last pre-token of each segment is carried over to the next one, so the tokens
+    are the same as when encoding the concatenated text at once
+    """
+    pat_str = getattr(tokenizer, "_pat_str", None)
+    if pat_str is None:
+        # the pre-tokenizer pattern is private to tiktoken; without it, encode the text at once
+        yield from _encode_joined_segments(list(segments), tokenizer)
+        return
+
+    pre_token_pattern = regex.compile(pat_str)
+    carry = ""
+    for segment in segments:
+        text = carry + segment
+        cut = 0
+        for match in pre_token_pattern.finditer(text):
+            cut = match.start()
+        yield tokenizer.encode(text[:cut])
+        carry = text[cut:]
+    yield tokenizer.encode(carry)
+
+
+def _encode_joined_segments(segments: list[str], tokenizer: tiktoken.core.Encoding) -> Iterator[list[int]]:
+    """Encode the concatenated segments, then yield the tokens starting in each segment,
+    followed by an empty list, like `_encode_segments`
+    """
+    tokens = tokenizer.encode("".join(segments))
+    _, token_starts = tokenizer.decode_with_offsets(tokens)
+    start = segment_end = 0
+    for segment in segments:
+        segment_end += len(segment)
+        end = bisect.bisect_left(token_starts, segment_end, lo=start)
+        yield tokens[start:end]
+        start = end
+    yield tokens[start:]
+
+
 def _create_chunks(
-    text: str, tokenizer: tiktoken.core.Encoding, max_length: int
-) -> Generator[str, None, None]:
+    text: str, tokenizer: tiktoken.core.Encoding, max_length: int, overlap: int = 0
+) -> Generator[list[int], None, None]:
     """Return successive chunks of size `max_length` tokens from provided text.
     Split a text into smaller chunks of size n, preferably ending at the end of a sentence
     """
-    tokens = tokenizer.encode(text)
+    yield from _create_chunks_from_segments([text], tokenizer, max_length, overlap)
+
+
+def _create_chunks_from_segments(
+    segments: Iterable[str], tokenizer: tiktoken.core.Encoding, max_length: int, overlap: int = 0
+) -> Generator[list[int], None, None]:
+    """Return successive chunks of size `max_length` tokens from a text arriving in segments;
+    Sentence and newline boundaries are found once from the token bytes, so all chunks
+    are cut in a single linear pass. A chunk is emitted as soon as the tokens it depends on
+    are available. Consecutive chunks share `overlap` tokens
+    """
+    for chunk, _, _ in _chunk_spans_from_segments(segments, tokenizer, max_length, overlap):
+        yield chunk
+
+
+def _chunk_spans_from_segments(
+    segments: Iterable[str], tokenizer: tiktoken.core.Encoding, max_length: int, overlap: int = 0
+) -> Generator[tuple[list[int], int, int], None, None]:
+    """Same as `_create_chunks_from_segments`, with the indexes of the segments holding the first
+    and last token of each chunk; the last pre-token of a segment may be counted in the next one
+    """
+    # `tokens` holds the tokens from absolute index `base`; last_boundary[k - base] is the largest
+    # index <= k where the text up to that token ends with a full stop or newline
+    tokens, last_boundary, base = [], [0], 0
+    # absolute index of the first token of each segment; the tokens carried over after the last
+    # segment, encoded once all segments are read, belong to the last segment
+    segment_starts = []
+    n_segments_read = 0
+
+    def read_segments() -> Iterator[str]:
+        nonlocal n_segments_read
+        for segment in segments:
+            n_segments_read += 1
+            yield segment
+
     i = 0
-    while i < len(tokens):
-        # Find the nearest end of sentence within a range of 0.5 * n and 1.5 * n tokens
-        j = min(i + int(1.5 * max_length), len(tokens))
-        while j > i + int(0.5 * max_length):
-            # Decode the tokens and check for full stop or newline
-            chunk = tokenizer.decode(tokens[i:j])
-            if chunk.endswith(".") or chunk.endswith("\n"):
-                break
-            j -= 1
-        # If no end of sentence found, use n tokens as the chunk size
-        if j == i + int(0.5 * max_length):
-            j = min(i + max_length, len(tokens))
-        yield tokens[i:j]
-        i = j
-
-
-def chunked_text(
-    raw_text: str, tokenizer: tiktoken.core.Encoding, max_token_length: int = 500
-) -> list[str]:
-    """Tokenize text; create chunks of size `max_token_length`;
-    for each chunk, convert tokens back to text string
+    encoded_segments = _encode_segments(read_segments(), tokenizer)
+    while True:
+        new_tokens = next(encoded_segments, None)
+        finished = new_tokens is None
+        if not finished:
+            if len(segment_starts) < n_segments_read:
+                segment_starts.append(base + len(tokens))
+            for token_bytes in tokenizer.decode_tokens_bytes(new_tokens):
+                k = base + len(last_boundary)
+                last_boundary.append(k if token_bytes.endswith((b".", b"\n")) else last_boundary[-1])
+            tokens.extend(new_tokens)
+
+        n_tokens = base + len(tokens)
+        while i < n_tokens and (finished or i + int(1.5 * max_length) <= n_tokens):
+            # Find the nearest end of sentence within a range of 0.5 * n and 1.5 * n tokens
+            lower = i + int(0.5 * max_length)
+            j = min(i + int(1.5 * max_length), n_tokens)
+            if j > lower:
+                j = last_boundary[j - base] if last_boundary[j - base] > lower else lower
+            # If no end of sentence found, use n tokens as the chunk size
+            if j == lower:
+                j = min(i + max_length, n_tokens)
+            first_segment = max(bisect.bisect_right(segment_starts, i) - 1, 0)
+            last_segment = max(bisect.bisect_right(segment_starts, j - 1) - 1, 0)
+            yield tokens[i - base : j - base], first_segment, last_segment
+            i = j if finished and j == n_tokens else max(j - overlap, i + 1)
+
+        if finished:
+            return
+        # drop consumed tokens once they make up half of the buffer
+        if i - base > len(tokens) // 2:
+            del tokens[: i - base]
+            del last_boundary[: i - base]
+            base = i
+
+
+@extract_fields(
+    dict(
+        chunked_text=list[str],
+        chunk_pages=list[tuple[int, int]],
+    )
+)
+def text_chunks(
+    pdf_pages: PdfPageStream,
+    file_name: str,
+    tokenizer: tiktoken.core.Encoding,
+    max_token_length: int = 500,
+    chunk_overlap_tokens: int = 0,
+) -> dict:
+    """Tokenize text as pages are extracted; create chunks of size `max_token_length`;
+    for each chunk, convert tokens back to text string and record its first and last page (from 0).
+    Raise PdfExtractionError if pages failed to extract or timed out, rather than storing the document incomplete
+    """
+    # pages are joined by a space, as in `raw_text`
+    segments = (page.text if page.page_number == 0 else " " + page.text for page in pdf_pages)
+    chunked_text, chunk_pages = [], []
+    for chunk, first_page, last_page in _chunk_spans_from_segments(
+        segments, tokenizer, max_token_length, chunk_overlap_tokens
+    ):
+        chunked_text.append(tokenizer.decode(chunk))
+        chunk_pages.append((first_page, last_page))
+    if skipped_pages := pdf_pages.skipped_pages:
+        raise PdfExtractionError(f"Pages {skipped_pages} of {file_name} failed to extract or timed out.")
+    return dict(chunked_text=chunked_text, chunk_pages=chunk_pages)
+
+
+def _get_embeddings__openai(texts: list[str], embedding_model_name: str) -> np.ndarray:
+    """Get the OpenAI embeddings for each text in texts, as a 2-D float32 array;
+    The request is retried on transient failures by the shared client
     """
-    _encoded_chunks = _create_chunks(raw_text, tokenizer, max_token_length)
-    _decoded_chunks = [tokenizer.decode(chunk) for chunk in _encoded_chunks]
-    return _decoded_chunks
+    client = openai_io.openai_client()
+    return client.run(client.embeddings(texts, embedding_model_name))
+
 
+def embedding_cache(
+    embedding_cache_path: str = "./data/embedding_cache.sqlite",
+    embedding_cache_max_bytes: int = 1 << 30,
+) -> EmbeddingCache:
+    """On-disk embedding cache shared by ingestion and queries"""
+    return _open_embedding_cache(embedding_cache_path, embedding_cache_max_bytes)
 
-def _get_embeddings__openai(texts: list[str], embedding_model_name: str) -> list[list[float]]:
-    """Get the OpenAI embeddings for each text in texts"""
-    response = openai.Embedding.create(input=texts, model=embedding_model_name)
-    return [item["embedding"] for item in response["data"]]
 
+@functools.lru_cache
+def _open_embedding_cache(path: str, max_bytes: int) -> EmbeddingCache:
+    return EmbeddingCache(path=path, max_bytes=max_bytes)
 
-def chunked_embeddings(chunked_text: list[str], embedding_model_name: str) -> list[list[float]]:
-    """Convert each chunk of the arxiv article as an embedding vector"""
-    return _get_embeddings__openai(texts=chunked_text, embedding_model_name=embedding_model_name)
+
+def document_catalog(document_catalog_path: str = "./data/document_catalog.sqlite") -> DocumentCatalog:
+    """Local catalog of the stored documents, searched by name instead of the vector store"""
+    return _open_document_catalog(document_catalog_path)
+
+
+@functools.lru_cache
+def _open_document_catalog(path: str) -> DocumentCatalog:
+    return DocumentCatalog(path)
+
+
+def _cached_embeddings(
+    texts: list[str],
+    embedding_model_name: str,
+    embedding_cache: EmbeddingCache,
+    embed_fn: Callable[[list[str]], np.ndarray],
+) -> np.ndarray:
+    """Get embeddings from the cache and only call `embed_fn` for the texts that are missing;
+    Return a contiguous 2-D float32 array with one row per text
+    """
+    embeddings = embedding_cache.get_many(embedding_model_name, texts)
+    missing_idx = [idx for idx, embedding in enumerate(embeddings) if embedding is None]
+    if missing_idx:
+        missing_texts = [texts[idx] for idx in missing_idx]
+        new_embeddings = embed_fn(missing_texts)
+        embedding_cache.put_many(embedding_model_name, missing_texts, new_embeddings)
+        for idx, embedding in zip(missing_idx, new_embeddings):
+            embeddings[idx] = embedding
+    return np.stack(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)
+
+
+@functools.lru_cache
+def _embedding_batcher(max_batch_tokens: int, max_concurrent_requests: int) -> EmbeddingBatcher:
+    """Process-wide batcher, so that chunks of all in-flight documents share requests"""
+    return EmbeddingBatcher(
+        embed_fn=_get_embeddings__openai,
+        max_batch_tokens=max_batch_tokens,
+        max_concurrent_requests=max_concurrent_requests,
+    )
+
+
+def chunked_embeddings(
+    chunked_text: list[str],
+    tokenizer: tiktoken.core.Encoding,
+    embedding_model_name: str,
+    embedding_cache: EmbeddingCache,
+    embedding_batch_max_tokens: int = 100_000,
+    embedding_max_concurrent_requests: int = 4,
+) -> np.ndarray:
+    """Convert each chunk of the arxiv article as an embedding vector;
+    Chunks missing from the embedding cache are sent in token-budgeted requests
+    shared with the other documents being ingested
+    """
+    batcher = _embedding_batcher(embedding_batch_max_tokens, embedding_max_concurrent_requests)
+    return _cached_embeddings(
+        texts=chunked_text,
+        embedding_model_name=embedding_model_name,
+        embedding_cache=embedding_cache,
+        embed_fn=lambda texts: batcher.embed(
+            texts=texts,
+            model_name=embedding_model_name,
+            token_counts=[len(tokens) for tokens in tokenizer.encode_batch(texts)],
+        ),
+    )
 
 
 def pdf_embedded(
     pdf_content: io.BytesIO,
+    pdf_sha256: str,
+    blob_store: BlobStore,
     file_name: str,
     chunked_text: list[str],
-    chunked_embeddings: list[list[float]],
+    chunk_pages: list[tuple[int, int]],
+    chunked_embeddings: np.ndarray,
 ) -> dict:
-    """Gather information about each arxiv into a single object"""
+    """Gather information about each arxiv into a single object;
+    The PDF file is written to the blob store and only referenced by its hash and size
+    """
+    with pdf_content.getbuffer() as buffer:
+        blob_store.put(buffer, sha256=pdf_sha256)
+        pdf_size = buffer.nbytes
+
     return dict(
-        pdf_blob=base64.b64encode(pdf_content.getvalue()).decode("utf-8"),
+        pdf_sha256=pdf_sha256,
+        pdf_size=pdf_size,
         file_name=file_name,
         chunked_text=chunked_text,
+        chunk_pages=chunk_pages,
         chunked_embeddings=chunked_embeddings,
     )
 
 
+@config.when_not(ingestion_mode="streaming")
 def pdf_collection(pdf_embedded: Collect[dict]) -> list[dict]:
     """Collect arxiv objects"""
     return list(pdf_embedded)
 
 
-def store_documents(
+def _document_uuid(pdf_obj: dict) -> str:
+    return generate_uuid5(
+        dict(pdf_sha256=pdf_obj["pdf_sha256"], file_name=pdf_obj["file_name"]), "Document"
+    )
+
+
+def _stored_entry(pdf_obj: dict) -> dict:
+    """Entry of a stored document in the document catalog"""
+    return dict(
+        document_id=_document_uuid(pdf_obj),
+        file_name=pdf_obj["file_name"],
+        pdf_size=pdf_obj["pdf_size"],
+        n_chunks=len(pdf_obj["chunked_text"]),
+    )
+
+
+def _has_content(pdf_obj: dict) -> bool:
+    """Whether a document has chunks to store; a document without any is not stored, otherwise
+    its hash would skip it as already stored when uploaded again, e.g. once its text can be extracted
+    """
+    if pdf_obj["chunked_text"]:
+        return True
+    logger.warning("No text was extracted from %s, it is not stored", pdf_obj["file_name"])
+    return False
+
+
+def _document_centroid(chunked_embeddings: np.ndarray) -> list[float] | None:
+    """Mean of the chunk embeddings, as computed by Weaviate's `ref2vec-centroid` with `method: mean`"""
+    if len(chunked_embeddings) == 0:
+        return None
+    return np.mean(chunked_embeddings, axis=0, dtype=np.float64).astype(np.float32).tolist()
+
+
+def _add_document_to_batch(
+    batch: weaviate.batch.Batch, pdf_obj: dict, document_schema: str = "references"
+) -> str:
+    """Add a `Document` and its `Chunk` objects to a batch; Return the document UUID;
+    With the `references` schema, the references between them are added and Weaviate computes the
+    Document vector; with `centroid`, chunks carry the document id and file name as properties
+    and the Document vector is the centroid of the chunk embeddings, written once
+    """
+    document_object = dict(
+        pdf_sha256=pdf_obj["pdf_sha256"],
+        pdf_size=pdf_obj["pdf_size"],
+        file_name=pdf_obj["file_name"],
+    )
+    document_uuid = _document_uuid(pdf_obj)
+    with_references = document_schema == "references"
+
+    batch.add_data_object(
+        class_name="Document",
+        data_object=document_object,
+        uuid=document_uuid,
+        vector=None if with_references else _document_centroid(pdf_obj["chunked_embeddings"]),
+    )
+
+    chunk_iterator = zip(pdf_obj["chunked_text"], pdf_obj["chunk_pages"], pdf_obj["chunked_embeddings"])
+    for chunk_idx, (chunk_text, (page_start, page_end), chunk_embedding) in enumerate(chunk_iterator):
+        chunk_object = dict(content=chunk_text, chunk_index=chunk_idx)
+        chunk_uuid = generate_uuid5(chunk_object, "Chunk")
+        chunk_properties = dict(chunk_object, page_start=page_start, page_end=page_end)
+        if not with_references:
+            chunk_properties.update(document_id=document_uuid, file_name=pdf_obj["file_name"])
+
+        batch.add_data_object(
+            class_name="Chunk",
+            data_object=chunk_properties,
+            uuid=chunk_uuid,
+            vector=chunk_embedding.tolist(),
+        )
+        if not with_references:
+            continue
+
+        batch.add_reference(
+            from_object_class_name="Document",
+            from_property_name="containsChunk",
+            from_object_uuid=document_uuid,
+            to_object_class_name="Chunk",
+            to_object_uuid=chunk_uuid,
+        )
+
+        batch.add_reference(
+            from_object_class_name="Chunk",
+            from_property_name="fromDocument",
+            from_object_uuid=chunk_uuid,
+            to_object_class_name="Document",
+            to_object_uuid=document_uuid,
+        )
+
+    return document_uuid
+
+
+def _add_document_to_local_store(local_store: LocalStore, pdf_obj: dict) -> str:
+    """Store a document and its chunks, with the same UUIDs as in Weaviate;
+    Return the document UUID
+    """
+    chunks = []
+    chunk_iterator = zip(pdf_obj["chunked_text"], pdf_obj["chunk_pages"])
+    for chunk_idx, (chunk_text, (page_start, page_end)) in enumerate(chunk_iterator):
+        chunk_object = dict(content=chunk_text, chunk_index=chunk_idx)
+        chunks.append(
+            dict(id=generate_uuid5(chunk_object, "Chunk"), page_start=page_start, page_end=page_end, **chunk_object)
+        )
+
+    document_uuid = _document_uuid(pdf_obj)
+    local_store.add_document(
+        document_id=document_uuid,
+        document=pdf_obj,
+        chunks=chunks,
+        vectors=pdf_obj["chunked_embeddings"],
+    )
+    return document_uuid
+
+
+@config.when_not(ingestion_mode="streaming", vector_store="local")
+def store_documents__batch(
     weaviate_client: weaviate.Client,
     pdf_collection: list[dict],
     batch_size: int = 50,
-) -> None:
+    document_schema: str = "references",
+) -> list[dict]:
     """Store arxiv objects in Weaviate in batches.
-    The vector and references between Document and Chunk are specified manually
+    The vector and references between Document and Chunk are specified manually.
+    Return the catalog entries of the stored documents
     """
+    pdf_collection = [pdf_obj for pdf_obj in pdf_collection if _has_content(pdf_obj)]
     weaviate_client.batch.configure(batch_size=batch_size, dynamic=True)
 
-    with weaviate_client.batch as batch:
+    with instrumentation.weaviate_request("batch"), weaviate_client.batch as batch:
         for pdf_obj in pdf_collection:
-            document_object = dict(
-                pdf_blob=pdf_obj["pdf_blob"],
-                file_name=pdf_obj["file_name"],
-            )
-            document_uuid = generate_uuid5(document_object, "Document")
+            _add_document_to_batch(batch, pdf_obj, document_schema)
+    return [_stored_entry(pdf_obj) for pdf_obj in pdf_collection]
 
-            batch.add_data_object(
-                class_name="Document",
-                data_object=document_object,
-                uuid=document_uuid,
-            )
 
-            chunk_iterator = zip(pdf_obj["chunked_text"], pdf_obj["chunked_embeddings"])
-            for chunk_idx, (chunk_text, chunk_embedding) in enumerate(chunk_iterator):
-                chunk_object = dict(content=chunk_text, chunk_index=chunk_idx)
-                chunk_uuid = generate_uuid5(chunk_object, "Chunk")
-
-                batch.add_data_object(
-                    class_name="Chunk",
-                    data_object=chunk_object,
-                    uuid=chunk_uuid,
-                    vector=chunk_embedding,
-                )
-
-                batch.add_reference(
-                    from_object_class_name="Document",
-                    from_property_name="containsChunk",
-                    from_object_uuid=document_uuid,
-                    to_object_class_name="Chunk",
-                    to_object_uuid=chunk_uuid,
-                )
-
-                batch.add_reference(
-                    from_object_class_name="Chunk",
-                    from_property_name="fromDocument",
-                    from_object_uuid=chunk_uuid,
-                    to_object_class_name="Document",
-                    to_object_uuid=document_uuid,
-                )
+@config.when(ingestion_mode="batch", vector_store="local")
+def store_documents__batch_local(local_store: LocalStore, pdf_collection: list[dict]) -> list[dict]:
+    """Store arxiv objects in the local store; return the catalog entries of the stored documents"""
+    pdf_collection = [pdf_obj for pdf_obj in pdf_collection if _has_content(pdf_obj)]
+    for pdf_obj in pdf_collection:
+        _add_document_to_local_store(local_store, pdf_obj)
+    return [_stored_entry(pdf_obj) for pdf_obj in pdf_collection]
+
+
+# the batch of a `weaviate.Client` is shared by all the branches writing concurrently
+_weaviate_batch_lock = threading.Lock()
+
+
+def _release_document(pdf_embedded: dict, pdf_content: io.BytesIO, pdf_pages: PdfPageStream) -> dict:
+    """Free the buffers of a stored document and return its catalog entry;
+    Hamilton keeps the results of every branch until the end of the execution
+    """
+    stored = _stored_entry(pdf_embedded)
+    pdf_content.close()
+    pdf_pages.release()
+    pdf_embedded["chunked_text"].clear()
+    pdf_embedded["chunk_pages"].clear()
+    # the embeddings may be referenced elsewhere, e.g. by the embedding cache: drop this reference only
+    pdf_embedded.clear()
+    return stored
+
+
+@config.when(ingestion_mode="streaming", vector_store="weaviate")
+def stored_document__weaviate(
+    weaviate_client: weaviate.Client,
+    pdf_embedded: dict,
+    pdf_content: io.BytesIO,
+    pdf_pages: PdfPageStream,
+    batch_size: int = 50,
+    document_schema: str = "references",
+) -> dict:
+    """Store an arxiv object in Weaviate as soon as its branch is done;
+    Hamilton keeps the results of every branch until the end of the execution,
+    so the buffers of the document are released once it is written
+    """
+    if _has_content(pdf_embedded):
+        with _weaviate_batch_lock:
+            weaviate_client.batch.configure(batch_size=batch_size, dynamic=True)
+            with instrumentation.weaviate_request("batch"), weaviate_client.batch as batch:
+                _add_document_to_batch(batch, pdf_embedded, document_schema)
+
+    return _release_document(pdf_embedded, pdf_content, pdf_pages)
+
+
+@config.when(ingestion_mode="streaming", vector_store="local")
+def stored_document__local(
+    local_store: LocalStore,
+    pdf_embedded: dict,
+    pdf_content: io.BytesIO,
+    pdf_pages: PdfPageStream,
+) -> dict:
+    """Store an arxiv object in the local store as soon as its branch is done,
+    then release the buffers of the document
+    """
+    if _has_content(pdf_embedded):
+        _add_document_to_local_store(local_store, pdf_embedded)
+    return _release_document(pdf_embedded, pdf_content, pdf_pages)
+
+
+@config.when(ingestion_mode="streaming")
+def store_documents__streaming(stored_document: Collect[dict]) -> list[dict]:
+    """Collect the catalog entries of the documents written by each branch, except those without chunks"""
+    return [stored for stored in stored_document if stored["n_chunks"]]
+
+
+def stored_document_ids(store_documents: list[dict]) -> list[str]:
+    """UUIDs of the documents stored by this run"""
+    return [stored["document_id"] for stored in store_documents]
+
+
+def cataloged_document_ids(
+    store_documents: list[dict], document_catalog: DocumentCatalog, corpus_id: str
+) -> list[str]:
+    """Add the documents stored by this run to the document catalog, once they are stored"""
+    document_catalog.add(corpus_id, store_documents)
+    return [stored["document_id"] for stored in store_documents]
@@ -0,0 +1,261 @@
+import contextlib
+import contextvars
+import http.server
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Iterator
+
+from hamilton import base, node
+from hamilton.execution.grouping import NodeGroupPurpose
+
+from backend import execution
+
+_current_trace: contextvars.ContextVar["Trace | None"] = contextvars.ContextVar("current_trace", default=None)
+_current_node: contextvars.ContextVar[str | None] = contextvars.ContextVar("current_node", default=None)
+_recent_traces: deque["Trace"] = deque(maxlen=100)
+_last_trace = threading.local()
+
+
+class MetricsRegistry:
+    """Process-wide counters and summaries, exported in the Prometheus text format;
+    A summary `x_seconds` is exported as `x_seconds_sum` and `x_seconds_count`
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+        self._types: dict[str, str] = {}
+
+    def _add(self, name: str, type_: str, value: float, labels: dict) -> None:
+        key = (name, tuple(sorted((label, str(label_value)) for label, label_value in labels.items())))
+        with self._lock:
+            self._types.setdefault(name, type_)
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        self._add(name, "counter", value, labels)
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        self._add(f"{name}_sum", "summary", seconds, labels)
+        self._add(f"{name}_count", "summary", 1, labels)
+
+    def to_prometheus(self) -> str:
+        with self._lock:
+            values = sorted(self._values.items())
+            types = dict(self._types)
+        lines = []
+        families = set()
+        for (name, labels), value in values:
+            family = name.removesuffix("_sum").removesuffix("_count") if types[name] == "summary" else name
+            if family not in families:
+                families.add(family)
+                lines.append(f"# TYPE {family} {types[name]}")
+            label_text = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+            lines.append(f"{name}{{{label_text}}} {value:g}" if labels else f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+class Trace:
+    """Spans of the nodes and external requests of one client call, e.g. a `rag_summary`"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.time()
+        self.seconds: float | None = None
+        self.spans: list[dict] = []
+        self.requests: list[dict] = []
+        self._lock = threading.Lock()
+
+    def add_span(self, span: dict) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def add_request(self, request: dict) -> None:
+        with self._lock:
+            self.requests.append(request)
+
+    def branches(self) -> dict[str, list[float]]:
+        """Wall time of each branch of the `Parallelizable` nodes, by node group"""
+        bounds: dict[tuple[str, str], tuple[float, float]] = {}
+        for span in self.spans:
+            if span["branch_of"] is None:
+                continue
+            key = (span["branch_of"], span["task"])
+            start, end = bounds.get(key, (span["start"], span["start"]))
+            bounds[key] = (min(start, span["start"]), max(end, span["start"] + span["seconds"]))
+        durations: dict[str, list[float]] = {}
+        for (group, _), (start, end) in bounds.items():
+            durations.setdefault(group, []).append(end - start)
+        return durations
+
+    def breakdown(self) -> dict:
+        """Time per node and per node group, and totals of the OpenAI and Weaviate requests"""
+        nodes: dict[str, dict] = {}
+        for span in self.spans:
+            stats = nodes.setdefault(span["node"], dict(calls=0, seconds=0.0))
+            stats["calls"] += 1
+            stats["seconds"] += span["seconds"]
+        services: dict[str, dict] = {}
+        for request in self.requests:
+            stats = services.setdefault(request["service"], dict(requests=0, seconds=0.0))
+            stats["requests"] += 1
+            stats["seconds"] += request["seconds"]
+            for field in ("prompt_tokens", "completion_tokens"):
+                if field in request:
+                    stats[field] = stats.get(field, 0) + request[field]
+        return dict(
+            name=self.name,
+            seconds=self.seconds,
+            nodes=dict(sorted(nodes.items(), key=lambda item: -item[1]["seconds"])),
+            branches={
+                group: dict(branches=len(durations), seconds_max=max(durations), seconds_sum=sum(durations))
+                for group, durations in self.branches().items()
+            },
+            services=services,
+        )
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return dict(
+                name=self.name,
+                started_at=self.started_at,
+                seconds=self.seconds,
+                spans=list(self.spans),
+                requests=list(self.requests),
+            )
+
+
+@contextlib.contextmanager
+def trace(name: str) -> Iterator[Trace]:
+    """Record the nodes and requests executed in this context, including `Parallelizable`
+    branches running on threads; branches running in worker processes are not recorded
+    """
+    run_trace = Trace(name)
+    token = _current_trace.set(run_trace)
+    start = time.perf_counter()
+    try:
+        yield run_trace
+    finally:
+        _current_trace.reset(token)
+        run_trace.seconds = time.perf_counter() - start
+        METRICS.observe("client_call_seconds", run_trace.seconds, call=name)
+        for group, durations in run_trace.branches().items():
+            for seconds in durations:
+                METRICS.observe("hamilton_branch_seconds", seconds, node_group=group)
+        _recent_traces.append(run_trace)
+        _last_trace.value = run_trace
+
+
+def recent_traces() -> list[dict]:
+    """JSON-serializable traces of the last client calls of this process, oldest first"""
+    return [run_trace.to_dict() for run_trace in list(_recent_traces)]
+
+
+def last_trace() -> Trace | None:
+    """Trace of the last client call made from this thread, e.g. by a Streamlit script run"""
+    return getattr(_last_trace, "value", None)
+
+
+def record_openai_request(endpoint: str, model: str, seconds: float, usage: dict | None) -> None:
+    usage = usage or {}
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    completion_tokens = usage.get("completion_tokens", 0)
+    METRICS.inc("openai_requests_total", endpoint=endpoint, model=model)
+    METRICS.inc("openai_prompt_tokens_total", prompt_tokens, endpoint=endpoint, model=model)
+    METRICS.inc("openai_completion_tokens_total", completion_tokens, endpoint=endpoint, model=model)
+    METRICS.observe("openai_request_seconds", seconds, endpoint=endpoint)
+    _record_request(
+        dict(
+            service="openai",
+            operation=endpoint,
+            model=model,
+            seconds=seconds,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+    )
+
+
+@contextlib.contextmanager
+def weaviate_request(operation: str) -> Iterator[None]:
+    """Time a Weaviate request, or a batch of them"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        METRICS.observe("weaviate_request_seconds", seconds, operation=operation)
+        _record_request(dict(service="weaviate", operation=operation, seconds=seconds))
+
+
+def _record_request(request: dict) -> None:
+    run_trace = _current_trace.get()
+    if run_trace is not None:
+        run_trace.add_request(dict(request, node=_current_node.get(), end=time.time()))
+
+
+class InstrumentationAdapter(base.SimplePythonGraphAdapter):
+    """Graph adapter timing every node into the metrics and the trace of the current context"""
+
+    def execute_node(self, node: node.Node, kwargs: dict[str, Any]) -> Any:
+        task = execution.current_task()
+        branch_of = None
+        if task is not None and task.purpose == NodeGroupPurpose.EXECUTE_BLOCK:
+            branch_of = task.base_id.removeprefix("block-")
+
+        token = _current_node.set(node.name)
+        started_at = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            return super().execute_node(node, kwargs)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            _current_node.reset(token)
+            METRICS.observe("hamilton_node_seconds", seconds, node=node.name)
+            run_trace = _current_trace.get()
+            if run_trace is not None:
+                run_trace.add_span(
+                    dict(
+                        node=node.name,
+                        task=task.task_id if task is not None else None,
+                        branch_of=branch_of,
+                        start=started_at,
+                        seconds=seconds,
+                        error=error,
+                    )
+                )
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path == "/metrics":
+            body, content_type = METRICS.to_prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path == "/traces":
+            body, content_type = json.dumps(recent_traces()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def serve_metrics(port: int) -> http.server.ThreadingHTTPServer:
+    """Serve `/metrics` for Prometheus and `/traces` as JSON from a background thread"""
+    server = http.server.ThreadingHTTPServer(("", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
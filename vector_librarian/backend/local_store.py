@@ -0,0 +1,333 @@
+import math
+import re
+import sqlite3
+import threading
+from array import array
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS document (
+    id TEXT PRIMARY KEY,
+    pdf_sha256 TEXT NOT NULL,
+    pdf_size INTEGER NOT NULL,
+    file_name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS document_pdf_sha256 ON document (pdf_sha256);
+CREATE TABLE IF NOT EXISTS chunk (
+    row INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    document_id TEXT NOT NULL REFERENCES document (id),
+    chunk_index INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    summary TEXT,
+    page_start INTEGER,
+    page_end INTEGER
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# constant of Weaviate's rankedFusion, which fuses the ranks of the keyword and vector searches
+_RANK_CONSTANT = 60
+
+
+def _terms(text: str) -> list[str]:
+    """Lowercased words, like Weaviate's default `word` tokenization"""
+    return re.findall(r"\w+", text.lower())
+
+
+def _top_rows(scores: np.ndarray, limit: int) -> list[int]:
+    """Rows of the `limit` highest scores, by decreasing score"""
+    limit = min(limit, len(scores))
+    if limit == 0:
+        return []
+    top = np.argpartition(-scores, limit - 1)[:limit]
+    return top[np.argsort(-scores[top], kind="stable")].tolist()
+
+
+class _Bm25Index:
+    """Inverted index of chunk contents scored with BM25, with Weaviate's defaults k1=1.2, b=0.75;
+    Postings are compact arrays of rows and term frequencies, and a query only touches
+    the postings of its terms
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, tuple[array, array]] = {}
+        self._lengths = array("I")
+        # NumPy copies of the postings and lengths, dropped when they grow
+        self._arrays: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._lengths_array: np.ndarray | None = None
+
+    def add(self, row: int, text: str) -> None:
+        """Index the text of a chunk; rows are added in order, starting at 0"""
+        assert row == len(self._lengths), "rows must be added in order"
+        counts = Counter(_terms(text))
+        self._lengths.append(sum(counts.values()))
+        self._lengths_array = None
+        for term, term_frequency in counts.items():
+            rows, term_frequencies = self._postings.setdefault(term, (array("I"), array("I")))
+            rows.append(row)
+            term_frequencies.append(term_frequency)
+            self._arrays.pop(term, None)
+
+    def _term_arrays(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        if term not in self._arrays:
+            rows, term_frequencies = self._postings[term]
+            self._arrays[term] = (np.array(rows, dtype=np.int64), np.array(term_frequencies, dtype=np.float32))
+        return self._arrays[term]
+
+    def ranking(self, query: str, limit: int) -> list[int]:
+        """Rows of the `limit` chunks with the best BM25 score for any of the query terms"""
+        terms = {term for term in _terms(query) if term in self._postings}
+        if not terms:
+            return []
+        if self._lengths_array is None:
+            self._lengths_array = np.array(self._lengths, dtype=np.float32)
+        lengths = self._lengths_array
+        n_chunks = len(lengths)
+        length_norm = self.k1 * (1 - self.b + self.b * lengths / lengths.mean())
+
+        scores = np.zeros(n_chunks, dtype=np.float32)
+        for term in terms:
+            rows, term_frequencies = self._term_arrays(term)
+            idf = math.log(1 + (n_chunks - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * term_frequencies * (self.k1 + 1) / (term_frequencies + length_norm[rows])
+        matched = np.flatnonzero(scores)
+        return matched[_top_rows(scores[matched], limit)].tolist()
+
+
+class LocalStore:
+    """In-process store of documents and chunks, a drop-in for Weaviate on a single machine;
+    Chunk vectors are L2-normalized float32 rows appended to `vectors.f32` and searched
+    brute-force through a memory map; chunk content is kept in SQLite and indexed for BM25
+    in memory when the store is opened.
+    Hybrid search fuses the ranks of both searches like Weaviate's `alpha`.
+    Safe to share between threads; a single process should write to a given store
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self.root / "vectors.f32"
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.root / "store.sqlite", check_same_thread=False, timeout=30
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(_SCHEMA)
+        chunk_columns = {column for _, column, *_ in self._connection.execute("PRAGMA table_info(chunk)")}
+        # stores created before chunks recorded their pages
+        for column in ("page_start", "page_end"):
+            if column not in chunk_columns:
+                self._connection.execute(f"ALTER TABLE chunk ADD COLUMN {column} INTEGER")
+        (self._n_rows,) = self._connection.execute(
+            "SELECT COALESCE(MAX(row) + 1, 0) FROM chunk"
+        ).fetchone()
+        row = self._connection.execute("SELECT value FROM meta WHERE key = 'dimensions'").fetchone()
+        self._dimensions = row[0] if row else None
+        self._vectors: np.ndarray | None = None
+        self._bm25 = _Bm25Index()
+        for row, content in self._connection.execute("SELECT row, content FROM chunk ORDER BY row"):
+            self._bm25.add(row, content)
+        if self._dimensions:
+            # drop vectors appended by a write that was interrupted before its commit
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(self._n_rows * self._dimensions * 4)
+
+    def __getstate__(self) -> dict:
+        """Pickle the location only, so the store can be sent to process-based executors"""
+        return dict(root=self.root)
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    def stored_pdf_sha256(self, hashes: list[str]) -> set[str]:
+        """Return the hashes among `hashes` that belong to a stored document"""
+        stored = set()
+        with self._lock:
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start : start + 500]
+                rows = self._connection.execute(
+                    f"SELECT pdf_sha256 FROM document WHERE pdf_sha256 IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                stored.update(sha256 for (sha256,) in rows)
+        return stored
+
+    def add_document(
+        self, document_id: str, document: dict, chunks: list[dict], vectors: np.ndarray
+    ) -> None:
+        """Store a document with its chunks, each a dict with `id`, `chunk_index`, `content`,
+        `page_start` and `page_end`, and their vectors; objects already stored under the same id are left untouched
+        """
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True) if len(vectors) else 1.0
+        vectors = np.ascontiguousarray(vectors / np.where(norms == 0, 1, norms), dtype=np.float32)
+
+        with self._lock:
+            dimensions = self._dimensions
+            try:
+                with self._connection:
+                    self._connection.execute(
+                        "INSERT OR IGNORE INTO document VALUES (?, ?, ?, ?)",
+                        (document_id, document["pdf_sha256"], document["pdf_size"], document["file_name"]),
+                    )
+                    stored_ids = self._stored_chunk_ids([chunk["id"] for chunk in chunks])
+                    new_rows = []
+                    for idx, chunk in enumerate(chunks):
+                        if chunk["id"] not in stored_ids:
+                            stored_ids.add(chunk["id"])
+                            new_rows.append(idx)
+                    if not new_rows:
+                        return
+
+                    if dimensions is None:
+                        dimensions = vectors.shape[1]
+                        self._connection.execute("INSERT INTO meta VALUES ('dimensions', ?)", (dimensions,))
+                    self._connection.executemany(
+                        "INSERT INTO chunk (row, id, document_id, chunk_index, content, page_start, page_end)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [
+                            (self._n_rows + offset, chunks[idx]["id"], document_id,
+                             chunks[idx]["chunk_index"], chunks[idx]["content"],
+                             chunks[idx].get("page_start"), chunks[idx].get("page_end"))
+                            for offset, idx in enumerate(new_rows)
+                        ],
+                    )
+                    # vectors are appended after their rows are inserted, before these are committed
+                    with open(self._vectors_path, "ab") as f:
+                        f.write(vectors[new_rows].tobytes())
+            except BaseException:
+                # the transaction is rolled back: drop the vectors appended for its rows, if any
+                if dimensions is not None and self._vectors_path.exists():
+                    with open(self._vectors_path, "ab") as f:
+                        f.truncate(self._n_rows * dimensions * 4)
+                raise
+
+            self._dimensions = dimensions
+            for offset, idx in enumerate(new_rows):
+                self._bm25.add(self._n_rows + offset, chunks[idx]["content"])
+            self._n_rows += len(new_rows)
+            self._vectors = None
+
+    def _stored_chunk_ids(self, chunk_ids: list[str]) -> set[str]:
+        stored = set()
+        for start in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[start : start + 500]
+            rows = self._connection.execute(
+                f"SELECT id FROM chunk WHERE id IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            stored.update(chunk_id for (chunk_id,) in rows)
+        return stored
+
+    def update_summary(self, chunk_id: str, summary: str) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE chunk SET summary = ? WHERE id = ?", (summary, chunk_id))
+
+    def chunks_without_summary(self, document_ids: list[str] | None = None) -> list[dict]:
+        """`chunk_id` and `content` of the chunks without summary, of `document_ids` or of all documents"""
+        query = "SELECT id, content FROM chunk WHERE (summary IS NULL OR summary = '')"
+        with self._lock:
+            if document_ids is None:
+                rows = self._connection.execute(f"{query} ORDER BY row").fetchall()
+            else:
+                rows = []
+                for start in range(0, len(document_ids), 500):
+                    batch = document_ids[start : start + 500]
+                    rows += self._connection.execute(
+                        f"{query} AND document_id IN ({','.join('?' * len(batch))}) ORDER BY row", batch
+                    ).fetchall()
+        return [dict(chunk_id=chunk_id, content=content) for chunk_id, content in rows]
+
+    def list_documents(self, after: str | None, limit: int) -> list[dict]:
+        """Page of at most `limit` documents by id, those after the id `after`, with their number of chunks"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT document.id, file_name, pdf_size, COUNT(chunk.row) FROM document"
+                " LEFT JOIN chunk ON chunk.document_id = document.id"
+                " WHERE document.id > ? GROUP BY document.id ORDER BY document.id LIMIT ?",
+                (after or "", limit),
+            ).fetchall()
+        return [
+            dict(document_id=id_, file_name=file_name, pdf_size=pdf_size, n_chunks=n_chunks)
+            for id_, file_name, pdf_size, n_chunks in rows
+        ]
+
+    def get_document(self, document_id: str) -> dict:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT file_name, pdf_sha256, pdf_size FROM document WHERE id = ?", (document_id,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(document_id)
+        file_name, pdf_sha256, pdf_size = row
+        return dict(file_name=file_name, pdf_sha256=pdf_sha256, pdf_size=pdf_size)
+
+    def _vector_matrix(self) -> np.ndarray:
+        """Memory map of the vectors, reopened after writes"""
+        if self._vectors is None:
+            if self._n_rows == 0:
+                self._vectors = np.empty((0, self._dimensions or 0), dtype=np.float32)
+            else:
+                self._vectors = np.memmap(
+                    self._vectors_path, dtype=np.float32, mode="r",
+                    shape=(self._n_rows, self._dimensions),
+                )
+        return self._vectors
+
+    def _vector_ranking(self, query_vector: np.ndarray, limit: int) -> list[int]:
+        """Rows of the `limit` chunks closest to the query by cosine similarity"""
+        vectors = self._vector_matrix()
+        if len(vectors) == 0:
+            return []
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        return _top_rows(vectors @ (query_vector / (np.linalg.norm(query_vector) or 1)), limit)
+
+    def hybrid_search(
+        self, query: str, query_vector: np.ndarray, alpha: float = 0.5, limit: int = 5
+    ) -> list[dict]:
+        """Most relevant chunks for a query, by decreasing fused score;
+        `alpha` weighs the vector search against the keyword search: 1 is pure vector, 0 pure BM25
+        """
+        n_candidates = max(limit, 100)
+        with self._lock:
+            scores: dict[int, float] = {}
+            if alpha > 0:
+                for rank, row in enumerate(self._vector_ranking(query_vector, n_candidates)):
+                    scores[row] = scores.get(row, 0.0) + alpha / (_RANK_CONSTANT + rank)
+            if alpha < 1:
+                for rank, row in enumerate(self._bm25.ranking(query, n_candidates)):
+                    scores[row] = scores.get(row, 0.0) + (1 - alpha) / (_RANK_CONSTANT + rank)
+
+            top_rows = sorted(scores, key=scores.get, reverse=True)[:limit]
+            if not top_rows:
+                return []
+            rows = self._connection.execute(
+                "SELECT chunk.row, chunk.id, chunk.document_id, document.file_name,"
+                " chunk.chunk_index, chunk.content, chunk.summary, chunk.page_start, chunk.page_end"
+                " FROM chunk JOIN document ON document.id = chunk.document_id"
+                f" WHERE chunk.row IN ({','.join('?' * len(top_rows))})",
+                top_rows,
+            ).fetchall()
+
+        chunks = {
+            row: dict(
+                document_id=document_id,
+                chunk_id=chunk_id,
+                document_file_name=file_name,
+                chunk_index=chunk_index,
+                content=content,
+                summary=summary,
+                score=scores[row],
+                page_start=page_start,
+                page_end=page_end,
+            )
+            for row, chunk_id, document_id, file_name, chunk_index, content, summary, page_start, page_end in rows
+        }
+        return [chunks[row] for row in top_rows]
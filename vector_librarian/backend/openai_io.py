@@ -0,0 +1,280 @@
+import asyncio
+import atexit
+import contextvars
+import functools
+import json
+import queue
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Coroutine, Iterator, TypeVar
+
+import aiohttp
+import numpy as np
+import openai
+
+from backend import instrumentation
+
+T = TypeVar("T")
+
+# rate limits, server errors and timeouts are worth another attempt, other errors are not
+_RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+async def _in_context(context: contextvars.Context, coroutine: Coroutine[Any, Any, T]) -> T:
+    """Await a coroutine with the context variables of the calling thread, e.g. its trace"""
+    for variable, value in context.items():
+        variable.set(value)
+    return await coroutine
+
+
+def _api_error(status: int, body: dict) -> openai.error.OpenAIError:
+    """Exception of the `openai` package matching an error response"""
+    message = body.get("error", {}).get("message") or f"OpenAI request failed with status {status}"
+    if status == 400:
+        param = body.get("error", {}).get("param")
+        return openai.error.InvalidRequestError(message, param, http_status=status, json_body=body)
+    if status == 401:
+        return openai.error.AuthenticationError(message, http_status=status, json_body=body)
+    if status == 429:
+        return openai.error.RateLimitError(message, http_status=status, json_body=body)
+    return openai.error.APIError(message, http_status=status, json_body=body)
+
+
+class AsyncOpenAIClient:
+    """OpenAI REST API over one persistent aiohttp session, running on an event loop in its own thread;
+    Connections are reused by every request of the process, whichever thread makes it.
+    Rate-limited, failed and timed out requests are retried with jittered exponential backoff,
+    by awaiting rather than sleeping, so that other requests carry on.
+    `api_key` and `base_url` default to `openai.api_key` and `openai.api_base`, read at each request;
+    point `base_url` at a local server, e.g. "http://127.0.0.1:8000/v1", to test without OpenAI
+    """
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        base_url: str | None = None,
+        timeout_seconds: float = 60.0,
+        max_attempts: int = 4,
+        backoff_seconds: float = 1.0,
+        max_backoff_seconds: float = 20.0,
+        max_connections: int = 32,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout_seconds = timeout_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.max_connections = max_connections
+        self._session: aiohttp.ClientSession | None = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="openai-io", daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine: Coroutine[Any, Any, T], timeout: float | None = None) -> T:
+        """Run a coroutine of this client from synchronous code and wait for its result;
+        It runs with the context variables of the caller. If `timeout` expires or the caller
+        is interrupted, the coroutine is cancelled, along with its pending requests
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            _in_context(contextvars.copy_context(), coroutine), self._loop
+        )
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def iterate(self, iterator: AsyncIterator[T]) -> Iterator[T]:
+        """Iterate from synchronous code over an async iterator of this client, e.g. a streamed answer;
+        It runs with the context variables of the caller. Closing the iterator early, or an error
+        of the caller, cancels the iteration along with its pending request
+        """
+        items: queue.Queue[tuple[bool, Any]] = queue.Queue()
+
+        async def forward() -> None:
+            try:
+                async for item in iterator:
+                    items.put((False, item))
+            except asyncio.CancelledError:
+                raise
+            except BaseException as e:
+                items.put((True, e))
+            else:
+                items.put((True, None))
+
+        future = asyncio.run_coroutine_threadsafe(
+            _in_context(contextvars.copy_context(), forward()), self._loop
+        )
+        try:
+            while True:
+                done, item = items.get()
+                if done:
+                    if item is not None:
+                        raise item
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+    def close(self) -> None:
+        """Close the connections and stop the event loop"""
+        if self._session is not None:
+            self.run(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # created on the loop, which the session is bound to
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout_seconds),
+            )
+        return self._session
+
+    def _backoff(self, attempt: int, retry_after: str | None) -> float:
+        if retry_after and retry_after.replace(".", "", 1).isdigit():
+            return min(float(retry_after), self.max_backoff_seconds)
+        return random.uniform(0, min(self.backoff_seconds * 2**attempt, self.max_backoff_seconds))
+
+    async def _request(
+        self, path: str, payload: dict | None = None, stream: bool = False, api_key: str | None = None
+    ) -> dict | aiohttp.ClientResponse:
+        """POST a JSON payload to an endpoint of the API, or GET it without payload, retrying transient failures;
+        With `stream`, return the response as soon as it starts, for the caller to read and release.
+        `api_key` overrides the key of the client for this request
+        """
+        url = f"{(self.base_url or openai.api_base).rstrip('/')}/{path}"
+        headers = {"Authorization": f"Bearer {api_key or self.api_key or openai.api_key}"}
+        method = "GET" if payload is None else "POST"
+        # a streamed response lasts as long as the generation, only waiting between chunks is limited
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.timeout_seconds) if stream else None
+        for attempt in range(self.max_attempts):
+            retry_after = None
+            try:
+                response = await self._get_session().request(
+                    method, url, json=payload, headers=headers, timeout=timeout
+                )
+                if response.status < 400 and stream:
+                    return response
+                async with response:
+                    text = await response.text()
+                try:
+                    body = json.loads(text)
+                except ValueError:
+                    body = dict(error=dict(message=text[:200]))
+                if response.status < 400:
+                    return body
+                error = _api_error(response.status, body)
+                retryable = response.status in _RETRY_STATUSES
+                retry_after = response.headers.get("Retry-After")
+            except asyncio.TimeoutError:
+                error = openai.error.Timeout(f"Request to {path} timed out after {self.timeout_seconds}s")
+                retryable = True
+            except aiohttp.ClientError as e:
+                error = openai.error.APIConnectionError(f"Error communicating with OpenAI: {e}")
+                retryable = True
+
+            if not retryable or attempt == self.max_attempts - 1:
+                raise error
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+
+    async def chat_completion(self, prompt: str, model: str, temperature: float = 0) -> str:
+        """Answer a single-message prompt"""
+        start = time.perf_counter()
+        response = await self._request(
+            "chat/completions",
+            dict(model=model, messages=[dict(role="user", content=prompt)], temperature=temperature),
+        )
+        instrumentation.record_openai_request(
+            "chat_completions", model, time.perf_counter() - start, response.get("usage")
+        )
+        return response["choices"][0]["message"]["content"]
+
+    async def chat_completions(self, prompts: list[str], model: str, temperature: float = 0) -> list[str]:
+        """Answer prompts with concurrent requests, in order;
+        If one of them fails, the others are cancelled
+        """
+        tasks = [
+            asyncio.ensure_future(self.chat_completion(prompt, model, temperature)) for prompt in prompts
+        ]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    async def chat_completion_stream(
+        self, prompt: str, model: str, temperature: float = 0
+    ) -> AsyncIterator[str]:
+        """Answer a single-message prompt, yielding the text of the answer as it is generated;
+        The request is retried until the response starts, not after
+        """
+        start = time.perf_counter()
+        n_tokens = 0
+        response = await self._request(
+            "chat/completions",
+            dict(
+                model=model,
+                messages=[dict(role="user", content=prompt)],
+                temperature=temperature,
+                stream=True,
+            ),
+            stream=True,
+        )
+        try:
+            # server-sent events, one `data: {...}` line per chunk of the answer
+            async for line in response.content:
+                data = line.strip().removeprefix(b"data:").strip()
+                if not line.startswith(b"data:") or not data:
+                    continue
+                if data == b"[DONE]":
+                    break
+                token = json.loads(data)["choices"][0]["delta"].get("content")
+                if token:
+                    if n_tokens == 0:
+                        instrumentation.METRICS.observe(
+                            "openai_time_to_first_token_seconds", time.perf_counter() - start, model=model
+                        )
+                    n_tokens += 1
+                    yield token
+        except asyncio.TimeoutError:
+            raise openai.error.Timeout(f"No chunk of the answer for {self.timeout_seconds}s")
+        except aiohttp.ClientError as e:
+            raise openai.error.APIConnectionError(f"Error communicating with OpenAI: {e}")
+        finally:
+            response.release()
+            # each chunk of a streamed answer holds about one token
+            instrumentation.record_openai_request(
+                "chat_completions", model, time.perf_counter() - start, dict(completion_tokens=n_tokens)
+            )
+
+    async def list_models(self, api_key: str | None = None) -> list[str]:
+        """Ids of the models available with the API key; a cheap request that validates the key"""
+        start = time.perf_counter()
+        response = await self._request("models", api_key=api_key)
+        instrumentation.record_openai_request("models", "", time.perf_counter() - start, None)
+        return [model["id"] for model in response["data"]]
+
+    async def embeddings(self, texts: list[str], model: str) -> np.ndarray:
+        """Embed texts in a single request, as a 2-D float32 array"""
+        start = time.perf_counter()
+        response = await self._request("embeddings", dict(input=texts, model=model))
+        instrumentation.record_openai_request(
+            "embeddings", model, time.perf_counter() - start, response.get("usage")
+        )
+        data = sorted(response["data"], key=lambda item: item.get("index", 0))
+        return np.array([item["embedding"] for item in data], dtype=np.float32)
+
+
+@functools.lru_cache
+def openai_client() -> AsyncOpenAIClient:
+    """Client shared by all threads of the process, so that they share its connections;
+    Its connections are closed when the process exits
+    """
+    client = AsyncOpenAIClient()
+    atexit.register(client.close)
+    return client
@@ -0,0 +1,245 @@
+import io
+import mmap
+import multiprocessing
+import threading
+import typing
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Iterator
+
+import pypdf
+
+
+@dataclass(frozen=True)
+class PageText:
+    """Text of one PDF page and its character offset in the text of the whole document"""
+
+    page_number: int
+    text: str
+    start: int
+    skipped: bool = False
+
+
+class PdfExtractionError(RuntimeError):
+    """Pages of a PDF failed to extract or timed out"""
+
+
+def _extract_page_range(shared_memory_name: str, size: int, start: int, stop: int) -> list[str | None]:
+    """Extract the text of pages [start, stop) of a PDF held in shared memory;
+    Runs in a worker process. Pages that fail to extract are returned as None
+    """
+    shared_memory = SharedMemory(name=shared_memory_name)
+    try:
+        reader = pypdf.PdfReader(io.BytesIO(bytes(shared_memory.buf[:size])))
+        return [_extract_page(reader, page_number) for page_number in range(start, stop)]
+    finally:
+        shared_memory.close()
+
+
+def _extract_page(reader: pypdf.PdfReader, page_number: int) -> str | None:
+    try:
+        return reader.pages[page_number].extract_text()
+    except Exception:
+        return None
+
+
+class _ExtractionPool:
+    """Process pool shared by all documents extracted in this process, tracking its pending page ranges;
+    Workers are spawned rather than forked because extraction runs alongside other threads.
+    A worker stuck on a pathological page can't be stopped alone: the pool is retired, so that new
+    documents get a fresh pool, and its processes are killed once the page ranges of the other
+    documents are done, instead of cancelling them
+    """
+
+    def __init__(self, max_workers: int):
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self.retired = False
+        self._condition = threading.Condition()
+        self._pending: set[Future] = set()
+        self._stuck: set[Future] = set()
+
+    def submit(self, *args) -> Future:
+        future = self.executor.submit(*args)
+        with self._condition:
+            self._pending.add(future)
+        # called at once if the future is already done
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future) -> None:
+        with self._condition:
+            self._pending.discard(future)
+            self._stuck.discard(future)
+            self._condition.notify_all()
+
+    def retire(self, stuck: Future) -> None:
+        """Stop giving the pool to new documents because the page range `stuck` timed out or failed"""
+        with self._condition:
+            self._stuck.add(stuck)
+            if self.retired:
+                return
+            self.retired = True
+        threading.Thread(target=self._kill_when_stuck, name="pdf-extraction-reaper", daemon=True).start()
+
+    def _kill_when_stuck(self) -> None:
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending <= self._stuck)
+        self.kill()
+
+    def kill(self) -> None:
+        """Stop the workers, including those stuck on a page, which `shutdown` doesn't"""
+        for process in list((self.executor._processes or {}).values()):
+            process.kill()
+        self.executor.shutdown(wait=False)
+
+
+_extraction_pools: dict[int, _ExtractionPool] = {}
+_extraction_pools_lock = threading.Lock()
+
+
+def _extraction_pool(max_workers: int) -> _ExtractionPool:
+    """Current pool for `max_workers` workers; a retired pool is replaced by a fresh one"""
+    with _extraction_pools_lock:
+        pool = _extraction_pools.get(max_workers)
+        if pool is None or pool.retired:
+            pool = _extraction_pools[max_workers] = _ExtractionPool(max_workers)
+        return pool
+
+
+def _shutdown_extraction_pools() -> None:
+    """Stop the workers of all pools, e.g. before a process that waits for its children exits"""
+    with _extraction_pools_lock:
+        pools = list(_extraction_pools.values())
+        _extraction_pools.clear()
+    for pool in pools:
+        pool.kill()
+
+
+class PdfPageStream:
+    """Text of a PDF, extracted page by page while it is iterated;
+    PDFs larger than `pages_per_task` pages are split into page ranges extracted by a process pool.
+    A page that fails to extract, or whose page range exceeds `page_timeout` seconds per page,
+    is yielded as skipped with an empty text, so the stream doesn't wait for it; see `skipped_pages`.
+    Extracted pages are kept, so the stream can be iterated again, e.g. by `raw_text` and `chunked_text`
+    """
+
+    def __init__(
+        self,
+        pdf_bytes: bytes,
+        max_workers: int = 4,
+        pages_per_task: int = 8,
+        page_timeout: float = 30.0,
+    ):
+        self.pdf_bytes = pdf_bytes
+        self.max_workers = max_workers
+        self.pages_per_task = pages_per_task
+        self.page_timeout = page_timeout
+        self._pages: list[PageText] = []
+        self._source: Iterator[PageText] | None = None
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> Iterator[PageText]:
+        idx = 0
+        while True:
+            with self._lock:
+                if idx == len(self._pages):
+                    if self._source is None:
+                        self._source = self._extract_pages()
+                    page = next(self._source, None)
+                    if page is None:
+                        return
+                    self._pages.append(page)
+                page = self._pages[idx]
+            yield page
+            idx += 1
+
+    def __getstate__(self) -> dict:
+        """Pickle the PDF only; pages are extracted again after unpickling"""
+        state = dict(self.__dict__)
+        state.update(_pages=[], _source=None, _lock=None)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state, _lock=threading.Lock())
+
+    def release(self) -> None:
+        """Drop the PDF and the extracted pages once the document has been processed"""
+        with self._lock:
+            self.pdf_bytes = b""
+            self._pages = []
+            self._source = iter(())
+
+    @property
+    def skipped_pages(self) -> list[int]:
+        """Numbers of the pages that failed to extract or timed out, from 0"""
+        return [page.page_number for page in self if page.skipped]
+
+    @property
+    def text(self) -> str:
+        """Text of all pages joined by a space"""
+        return " ".join(page.text for page in self)
+
+    def _extract_pages(self) -> Iterator[PageText]:
+        """Yield pages in order with their character offset in `text`"""
+        start = 0
+        for page_number, text in enumerate(self._extract_texts()):
+            yield PageText(page_number=page_number, text=text or "", start=start, skipped=text is None)
+            start += len(text or "") + 1
+
+    def _extract_texts(self) -> Iterator[str | None]:
+        reader = pypdf.PdfReader(io.BytesIO(self.pdf_bytes))
+        n_pages = len(reader.pages)
+        if self.max_workers <= 1 or n_pages <= self.pages_per_task:
+            for page_number in range(n_pages):
+                yield _extract_page(reader, page_number)
+            return
+
+        shared_memory = SharedMemory(create=True, size=len(self.pdf_bytes))
+        try:
+            shared_memory.buf[: len(self.pdf_bytes)] = self.pdf_bytes
+            yield from self._extract_texts_in_pool(shared_memory, n_pages)
+        finally:
+            shared_memory.close()
+            shared_memory.unlink()
+
+    def _extract_texts_in_pool(
+        self, shared_memory: SharedMemory, n_pages: int
+    ) -> Iterator[str | None]:
+        pool = _extraction_pool(self.max_workers)
+        page_ranges = [
+            (start, min(start + self.pages_per_task, n_pages))
+            for start in range(0, n_pages, self.pages_per_task)
+        ]
+        futures = [
+            pool.submit(_extract_page_range, shared_memory.name, len(self.pdf_bytes), start, stop)
+            for start, stop in page_ranges
+        ]
+
+        for (start, stop), future in zip(page_ranges, futures):
+            try:
+                yield from future.result(timeout=self.page_timeout * (stop - start))
+            except (TimeoutError, CancelledError, BrokenProcessPool):
+                pool.retire(future)
+                yield from [None] * (stop - start)
+
+
+def pdf_page_range(
+    pdf_file: typing.BinaryIO | mmap.mmap, first_page: int, last_page: int
+) -> tuple[bytes, int, int]:
+    """Copy pages `first_page` to `last_page` (from 0, included) of a PDF into a new PDF;
+    Only the cross-reference table and the objects of these pages are read from `pdf_file`, e.g.
+    a memory map of a blob. Return the new PDF, its last page in the source and the source's number of pages
+    """
+    reader = pypdf.PdfReader(pdf_file)
+    n_pages = len(reader.pages)
+    last_page = min(last_page, n_pages - 1)
+    writer = pypdf.PdfWriter()
+    for page_number in range(first_page, last_page + 1):
+        writer.add_page(reader.pages[page_number])
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue(), last_page, n_pages
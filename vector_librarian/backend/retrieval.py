@@ -1,85 +1,277 @@
-import openai
+import atexit
+import functools
+import logging
+from typing import Callable, Iterator
+
+import numpy as np
+import tiktoken
 import weaviate
-from tenacity import retry, stop_after_attempt, wait_random_exponential
 
-from hamilton.function_modifiers import extract_fields
-from hamilton.htypes import Collect, Parallelizable
+from hamilton.function_modifiers import config, extract_fields
+
+from backend import instrumentation, openai_io
+from backend.connections import connection_manager
+from backend.document_catalog import DocumentCatalog
+from backend.embedding_cache import EmbeddingCache
+from backend.ingestion import _cached_embeddings, _get_embeddings__openai
+from backend.local_store import LocalStore
+from backend.summary_write_back import SummaryWriteBack
+
+logger = logging.getLogger(__name__)
+
+# `QUERY_MAXIMUM_RESULTS` of a default Weaviate server: filtered queries can't read past it, even with an offset
+WEAVIATE_MAX_RESULTS = 10_000
+
+
+@config.when_not(vector_store="local")
+def document_lister__weaviate(weaviate_client: weaviate.Client) -> Callable[[str | None, int], list[dict]]:
+    """Function listing a page of `Document` objects with the cursor API: `list_page(after, limit)`
+    returns at most `limit` documents by UUID, those after the UUID `after`, or the first ones
+    """
+
+    def list_page(after: str | None, limit: int) -> list[dict]:
+        query = (
+            weaviate_client.query
+            .get("Document", ["file_name", "pdf_size"])
+            .with_additional("id")
+            .with_limit(limit)
+        )
+        if after is not None:
+            query = query.with_after(after)
+        with instrumentation.weaviate_request("list_documents"):
+            response = query.do()
+        return [
+            dict(
+                document_id=document["_additional"]["id"],
+                file_name=document["file_name"],
+                pdf_size=document.get("pdf_size"),
+            )
+            for document in response["data"]["Get"]["Document"]
+        ]
+
+    return list_page
+
 
-from backend.ingestion import _get_embeddings__openai
+@config.when(vector_store="local")
+def document_lister__local(local_store: LocalStore) -> Callable[[str | None, int], list[dict]]:
+    """Function listing a page of the documents of the local store: `list_page(after, limit)`"""
+    return local_store.list_documents
 
 
-def all_documents_file_name(weaviate_client: weaviate.Client) -> list[dict]:
-    """Get the `file_name` of all `Document` objects stored in Weaviate"""
-    response = (
-        weaviate_client.query
-        .get("Document", ["file_name"])
-        .with_additional("id")
-        .do()
+def _list_all_documents(
+    document_lister: Callable[[str | None, int], list[dict]], page_size: int
+) -> Iterator[dict]:
+    after = None
+    while True:
+        page = document_lister(after, page_size)
+        yield from page
+        if len(page) < page_size:
+            return
+        after = page[-1]["document_id"]
+
+
+def document_listing_page(
+    document_lister: Callable[[str | None, int], list[dict]],
+    documents_after: str | None = None,
+    documents_page_size: int = 100,
+) -> dict:
+    """Page of stored documents after the document id `documents_after`, or the first page;
+    `after` is the cursor of the next page, None after the last one
+    """
+    documents = document_lister(documents_after, documents_page_size)
+    after = documents[-1]["document_id"] if len(documents) == documents_page_size else None
+    return dict(documents=documents, after=after)
+
+
+def all_documents_file_name(
+    document_lister: Callable[[str | None, int], list[dict]], documents_page_size: int = 1000
+) -> list[dict]:
+    """Get the `file_name` of all stored documents, page by page, so that none is left out;
+    In the shape returned by a Weaviate `Get` query
+    """
+    return [
+        dict(file_name=document["file_name"], _additional=dict(id=document["document_id"]))
+        for document in _list_all_documents(document_lister, documents_page_size)
+    ]
+
+
+def synced_document_catalog(
+    document_catalog: DocumentCatalog,
+    corpus_id: str,
+    document_lister: Callable[[str | None, int], list[dict]],
+    resync_document_catalog: bool = False,
+    documents_page_size: int = 1000,
+) -> DocumentCatalog:
+    """Document catalog holding every document of the corpus; the corpus is listed into it the
+    first time, or with `resync_document_catalog`, then ingestion keeps it up to date
+    """
+    if resync_document_catalog or not document_catalog.is_synced(corpus_id):
+        document_catalog.sync(corpus_id, _list_all_documents(document_lister, documents_page_size))
+    return document_catalog
+
+
+def searched_documents(
+    synced_document_catalog: DocumentCatalog,
+    corpus_id: str,
+    document_name_query: str = "",
+    documents_search_limit: int = 50,
+) -> dict:
+    """Documents whose file name contains `document_name_query`, from the catalog, by name;
+    `total` is the number of documents of the corpus
+    """
+    return dict(
+        documents=synced_document_catalog.search(corpus_id, document_name_query, documents_search_limit),
+        total=synced_document_catalog.count(corpus_id),
     )
-    return response["data"]["Get"]["Document"]
 
 
-def get_document_by_id(weaviate_client: weaviate.Client, document_id: str) -> dict:
-    """Get a particular `Document` based on it's Weaviate UUID"""
-    response = weaviate_client.data_object.get(class_name="Document", uuid=document_id)
+@config.when_not(vector_store="local")
+def corpus_id__weaviate(weaviate_client: weaviate.Client) -> str:
+    """Identify the Weaviate instance searched, e.g. to scope cached answers;
+    Clients not created by the `ConnectionManager` are identified by their object
+    """
+    return connection_manager().weaviate_url(weaviate_client) or f"weaviate-{id(weaviate_client)}"
+
+
+@config.when(vector_store="local")
+def corpus_id__local(local_store: LocalStore) -> str:
+    """Identify the local store searched, e.g. to scope cached answers"""
+    return str(local_store.root.resolve())
+
+
+def corpus_version(document_catalog: DocumentCatalog, corpus_id: str) -> str:
+    """Version of the corpus, bumped in the document catalog each time documents are stored in it
+    or it is listed again from the vector store, e.g. to scope cached answers; documents stored by
+    another server change it once the catalog is refreshed
+    """
+    return str(document_catalog.version(corpus_id))
+
+
+@config.when_not(vector_store="local")
+def get_document_by_id__weaviate(weaviate_client: weaviate.Client, document_id: str) -> dict:
+    """Get a particular `Document` based on it's Weaviate UUID;
+    The PDF file is read from the blob store using `pdf_sha256`. Documents stored
+    before the blob store existed carry the file as base64 `pdf_blob` instead
+    """
+    with instrumentation.weaviate_request("get_document"):
+        response = weaviate_client.data_object.get(class_name="Document", uuid=document_id)
+    properties = response["properties"]
     return dict(
         document_id=response["id"],
-        pdf_blob=response["properties"]["pdf_blob"],
-        file_name=response["properties"]["file_name"],
+        file_name=properties["file_name"],
+        pdf_sha256=properties.get("pdf_sha256"),
+        pdf_size=properties.get("pdf_size"),
+        pdf_blob=properties.get("pdf_blob"),
     )
 
 
-def query_embedding(rag_query: str, embedding_model_name: str) -> list[float]:
-    """Get the OpenAI embeddings for the RAG query
+@config.when(vector_store="local")
+def get_document_by_id__local(local_store: LocalStore, document_id: str) -> dict:
+    """Get a particular document of the local store based on its UUID"""
+    return dict(document_id=document_id, pdf_blob=None, **local_store.get_document(document_id))
+
+
+def query_embedding(
+    rag_query: str, embedding_model_name: str, embedding_cache: EmbeddingCache
+) -> np.ndarray:
+    """Get the OpenAI embeddings for the RAG query; repeated queries are served by the cache
     NOTE. The embedding function is imported from `ingestion` to match
     how chunks are stored in the vectordb
     """
-    return _get_embeddings__openai(texts=[rag_query], embedding_model_name=embedding_model_name)[0]
+    return _cached_embeddings(
+        texts=[rag_query],
+        embedding_model_name=embedding_model_name,
+        embedding_cache=embedding_cache,
+        embed_fn=lambda texts: _get_embeddings__openai(
+            texts=texts, embedding_model_name=embedding_model_name
+        ),
+    )[0]
+
+
+def query_embeddings(
+    rag_queries: list[str],
+    embedding_model_name: str,
+    embedding_cache: EmbeddingCache,
+    query_embeddings_batch_size: int = 2048,
+) -> np.ndarray:
+    """Get the OpenAI embeddings of many RAG queries, e.g. of a bulk run, as a 2-D float32 array;
+    Queries missing from the cache are embedded together, `query_embeddings_batch_size` per request
+    """
+
+    def embed(texts: list[str]) -> np.ndarray:
+        return np.concatenate(
+            [
+                _get_embeddings__openai(
+                    texts=texts[start : start + query_embeddings_batch_size],
+                    embedding_model_name=embedding_model_name,
+                )
+                for start in range(0, len(texts), query_embeddings_batch_size)
+            ]
+        )
+
+    return _cached_embeddings(
+        texts=rag_queries,
+        embedding_model_name=embedding_model_name,
+        embedding_cache=embedding_cache,
+        embed_fn=embed,
+    )
 
 
-def document_chunk_hybrid_search_result(
+@config.when_not(vector_store="local")
+def document_chunk_hybrid_search_result__weaviate(
     weaviate_client: weaviate.Client,
     rag_query: str,
-    query_embedding: list[float],
+    query_embedding: np.ndarray,
     hybrid_search_alpha: float = 0.5,
     retrieve_top_k: int = 5,
+    document_schema: str = "references",
 ) -> list[dict]:
     """Query `Document` objects stored in Weaviate using hybrid search;
-    Return a list of k most relevant article objects
+    Return a list of k most relevant article objects;
+    With the `centroid` schema, the document is read from properties of the chunk instead of a reference
     reference for hybrid search: https://weaviate.io/developers/academy/zero_to_mvp/queries_2/hybrid
     """
-    response = (
-        weaviate_client.query.get(
-            "Chunk",
-            [
-                "chunk_index",
-                "content",
-                "summary",
-                "fromDocument {... on Document {file_name, _additional{id}}}",
-            ],
-        )
-        .with_hybrid(
-            query=rag_query,
-            properties=["content"],
-            vector=query_embedding,
-            alpha=hybrid_search_alpha,
+    if document_schema == "centroid":
+        document_properties = ["document_id", "file_name"]
+    else:
+        document_properties = ["fromDocument {... on Document {file_name, _additional{id}}}"]
+
+    with instrumentation.weaviate_request("hybrid_search"):
+        response = (
+            weaviate_client.query.get(
+                "Chunk",
+                ["chunk_index", "content", "summary", "page_start", "page_end", *document_properties],
+            )
+            .with_hybrid(
+                query=rag_query,
+                properties=["content"],
+                vector=query_embedding.tolist(),
+                alpha=hybrid_search_alpha,
+            )
+            .with_additional(["score", "id"])
+            .with_limit(retrieve_top_k)
+            .do()
         )
-        .with_additional(["score", "id"])
-        .with_limit(retrieve_top_k)
-        .do()
-    )
 
     results = []
     for idx, chunk in enumerate(response["data"]["Get"]["Chunk"]):
+        if document_schema == "centroid":
+            document_id, document_file_name = chunk["document_id"], chunk["file_name"]
+        else:
+            document = chunk["fromDocument"][0]
+            document_id, document_file_name = document["_additional"]["id"], document["file_name"]
         results.append(
             dict(
-                document_id=chunk["fromDocument"][0]["_additional"]["id"],
+                document_id=document_id,
                 chunk_id=chunk["_additional"]["id"],
-                document_file_name=chunk["fromDocument"][0]["file_name"],
+                document_file_name=document_file_name,
                 chunk_index=chunk["chunk_index"],
                 content=chunk["content"],
                 summary=chunk["summary"],
                 score=chunk["_additional"]["score"],
+                # chunks stored before pages were recorded have none
+                page_start=chunk.get("page_start"),
+                page_end=chunk.get("page_end"),
                 rank=idx,
             )
         )
@@ -87,35 +279,59 @@ def document_chunk_hybrid_search_result(
     return results
 
 
+@config.when(vector_store="local")
+def document_chunk_hybrid_search_result__local(
+    local_store: LocalStore,
+    rag_query: str,
+    query_embedding: np.ndarray,
+    hybrid_search_alpha: float = 0.5,
+    retrieve_top_k: int = 5,
+) -> list[dict]:
+    """Query chunks of the local store using hybrid search, fused like Weaviate's `alpha`;
+    Return a list of k most relevant chunk objects
+    """
+    chunks = local_store.hybrid_search(
+        query=rag_query,
+        query_vector=query_embedding,
+        alpha=hybrid_search_alpha,
+        limit=retrieve_top_k,
+    )
+    return [dict(rank=idx, **chunk) for idx, chunk in enumerate(chunks)]
+
+
 @extract_fields(
     dict(
         chunks_without_summary=list[dict],
         chunks_with_summary=list[dict],
     )
 )
-def check_if_summary_exists(document_chunk_hybrid_search_result: list[dict]) -> dict:
-    """Conditional flag to separate chunks that have a store summary from those that didn't"""
+def check_if_summary_exists(
+    document_chunk_hybrid_search_result: list[dict],
+    tokenizer: tiktoken.core.Encoding,
+    summarize_min_tokens: int = 64,
+) -> dict:
+    """Conditional flag to separate chunks that have a store summary from those that didn't;
+    Chunks of at most `summarize_min_tokens` tokens skip the map step, their content is their summary
+    """
+    chunks_with_summary = [d for d in document_chunk_hybrid_search_result if d.get("summary")]
+    chunks_without_summary = []
+    candidates = [d for d in document_chunk_hybrid_search_result if not d.get("summary")]
+    encoded_contents = tokenizer.encode_batch([d["content"] for d in candidates], disallowed_special=())
+    for chunk, tokens in zip(candidates, encoded_contents):
+        if len(tokens) <= summarize_min_tokens:
+            chunks_with_summary.append(dict(chunk, summary=chunk["content"]))
+        else:
+            chunks_without_summary.append(chunk)
     return dict(
-        chunks_without_summary=[
-            d for d in document_chunk_hybrid_search_result if not d.get("summary")
-        ],
-        chunks_with_summary=[d for d in document_chunk_hybrid_search_result if d.get("summary")],
+        chunks_without_summary=chunks_without_summary,
+        chunks_with_summary=chunks_with_summary,
     )
 
 
-def chunk_without_summary(chunks_without_summary: list[dict]) -> Parallelizable[dict]:
-    """Iterate over chunks that didn't have a stored summary"""
-    for chunk in chunks_without_summary:
-        yield chunk
-
-
-@retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
 def _summarize_text__openai(prompt: str, summarize_model_name: str) -> str:
     """Use OpenAI chat API to ask a model to summarize content contained in a prompt"""
-    response = openai.ChatCompletion.create(
-        model=summarize_model_name, messages=[{"role": "user", "content": prompt}], temperature=0
-    )
-    return response["choices"][0]["message"]["content"]
+    client = openai_io.openai_client()
+    return client.run(client.chat_completion(prompt, summarize_model_name))
 
 
 def prompt_to_summarize_chunk() -> str:
@@ -123,36 +339,144 @@ def prompt_to_summarize_chunk() -> str:
     return f"Write a brief bulleted summary of this content.\n\nContent:{{content}}"  # noqa: F541
 
 
-def chunk_with_new_summary(
-    chunk_without_summary: dict,
+def chunk_with_new_summary_collection(
+    chunks_without_summary: list[dict],
     prompt_to_summarize_chunk: str,
     summarize_model_name: str,
-) -> dict:
-    """Fill a base prompt with a chunk's content and summarize it;
-    Store the summary in the chunk object
+) -> list[dict]:
+    """Fill a base prompt with the content of each chunk that didn't have a stored summary,
+    and summarize them all with concurrent OpenAI requests;
+    Store each summary in a copy of its chunk object
     """
-    filled_prompt = prompt_to_summarize_chunk.format(content=chunk_without_summary["content"])
-    new_chunk = dict(**chunk_without_summary)
-    new_chunk["summary"] = _summarize_text__openai(filled_prompt, summarize_model_name)
-    return new_chunk
+    client = openai_io.openai_client()
+    summaries = client.run(
+        client.chat_completions(
+            [prompt_to_summarize_chunk.format(content=chunk["content"]) for chunk in chunks_without_summary],
+            summarize_model_name,
+        )
+    )
+    return [dict(chunk, summary=summary) for chunk, summary in zip(chunks_without_summary, summaries)]
 
 
-def store_chunk_summary(
+def _weaviate_chunks(weaviate_client: weaviate.Client, where: dict | None, page_size: int) -> Iterator[dict]:
+    """Iterate over the `Chunk` objects of a document with `where`, paged with an offset up to
+    `WEAVIATE_MAX_RESULTS`, or over all of them with the cursor API, which can't be combined with a filter
+    """
+    after = None
+    offset = 0
+    while True:
+        query = (
+            weaviate_client.query
+            .get("Chunk", ["content", "summary"])
+            .with_additional("id")
+        )
+        if where is not None:
+            limit = min(page_size, WEAVIATE_MAX_RESULTS - offset)
+            query = query.with_where(where).with_offset(offset).with_limit(limit)
+        else:
+            limit = page_size
+            query = query.with_limit(limit)
+            if after is not None:
+                query = query.with_after(after)
+        with instrumentation.weaviate_request("chunks"):
+            page = query.do()["data"]["Get"]["Chunk"]
+        yield from page
+        if len(page) < limit:
+            return
+        if where is not None:
+            offset += len(page)
+            if offset >= WEAVIATE_MAX_RESULTS:
+                logger.warning(
+                    "Stopped at %d chunks matching %s, the most Weaviate returns for a filter; "
+                    "any further chunks are skipped",
+                    WEAVIATE_MAX_RESULTS,
+                    where,
+                )
+                return
+        else:
+            after = page[-1]["_additional"]["id"]
+
+
+@config.when_not(vector_store="local")
+def chunks_missing_summary__weaviate(
     weaviate_client: weaviate.Client,
-    chunk_with_new_summary: dict,
-) -> dict:
-    """Store in Weaviate the recently computed summary for chunks that previously didn't have one."""
-    updated_chunk_object = dict(
-        chunk_index=chunk_with_new_summary["chunk_index"],
-        content=chunk_with_new_summary["content"],
-        summary=chunk_with_new_summary["summary"],
-    )
-    weaviate_client.data.update(
-        data_object=updated_chunk_object,
-        class_name="Chunk",
-        uuid=chunk_with_new_summary["id"],
-    )
-    return dict(updated_chunk_with_id=chunk_with_new_summary["id"])
+    summarize_document_ids: list[str] | None = None,
+    chunks_page_size: int = 1000,
+    document_schema: str = "references",
+) -> list[dict]:
+    """Chunks without a stored summary, of the documents `summarize_document_ids` or of all documents;
+    Chunks of a document are read with a filter on their reference, or on their `document_id`
+    with the `centroid` schema, up to `WEAVIATE_MAX_RESULTS` chunks per document
+    """
+    document_path = ["document_id"] if document_schema == "centroid" else ["fromDocument", "Document", "id"]
+    if summarize_document_ids is None:
+        chunks = _weaviate_chunks(weaviate_client, where=None, page_size=chunks_page_size)
+    else:
+        chunks = (
+            chunk
+            for document_id in summarize_document_ids
+            for chunk in _weaviate_chunks(
+                weaviate_client,
+                where={"path": document_path, "operator": "Equal", "valueText": document_id},
+                page_size=chunks_page_size,
+            )
+        )
+    return [
+        dict(chunk_id=chunk["_additional"]["id"], content=chunk["content"])
+        for chunk in chunks
+        if not chunk.get("summary")
+    ]
+
+
+@config.when(vector_store="local")
+def chunks_missing_summary__local(
+    local_store: LocalStore, summarize_document_ids: list[str] | None = None
+) -> list[dict]:
+    """Chunks of the local store without a summary, of the documents `summarize_document_ids` or of all documents"""
+    return local_store.chunks_without_summary(summarize_document_ids)
+
+
+@config.when_not(vector_store="local")
+def chunk_summary_writer__weaviate(weaviate_client: weaviate.Client) -> Callable[[str, str], None]:
+    """Function storing the summary of a chunk in Weaviate, for the background summarizer and write-back"""
+
+    def write(chunk_id: str, summary: str) -> None:
+        with instrumentation.weaviate_request("update_summary"):
+            weaviate_client.data_object.update(
+                data_object=dict(summary=summary), class_name="Chunk", uuid=chunk_id
+            )
+
+    return write
+
+
+@config.when(vector_store="local")
+def chunk_summary_writer__local(local_store: LocalStore) -> Callable[[str, str], None]:
+    """Function storing the summary of a chunk in the local store, for the background summarizer and write-back"""
+    return local_store.update_summary
+
+
+@functools.lru_cache
+def _summary_write_back() -> SummaryWriteBack:
+    """Process-wide write-back, so that summaries computed by concurrent queries are merged;
+    Queued summaries are written before the process exits
+    """
+    write_back = SummaryWriteBack()
+    atexit.register(write_back.flush, 30)
+    return write_back
+
+
+def store_chunk_summary(
+    chunk_with_new_summary_collection: list[dict],
+    corpus_id: str,
+    chunk_summary_writer: Callable[[str, str], None],
+) -> list[str]:
+    """Queue the summaries just computed to be stored in the background, so that later queries
+    find them; the query doesn't wait for the writes. Return the ids of the queued chunks
+    """
+    summaries = {chunk["chunk_id"]: chunk["summary"] for chunk in chunk_with_new_summary_collection}
+    if summaries:
+        _summary_write_back().submit(corpus_id, summaries, chunk_summary_writer)
+    return list(summaries)
 
 
 def prompt_to_reduce_summaries() -> str:
@@ -208,11 +532,6 @@ def prompt_to_reduce_summaries() -> str:
     Key points:\n{{chunks_summary}}\nSummary, Predictions, and Suggestions:\n"""  # noqa: F541
 
 
-def chunk_with_new_summary_collection(chunk_with_new_summary: Collect[dict]) -> list[dict]:
-    """Collect chunks for which a new summary was just computed"""
-    return chunk_with_new_summary
-
-
 def all_chunks(
     chunk_with_new_summary_collection: list[dict],
     chunks_with_summary: list[dict],
@@ -223,17 +542,53 @@ def all_chunks(
     return sorted_chunks
 
 
-def rag_summary(
+def _is_near_duplicate(tokens: set[int], kept: list[set[int]], similarity: float) -> bool:
+    """Whether the tokens of a summary overlap those of a kept summary by `similarity` (Jaccard)"""
+    return any(len(tokens & other) >= similarity * len(tokens | other) for other in kept)
+
+
+def reduce_prompt(
     rag_query: str,
     all_chunks: list[dict],
     prompt_to_reduce_summaries: str,
-    summarize_model_name: str,
+    tokenizer: tiktoken.core.Encoding,
+    reduce_prompt_max_tokens: int = 3000,
+    duplicate_summary_similarity: float = 0.9,
 ) -> str:
-    """Concatenate the list of chunk summaries into a single text,fill the prompt template,
-    and use OpenAI to reduce the content into a single summary;
+    """Concatenate chunk summaries into a single text and fill the prompt template, within a token budget;
+    Summaries are packed by relevance rank, then score, while the prompt fits `reduce_prompt_max_tokens`.
+    Near-duplicates of a packed summary are dropped, and so are summaries that don't fit
     """
-    concatenated_summaries = " ".join(chunk["summary"] for chunk in all_chunks)
-    filled_prompt = prompt_to_reduce_summaries.format(
-        query=rag_query, chunks_summary=concatenated_summaries
-    )
-    return _summarize_text__openai(filled_prompt, summarize_model_name)
+    template = prompt_to_reduce_summaries.format(query=rag_query, chunks_summary="")
+    template_tokens = len(tokenizer.encode(template, disallowed_special=()))
+    budget = reduce_prompt_max_tokens - template_tokens
+    chunks = sorted(all_chunks, key=lambda chunk: (chunk["rank"], -float(chunk.get("score") or 0)))
+    encoded_summaries = tokenizer.encode_batch([chunk["summary"] for chunk in chunks], disallowed_special=())
+
+    packed, kept_tokens = [], []
+    for chunk, tokens in zip(chunks, encoded_summaries):
+        # summaries are joined by a space, about one token
+        n_tokens = len(tokens) + 1
+        token_set = set(tokens)
+        if n_tokens > budget or _is_near_duplicate(token_set, kept_tokens, duplicate_summary_similarity):
+            continue
+        packed.append(chunk["summary"])
+        kept_tokens.append(token_set)
+        budget -= n_tokens
+
+    instrumentation.METRICS.inc("reduce_prompt_chunks_total", len(packed), result="packed")
+    instrumentation.METRICS.inc("reduce_prompt_chunks_total", len(chunks) - len(packed), result="dropped")
+    return prompt_to_reduce_summaries.format(query=rag_query, chunks_summary=" ".join(packed))
+
+
+def rag_summary(reduce_prompt: str, summarize_model_name: str) -> str:
+    """Use OpenAI to reduce the chunk summaries into a single summary"""
+    return _summarize_text__openai(reduce_prompt, summarize_model_name)
+
+
+def rag_summary_stream(reduce_prompt: str, summarize_model_name: str) -> Iterator[str]:
+    """Same as `rag_summary`, as an iterator over the text of the summary as it is generated;
+    The request is sent when iteration starts, and cancelled if the iterator is closed early
+    """
+    client = openai_io.openai_client()
+    return client.iterate(client.chat_completion_stream(reduce_prompt, summarize_model_name))
@@ -0,0 +1,120 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from backend import instrumentation, retrieval
+
+logger = logging.getLogger(__name__)
+
+
+class SummarizationJob:
+    """Progress of the chunks submitted together to a `ChunkSummarizer`"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        if total == 0:
+            self._finished.set()
+
+    def _chunk_finished(self, succeeded: bool) -> None:
+        with self._lock:
+            if succeeded:
+                self.done += 1
+            else:
+                self.failed += 1
+            if self.done + self.failed == self.total:
+                self._finished.set()
+
+    @property
+    def finished(self) -> bool:
+        return self._finished.is_set()
+
+    def progress(self) -> dict:
+        with self._lock:
+            return dict(
+                total=self.total,
+                done=self.done,
+                failed=self.failed,
+                pending=self.total - self.done - self.failed,
+                finished=self.finished,
+            )
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until every chunk of the job is summarized or failed; return False on timeout"""
+        return self._finished.wait(timeout)
+
+
+class ChunkSummarizer:
+    """Summarize chunks in the background on a bounded pool of OpenAI requests and write
+    each summary to the vector store as soon as it is ready, so that queries find it stored;
+    A chunk already waiting or being summarized is not submitted again.
+
+    `summarize_fn(content)` returns the summary of a chunk's content, by default with the
+    prompt and model of the `chunk_with_new_summary_collection` node
+    """
+
+    def __init__(
+        self,
+        summarize_fn: Callable[[str], str] | None = None,
+        summarize_model_name: str = "gpt-3.5-turbo-0613",
+        max_concurrent_requests: int = 4,
+    ):
+        self.summarize_fn = summarize_fn or (
+            lambda content: retrieval._summarize_text__openai(
+                retrieval.prompt_to_summarize_chunk().format(content=content), summarize_model_name
+            )
+        )
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_concurrent_requests, thread_name_prefix="chunk-summarizer"
+        )
+        self._lock = threading.Lock()
+        self._in_flight: set[str] = set()
+        self._jobs: list[SummarizationJob] = []
+
+    def submit(self, chunks: list[dict], write_fn: Callable[[str, str], None]) -> SummarizationJob:
+        """Queue chunks, dicts with `chunk_id` and `content`, for summarization;
+        `write_fn(chunk_id, summary)` stores a summary. Return the job tracking their progress
+        """
+        with self._lock:
+            new_chunks = [chunk for chunk in chunks if chunk["chunk_id"] not in self._in_flight]
+            self._in_flight.update(chunk["chunk_id"] for chunk in new_chunks)
+            job = SummarizationJob(total=len(new_chunks))
+            self._jobs = [active_job for active_job in self._jobs if not active_job.finished]
+            self._jobs.append(job)
+
+        for chunk in new_chunks:
+            self._pool.submit(self._summarize, chunk, write_fn, job)
+        return job
+
+    def _summarize(self, chunk: dict, write_fn: Callable[[str, str], None], job: SummarizationJob) -> None:
+        succeeded = False
+        try:
+            write_fn(chunk["chunk_id"], self.summarize_fn(chunk["content"]))
+            succeeded = True
+        except Exception:
+            logger.exception("Failed to summarize chunk %s", chunk["chunk_id"])
+        finally:
+            with self._lock:
+                self._in_flight.discard(chunk["chunk_id"])
+            job._chunk_finished(succeeded)
+            instrumentation.METRICS.inc(
+                "summarizer_chunks_total", result="done" if succeeded else "failed"
+            )
+
+    def progress(self) -> dict:
+        """Chunks submitted, summarized, failed and pending over the jobs still running;
+        finished jobs are dropped, so the totals don't grow over the lifetime of the summarizer
+        """
+        with self._lock:
+            self._jobs = [job for job in self._jobs if not job.finished]
+            jobs = list(self._jobs)
+        totals = dict(total=0, done=0, failed=0, pending=0)
+        for job in jobs:
+            for field, value in job.progress().items():
+                if field in totals:
+                    totals[field] += value
+        return dict(totals, finished=totals["pending"] == 0)
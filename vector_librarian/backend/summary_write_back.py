@@ -0,0 +1,95 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable
+
+from backend import instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+class SummaryWriteBack:
+    """Store chunk summaries computed by queries in the background, off their critical path;
+    Summaries queued while others are written are merged, one update per chunk with the
+    latest summary, and each round of updates runs on a bounded pool of concurrent requests.
+
+    Summaries are queued per `target`, e.g. the corpus id, with the function writing to it;
+    `write_fn(chunk_id, summary)` stores a single summary, e.g. the `chunk_summary_writer` node.
+    Weaviate has no batch update: a batch import replaces objects, with their vector and references
+    """
+
+    def __init__(self, max_concurrent_requests: int = 8, linger_seconds: float = 0.2):
+        self.linger_seconds = linger_seconds
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_concurrent_requests, thread_name_prefix="summary-write-back"
+        )
+        self._pending: dict[str, dict[str, str]] = {}
+        self._write_fns: dict[str, Callable[[str, str], None]] = {}
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._dispatcher: threading.Thread | None = None
+        self.stats = dict(queued=0, merged=0, written=0, failed=0)
+
+    def submit(self, target: str, summaries: dict[str, str], write_fn: Callable[[str, str], None]) -> None:
+        """Queue summaries, by chunk id, to be written to `target` without waiting"""
+        with self._condition:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch_forever, name="summary-write-back", daemon=True
+                )
+                self._dispatcher.start()
+            pending = self._pending.setdefault(target, {})
+            self.stats["merged"] += len(summaries.keys() & pending.keys())
+            self.stats["queued"] += len(summaries)
+            pending.update(summaries)
+            self._write_fns[target] = write_fn
+            self._condition.notify_all()
+
+    def _dispatch_forever(self) -> None:
+        """Wait for queued summaries, linger so that concurrent queries can join, then write them"""
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                self._condition.wait(timeout=self.linger_seconds)
+                pending, self._pending = self._pending, {}
+                write_fns = dict(self._write_fns)
+                self._in_flight += sum(len(summaries) for summaries in pending.values())
+
+            futures = [
+                self._submit(write_fns[target], chunk_id, summary)
+                for target, summaries in pending.items()
+                for chunk_id, summary in summaries.items()
+            ]
+            # a chunk is written once per round, so later summaries of it don't race with this one
+            wait(futures)
+
+    def _submit(self, write_fn: Callable[[str, str], None], chunk_id: str, summary: str) -> Future:
+        try:
+            return self._pool.submit(self._write, write_fn, chunk_id, summary)
+        except RuntimeError:
+            # the interpreter is exiting and the pool takes no more work, write from this thread
+            future = Future()
+            self._write(write_fn, chunk_id, summary)
+            future.set_result(None)
+            return future
+
+    def _write(self, write_fn: Callable[[str, str], None], chunk_id: str, summary: str) -> None:
+        succeeded = False
+        try:
+            write_fn(chunk_id, summary)
+            succeeded = True
+        except Exception:
+            logger.exception("Failed to store the summary of chunk %s", chunk_id)
+        finally:
+            instrumentation.METRICS.inc(
+                "summary_write_back_total", result="written" if succeeded else "failed"
+            )
+            with self._condition:
+                self.stats["written" if succeeded else "failed"] += 1
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Block until every queued summary is written or failed; return False on timeout"""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and self._in_flight == 0, timeout)
@@ -1,23 +1,31 @@
 import weaviate
 
+from backend.connections import connection_manager
+
 
 def weaviate_client(
     weaviate_url: str,
     weaviate_api_key: str,
 ) -> weaviate.Client:
-    """Instantiate Weaviate client for the local instance based on the url"""
-    client = weaviate.Client(
-        url=weaviate_url, 
-        auth_client_secret=weaviate.AuthApiKey(api_key=weaviate_api_key),
-    )
-    if client.is_live() and client.is_ready():
-        return client
-    else:
-        raise ConnectionError("Error creating Weaviate client")
-
-
-def full_schema() -> dict:
-    return {
+    """Weaviate client for the instance at the url, shared by the process, see `ConnectionManager`;
+    Raise ConnectionError if the server is not ready
+    """
+    return connection_manager().weaviate_client(weaviate_url, weaviate_api_key)
+
+
+DOCUMENT_SCHEMAS = ("references", "centroid")
+
+
+def full_schema(document_schema: str = "references") -> dict:
+    """Schema of the Document and Chunk classes;
+    With `references`, Documents and Chunks reference each other and Weaviate computes the Document
+    vector from its chunks with `ref2vec-centroid`; with `centroid`, Chunks store the `document_id`
+    and `file_name` of their Document as plain properties and ingestion writes the Document vector
+    """
+    if document_schema not in DOCUMENT_SCHEMAS:
+        raise ValueError(f"Unknown document schema `{document_schema}`, expected one of {DOCUMENT_SCHEMAS}")
+
+    schema = {
         "classes": [
             {
                 "class": "Document",
@@ -32,9 +40,14 @@ def full_schema() -> dict:
                 },
                 "properties": [
                     {
-                        "name": "pdf_blob",
-                        "dataType": ["blob"],
-                        "description": "PDF file stored as base64 encoded blob",
+                        "name": "pdf_sha256",
+                        "dataType": ["text"],
+                        "description": "SHA-256 of the PDF file, its key in the local blob store",
+                    },
+                    {
+                        "name": "pdf_size",
+                        "dataType": ["int"],
+                        "description": "size of the PDF file in bytes",
                     },
                     {
                         "name": "file_name",
@@ -74,16 +87,86 @@ def full_schema() -> dict:
                         "dataType": ["text"],
                         "description": "LLM-generated summary of the text content of this chunk",
                     },
+                    {
+                        "name": "page_start",
+                        "dataType": ["int"],
+                        "description": "page of the source document where this chunk starts; starts at 0",
+                    },
+                    {
+                        "name": "page_end",
+                        "dataType": ["int"],
+                        "description": "page of the source document where this chunk ends; starts at 0",
+                    },
                 ],
             },
         ]
     }
+    if document_schema == "centroid":
+        document, chunk = schema["classes"]
+        document["vectorizer"] = "none"
+        del document["moduleConfig"]
+        document["properties"] = [p for p in document["properties"] if p["name"] != "containsChunk"]
+        chunk["properties"] = [
+            {
+                "name": "document_id",
+                "dataType": ["text"],
+                "tokenization": "field",
+                "description": "id of the Document containing this chunk",
+            },
+            {
+                "name": "file_name",
+                "dataType": ["text"],
+                "description": "file name of the Document containing this chunk",
+            },
+        ] + [p for p in chunk["properties"] if p["name"] != "fromDocument"]
+    return schema
+
+
+def _reference_properties(class_: dict) -> set[str]:
+    # the data type of a cross-reference is the name of a class, primitive types are lower case
+    return {property_["name"] for property_ in class_["properties"] if property_["dataType"][0][0].isupper()}
+
+
+def _check_compatible(existing: dict, class_: dict) -> None:
+    """Raise ValueError if a class of the instance was created for another document schema,
+    since its vectorizer and cross-references can't be migrated in place
+    """
+    mismatches = []
+    if existing.get("vectorizer") != class_["vectorizer"]:
+        mismatches.append(f"vectorizer `{existing.get('vectorizer')}` instead of `{class_['vectorizer']}`")
+    if _reference_properties(existing) != _reference_properties(class_):
+        mismatches.append(
+            f"references {sorted(_reference_properties(existing))} instead of {sorted(_reference_properties(class_))}"
+        )
+    if mismatches:
+        raise ValueError(
+            f"Class `{class_['class']}` of the Weaviate instance was created for another document schema: "
+            f"{', '.join(mismatches)}; reset the instance to change its document schema"
+        )
 
 
 def initialize_weaviate_instance(weaviate_client: weaviate.Client, full_schema: dict) -> dict:
-    """Initialize Weaviate by creating the class schema"""
+    """Initialize Weaviate by creating the classes of the schema that are missing, other classes
+    of the instance are left as they are; Properties added to the schema since the classes were created
+    are added to them. Raise ValueError, before any change, if existing classes were created for
+    another document schema, see `full_schema`
+    """
     if not weaviate_client.schema.contains(full_schema):
-        weaviate_client.schema.create(full_schema)
+        existing = {class_["class"]: class_ for class_ in weaviate_client.schema.get().get("classes", [])}
+        for class_ in full_schema["classes"]:
+            if class_["class"] in existing:
+                _check_compatible(existing[class_["class"]], class_)
+        missing = [class_ for class_ in full_schema["classes"] if class_["class"] not in existing]
+        if missing:
+            # creates all the classes before their cross-reference properties
+            weaviate_client.schema.create({"classes": missing})
+        for class_ in full_schema["classes"]:
+            if class_["class"] not in existing:
+                continue
+            property_names = {property_["name"] for property_ in existing[class_["class"]]["properties"]}
+            for property_ in class_["properties"]:
+                if property_["name"] not in property_names:
+                    weaviate_client.schema.property.create(class_["class"], property_)
 
     return {"schema_created": [class_["class"] for class_ in full_schema["classes"]]}
 
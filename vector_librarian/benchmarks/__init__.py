@@ -0,0 +1,3 @@
+"""Offline benchmarks for the ingestion and retrieval pipeline.
+Run them from the `vector_librarian/` directory, e.g. `python -m benchmarks.chunking`
+"""
@@ -0,0 +1,93 @@
+"""Compare the throughput of the linear chunker against the previous implementation,
+which decoded every candidate window while searching for the end of a sentence.
+
+    python -m benchmarks.chunking --pages 300 --max-token-length 500
+"""
+import argparse
+import random
+import time
+from typing import Generator
+
+import tiktoken
+
+from backend.ingestion import _create_chunks, _create_chunks_from_segments
+
+WORDS = (
+    "the model data learning results training inference deployment latency system "
+    "evaluation dataset retrieval vector embedding production pipeline monitoring"
+).split()
+
+
+def _create_chunks__legacy(
+    text: str, tokenizer: tiktoken.core.Encoding, max_length: int
+) -> Generator[list[int], None, None]:
+    """Previous implementation of `backend.ingestion._create_chunks`, kept as the baseline"""
+    tokens = tokenizer.encode(text)
+    i = 0
+    while i < len(tokens):
+        j = min(i + int(1.5 * max_length), len(tokens))
+        while j > i + int(0.5 * max_length):
+            chunk = tokenizer.decode(tokens[i:j])
+            if chunk.endswith(".") or chunk.endswith("\n"):
+                break
+            j -= 1
+        if j == i + int(0.5 * max_length):
+            j = min(i + max_length, len(tokens))
+        yield tokens[i:j]
+        i = j
+
+
+def synthetic_document(pages: int, sentence_length: int, seed: int = 0) -> str:
+    """Generate `pages` pages of ~500 words; `sentence_length` words between full stops,
+    0 for text without any sentence boundary (worst case of the legacy chunker)
+    """
+    rng = random.Random(seed)
+    words = []
+    for idx in range(pages * 500):
+        words.append(rng.choice(WORDS))
+        if sentence_length and (idx + 1) % sentence_length == 0:
+            words[-1] += "."
+    return " ".join(words)
+
+
+def _segments(text: str, n_segments: int, seed: int = 0) -> list[str]:
+    """Cut the text at random characters, e.g. in the middle of a word, like pages of a PDF"""
+    cuts = sorted(random.Random(seed).sample(range(1, len(text)), n_segments - 1))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+def _tokens_per_second(chunker, text: str, tokenizer, max_length: int) -> tuple[float, list]:
+    start = time.perf_counter()
+    chunks = list(chunker(text, tokenizer, max_length))
+    elapsed = time.perf_counter() - start
+    return sum(len(chunk) for chunk in chunks) / elapsed, chunks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--max-token-length", type=int, default=500)
+    parser.add_argument("--tokenizer-encoding", default="cl100k_base")
+    args = parser.parse_args()
+
+    tokenizer = tiktoken.get_encoding(args.tokenizer_encoding)
+    print(f"{'document':<24}{'tokens':>10}{'legacy tok/s':>16}{'linear tok/s':>16}{'speedup':>10}")
+    for label, sentence_length in [("short sentences", 12), ("long sentences", 400), ("no full stop", 0)]:
+        text = synthetic_document(args.pages, sentence_length)
+        legacy, legacy_chunks = _tokens_per_second(
+            _create_chunks__legacy, text, tokenizer, args.max_token_length
+        )
+        linear, linear_chunks = _tokens_per_second(
+            _create_chunks, text, tokenizer, args.max_token_length
+        )
+        assert legacy_chunks == linear_chunks, "chunkers disagree"
+        segmented_chunks = list(
+            _create_chunks_from_segments(_segments(text, args.pages), tokenizer, args.max_token_length)
+        )
+        assert legacy_chunks == segmented_chunks, "chunkers disagree on the text in segments"
+        n_tokens = sum(len(chunk) for chunk in linear_chunks)
+        print(f"{label:<24}{n_tokens:>10}{legacy:>16,.0f}{linear:>16,.0f}{linear / legacy:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
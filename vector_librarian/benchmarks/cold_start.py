@@ -0,0 +1,94 @@
+"""Report the import time and the rerun latency of each Streamlit page, before and after
+caching the driver and importing heavy dependencies lazily.
+
+    python -m benchmarks.cold_start --reruns 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+import client
+
+# modules imported by each page, and the driver settings it uses
+PAGES = {
+    "Information": (["client", "authentication"], dict()),
+    "1_Reader": (["client", "authentication"], dict()),
+    "2_Ingestion": (["arxiv", "client", "authentication"], dict(ingestion_mode="streaming")),
+    "3_Retrieval": (["pandas", "client", "authentication"], dict()),
+}
+# what importing `client` used to pull in eagerly
+EAGER_MODULES = [
+    "hamilton.driver",
+    "openai",
+    "weaviate",
+    "backend.arxiv_module",
+    "backend.ingestion",
+    "backend.retrieval",
+    "backend.vector_db",
+]
+
+_IMPORT_SNIPPET = """
+import json, time
+import streamlit
+start = time.perf_counter()
+{imports}
+print(json.dumps(time.perf_counter() - start))
+"""
+
+
+def _import_seconds(modules: list[str]) -> float:
+    """Import modules in a fresh interpreter where Streamlit is already loaded, as in the server"""
+    code = _IMPORT_SNIPPET.format(imports="\n".join(f"import {module}" for module in modules))
+    completed = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def _median_seconds(fn, repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=10)
+    args = parser.parse_args()
+
+    print(
+        f"{'page':<14}{'import before':>15}{'import after':>14}"
+        f"{'rerun before':>15}{'rerun after':>13}{'speedup':>10}"
+    )
+    for page, (modules, driver_kwargs) in PAGES.items():
+        import_before = _import_seconds(modules + EAGER_MODULES)
+        import_after = _import_seconds(modules)
+
+        # every rerun used to build a new driver, it is now built once per process
+        settings = dict(
+            ingestion_mode="batch",
+            max_documents_in_flight=4,
+            execution_strategy="thread",
+            node_groups=(),
+            vector_store="weaviate",
+            document_schema="references",
+        )
+        settings.update(driver_kwargs)
+        rerun_before = _median_seconds(lambda: client._build_driver.__wrapped__(**settings), args.reruns)
+        client.instantiate_driver(**driver_kwargs)
+        rerun_after = _median_seconds(lambda: client.instantiate_driver(**driver_kwargs), args.reruns)
+        print(
+            f"{page:<14}{import_before * 1000:>12.0f} ms{import_after * 1000:>11.0f} ms"
+            f"{rerun_before * 1000:>12.1f} ms{rerun_after * 1000:>10.3f} ms"
+            f"{rerun_before / rerun_after:>9.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
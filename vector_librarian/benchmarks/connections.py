@@ -0,0 +1,103 @@
+"""Measure the setup latency of Streamlit sessions connecting to Weaviate and OpenAI at the same time,
+and the sockets they keep open, with clients created and checked by each session or shared by the
+`ConnectionManager`.
+
+    python -m benchmarks.connections --users 1 10 50 --latency 0.05
+
+Weaviate and OpenAI are replaced by local mock servers answering after `--latency` seconds;
+sockets are counted from /proc/net/tcp, so this runs on Linux only.
+"""
+import argparse
+import gc
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import openai
+import weaviate
+
+from backend.connections import ConnectionManager
+from benchmarks.fakes import MockWeaviateServer, install_fake_openai
+
+WEAVIATE_API_KEY = "weaviate-key"
+
+
+def _open_sockets(ports: set[int]) -> int:
+    """Established connections of this machine to the ports, from the client side"""
+    n_sockets = 0
+    for path in ("/proc/net/tcp", "/proc/net/tcp6"):
+        with open(path) as lines:
+            next(lines)
+            for line in lines:
+                _, _, remote_address, state, *_ = line.split()
+                n_sockets += state == "01" and int(remote_address.rsplit(":", 1)[1], 16) in ports
+    return n_sockets
+
+
+def _connect_per_session(weaviate_url: str, openai_api_key: str) -> weaviate.Client:
+    """Connection of a session as done before the connection manager"""
+    client = weaviate.Client(url=weaviate_url, auth_client_secret=weaviate.AuthApiKey(api_key=WEAVIATE_API_KEY))
+    if not (client.is_live() and client.is_ready()):
+        raise ConnectionError("Weaviate server is not ready.")
+    openai.ChatCompletion.create(
+        model="gpt-3.5-turbo", messages=[dict(role="user", content="hello")], api_key=openai_api_key
+    )
+    return client
+
+
+def _run_sessions(n_users: int, connect) -> tuple[list[float], list]:
+    """Connect `n_users` sessions at once; return the setup seconds of each and their clients"""
+    barrier = threading.Barrier(n_users)
+
+    def session(user_idx: int) -> tuple[float, weaviate.Client]:
+        barrier.wait()
+        start = time.perf_counter()
+        client = connect()
+        return time.perf_counter() - start, client
+
+    with ThreadPoolExecutor(max_workers=n_users) as pool:
+        results = list(pool.map(session, range(n_users)))
+    return [seconds for seconds, _ in results], [client for _, client in results]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per request to the mock servers")
+    args = parser.parse_args()
+
+    openai_server = install_fake_openai(args.latency)
+    weaviate_server = MockWeaviateServer(args.latency)
+    ports = {openai_server.server_port, weaviate_server.server_port}
+
+    print(f"{'strategy':<14}{'users':>6}{'p50 (ms)':>12}{'p95 (ms)':>12}{'sockets':>10}{'requests':>10}")
+    for strategy in ("per-session", "pooled"):
+        for n_users in args.users:
+            if strategy == "pooled":
+                # a fresh manager, so the first session of the run creates and checks the clients
+                manager = ConnectionManager()
+
+                def connect():
+                    client = manager.weaviate_client(weaviate_server.url, WEAVIATE_API_KEY)
+                    manager.validate_openai_key(openai.api_key)
+                    return client
+            else:
+
+                def connect():
+                    return _connect_per_session(weaviate_server.url, openai.api_key)
+
+            gc.collect()
+            sockets_before = _open_sockets(ports)
+            requests_before = openai_server.n_requests + weaviate_server.n_requests
+            durations, clients = _run_sessions(n_users, connect)
+            # the sessions keep their clients, and the connections of these clients
+            sockets = _open_sockets(ports) - sockets_before
+            requests = openai_server.n_requests + weaviate_server.n_requests - requests_before
+            p50, p95 = np.percentile(durations, [50, 95]) * 1000
+            print(f"{strategy:<14}{n_users:>6}{p50:>12.1f}{p95:>12.1f}{sockets:>10}{requests:>10}")
+            del clients
+
+
+if __name__ == "__main__":
+    main()
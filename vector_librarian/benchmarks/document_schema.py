@@ -0,0 +1,106 @@
+"""Compare the ingestion throughput and hybrid search latency of the two document schemas of
+`vector_db.full_schema`: chunks and documents referencing each other, with a `ref2vec-centroid`
+Document vector, or chunks storing the document id and file name, with a Document vector computed at ingestion.
+
+    python -m benchmarks.document_schema --documents 50 --chunks 100 --queries 200
+    python -m benchmarks.document_schema --weaviate-url http://localhost:8080
+
+By default Weaviate is replaced by the in-memory fake of `benchmarks.fakes`, answering each request
+after `--latency` seconds. With `--weaviate-url`, ALL the data of that instance is deleted.
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+import weaviate
+
+from backend import ingestion, retrieval, vector_db
+from benchmarks.fakes import FakeWeaviateClient
+
+# synthetic vocabulary with Zipf-distributed frequencies, like the words of real text
+VOCABULARY = [f"w{idx}" for idx in range(20_000)]
+FREQUENCIES = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+
+def _text(rng: random.Random, n_words: int) -> str:
+    return " ".join(rng.choices(VOCABULARY, weights=FREQUENCIES, k=n_words))
+
+
+def _documents(n_documents: int, n_chunks: int, dimensions: int) -> list[dict]:
+    """Embedded documents, as collected by `pdf_collection`, with random unit vectors"""
+    words = random.Random(0)
+    rng = np.random.default_rng(0)
+    documents = []
+    for document_idx in range(n_documents):
+        embeddings = rng.standard_normal((n_chunks, dimensions), dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        documents.append(
+            dict(
+                pdf_sha256=f"{document_idx:064x}",
+                pdf_size=0,
+                file_name=f"document_{document_idx}.pdf",
+                chunked_text=[_text(words, 100) for _ in range(n_chunks)],
+                chunk_pages=[(chunk_idx // 2, chunk_idx // 2) for chunk_idx in range(n_chunks)],
+                chunked_embeddings=embeddings,
+            )
+        )
+    return documents
+
+
+def _client(args: argparse.Namespace, document_schema: str) -> weaviate.Client | FakeWeaviateClient:
+    """An empty Weaviate instance with the classes of the schema"""
+    if args.weaviate_url is None:
+        return FakeWeaviateClient(latency=args.latency)
+
+    auth = weaviate.AuthApiKey(api_key=args.weaviate_api_key) if args.weaviate_api_key else None
+    client = weaviate.Client(url=args.weaviate_url, auth_client_secret=auth)
+    vector_db.reset_weaviate_storage(client)
+    vector_db.initialize_weaviate_instance(client, vector_db.full_schema(document_schema))
+    return client
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=100, help="chunks per document")
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds per request to the fake Weaviate")
+    parser.add_argument("--weaviate-url", default=None)
+    parser.add_argument("--weaviate-api-key", default=None)
+    args = parser.parse_args()
+
+    documents = _documents(args.documents, args.chunks, args.dimensions)
+    n_objects = args.documents * (args.chunks + 1)
+    words = random.Random(1)
+    queries = [_text(words, 6) for _ in range(args.queries)]
+    query_vectors = np.random.default_rng(1).standard_normal((args.queries, args.dimensions), dtype=np.float32)
+
+    print(f"{'schema':<12}{'operations':>12}{'objects/s':>12}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+    for document_schema in vector_db.DOCUMENT_SCHEMAS:
+        client = _client(args, document_schema)
+        # every chunk adds two references to the batch with the `references` schema
+        n_operations = n_objects + (2 * args.documents * args.chunks if document_schema == "references" else 0)
+
+        start = time.perf_counter()
+        ingestion.store_documents__batch(
+            client, documents, batch_size=args.batch_size, document_schema=document_schema
+        )
+        objects_per_second = n_objects / (time.perf_counter() - start)
+
+        durations = []
+        for query, query_vector in zip(queries, query_vectors):
+            start = time.perf_counter()
+            retrieval.document_chunk_hybrid_search_result__weaviate(
+                client, query, query_vector, retrieve_top_k=args.top_k, document_schema=document_schema
+            )
+            durations.append(time.perf_counter() - start)
+        p50, p95 = np.percentile(durations, [50, 95]) * 1000
+        print(f"{document_schema:<12}{n_operations:>12}{objects_per_second:>12.0f}{p50:>12.3f}{p95:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Compare the execution strategies of `Parallelizable` branches: ingest N synthetic PDFs
+with OpenAI replaced by a fake answering after a fixed latency; then time the map step
+summarizing K chunks, whose requests are concurrent whatever the strategy.
+
+    python -m benchmarks.executors --pdfs 16 --chunks 32 --workers 8 --latency 0.2
+"""
+import argparse
+import tempfile
+import time
+
+from hamilton import driver
+
+from backend import arxiv_module, execution, ingestion, retrieval, vector_db
+from benchmarks.chunking import synthetic_document
+from benchmarks.fakes import install_fake_openai, synthetic_pdf
+
+
+def _driver(strategy: str, workers: int) -> driver.Driver:
+    # process workers receive the OpenAI settings of this process, pointing at its mock server
+    executor = execution.task_executor(strategy, workers)
+    return (
+        driver.Builder()
+        .enable_dynamic_execution(allow_experimental_mode=True)
+        .with_modules(arxiv_module, ingestion, retrieval, vector_db)
+        .with_execution_manager(execution.NodeGroupExecutionManager(default_executor=executor))
+        .build()
+    )
+
+
+def _ingest_seconds(dr: driver.Driver, pdf_paths: list[str], data_dir: str, strategy: str) -> float:
+    start = time.perf_counter()
+    dr.execute(
+        ["pdf_collection"],
+        inputs=dict(
+            embedding_model_name="text-embedding-ada-002",
+            embedding_cache_path=f"{data_dir}/embedding_cache.sqlite",
+            blob_store_dir=f"{data_dir}/blobs",
+            # process workers already run in parallel, don't give each its own extraction pool
+            pdf_extraction_workers=1 if strategy == "process" else 4,
+        ),
+        overrides=dict(pdf_files_to_ingest=pdf_paths),
+    )
+    return time.perf_counter() - start
+
+
+def _summarize_seconds(dr: driver.Driver, chunks: list[dict]) -> float:
+    start = time.perf_counter()
+    dr.execute(
+        ["chunk_with_new_summary_collection"],
+        inputs=dict(summarize_model_name="gpt-3.5-turbo-1106"),
+        overrides=dict(chunks_without_summary=chunks),
+    )
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdfs", type=int, default=16)
+    parser.add_argument("--pages", type=int, default=12)
+    parser.add_argument("--chunks", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per OpenAI request")
+    args = parser.parse_args()
+
+    install_fake_openai(args.latency)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_paths = []
+        for idx in range(args.pdfs):
+            pdf_paths.append(f"{tmp_dir}/document_{idx}.pdf")
+            with open(pdf_paths[-1], "wb") as f:
+                f.write(synthetic_pdf(args.pages, seed=idx))
+        chunks = [
+            dict(content=synthetic_document(1, sentence_length=12, seed=idx), rank=idx)
+            for idx in range(args.chunks)
+        ]
+
+        print(f"{'strategy':<14}{'ingest (s)':>12}{'speedup':>10}")
+        baseline = None
+        for strategy in execution.EXECUTION_STRATEGIES[::-1]:
+            dr = _driver(strategy, args.workers)
+            # warm up, so that all process workers are started before timing the steady state
+            _ingest_seconds(dr, pdf_paths[: args.workers], f"{tmp_dir}/warmup-{strategy}", strategy)
+            # a fresh embedding cache per strategy, otherwise only the first one calls OpenAI
+            ingest = _ingest_seconds(dr, pdf_paths, f"{tmp_dir}/{strategy}", strategy)
+            baseline = baseline or ingest
+            print(f"{strategy:<14}{ingest:>12.2f}{baseline / ingest:>9.1f}x")
+
+        summarize = _summarize_seconds(dr, chunks)
+        print(
+            f"map step: {args.chunks} chunks summarized in {summarize:.2f}s"
+            f" ({args.chunks * args.latency / summarize:.1f}x faster than sequential requests)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+"""Deterministic local stand-ins for OpenAI, served over HTTP, and Weaviate, in memory or served
+over HTTP for its health endpoints, with a configurable latency per request, and a generator of
+synthetic PDF files
+"""
+import hashlib
+import http.server
+import json
+import threading
+import time
+
+import numpy as np
+import openai
+
+from benchmarks.chunking import synthetic_document
+
+
+def synthetic_pdf(pages: int, seed: int = 0) -> bytes:
+    """Minimal PDF with `pages` pages of synthetic text, written with the Helvetica base font"""
+    words = synthetic_document(pages, sentence_length=12, seed=seed).split()
+    words_per_page = len(words) // pages
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{4 + 2 * idx} 0 R" for idx in range(pages)), pages
+        ),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for idx in range(pages):
+        page_words = words[idx * words_per_page : (idx + 1) * words_per_page]
+        lines = [" ".join(page_words[start : start + 12]) for start in range(0, len(page_words), 12)]
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842]"
+            f" /Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * idx} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return pdf
+
+
+def _fake_embedding(text: str, dimensions: int) -> list[float]:
+    """Unit vector derived from the text, so equal texts get equal embeddings"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def _embeddings_response(payload: dict, dimensions: int) -> dict:
+    texts = payload["input"]
+    return dict(
+        data=[
+            dict(index=idx, embedding=_fake_embedding(text, dimensions)) for idx, text in enumerate(texts)
+        ],
+        usage=dict(prompt_tokens=sum(len(text.split()) for text in texts)),
+    )
+
+
+def _chat_completion_response(payload: dict) -> dict:
+    prompt = payload["messages"][-1]["content"]
+    content = "- " + prompt[-80:]
+    return dict(
+        choices=[dict(message=dict(role="assistant", content=content))],
+        usage=dict(prompt_tokens=len(prompt.split()), completion_tokens=len(content.split())),
+    )
+
+
+def _send_json(handler: http.server.BaseHTTPRequestHandler, response: dict) -> None:
+    body = json.dumps(response).encode()
+    handler.send_response(200)
+    handler.send_header("Content-Type", "application/json")
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+class _MockOpenAIHandler(http.server.BaseHTTPRequestHandler):
+    # keep-alive, so that clients can reuse their connections
+    protocol_version = "HTTP/1.1"
+    server: "MockOpenAIServer"
+
+    def do_POST(self) -> None:
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.n_requests += 1
+        time.sleep(self.server.latency)
+        if self.path.endswith("/embeddings"):
+            response = _embeddings_response(payload, self.server.dimensions)
+        elif self.path.endswith("/chat/completions") and payload.get("stream"):
+            self._stream(_chat_completion_response(payload)["choices"][0]["message"]["content"])
+            return
+        elif self.path.endswith("/chat/completions"):
+            response = _chat_completion_response(payload)
+        else:
+            self.send_error(404)
+            return
+        _send_json(self, response)
+
+    def do_GET(self) -> None:
+        self.server.n_requests += 1
+        time.sleep(self.server.latency)
+        if self.path.endswith("/models"):
+            _send_json(self, dict(object="list", data=[dict(id="gpt-3.5-turbo", object="model")]))
+        else:
+            self.send_error(404)
+
+    def _stream(self, content: str) -> None:
+        """Send the answer word by word as server-sent events, `latency` seconds apart in total"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        words = content.split(" ")
+        for idx, word in enumerate(words):
+            token = word if idx == 0 else f" {word}"
+            event = dict(choices=[dict(delta=dict(content=token))])
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.server.latency / len(words))
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class MockOpenAIServer(http.server.ThreadingHTTPServer):
+    """Local HTTP server answering the OpenAI embeddings and chat completions endpoints with
+    deterministic fakes, after sleeping `latency` seconds per request; serves from a background thread
+    """
+
+    daemon_threads = True
+    # concurrent clients open many connections at once
+    request_queue_size = 256
+
+    def __init__(self, latency: float = 0.0, dimensions: int = 1536):
+        super().__init__(("127.0.0.1", 0), _MockOpenAIHandler)
+        self.latency = latency
+        self.dimensions = dimensions
+        self.n_requests = 0
+        threading.Thread(target=self.serve_forever, name="mock-openai", daemon=True).start()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/v1"
+
+
+_mock_openai_server: MockOpenAIServer | None = None
+
+
+def install_fake_openai(latency: float, dimensions: int = 1536) -> MockOpenAIServer:
+    """Point the OpenAI requests of the pipeline at a `MockOpenAIServer` of this process;
+    Also usable as initializer of process workers, which each start their own server
+    """
+    global _mock_openai_server
+    if _mock_openai_server is None:
+        _mock_openai_server = MockOpenAIServer(latency, dimensions)
+    _mock_openai_server.latency = latency
+    _mock_openai_server.dimensions = dimensions
+    openai.api_base = _mock_openai_server.base_url
+    openai.api_key = "sk-fake"
+    return _mock_openai_server
+
+
+class _FakeBatch:
+    def __init__(self, client: "FakeWeaviateClient"):
+        self._client = client
+        self.batch_size = 100
+        self._pending: list[tuple[str, dict]] = []
+
+    def configure(self, batch_size: int = 100, dynamic: bool = False, **kwargs) -> "_FakeBatch":
+        self.batch_size = batch_size
+        return self
+
+    def __enter__(self) -> "_FakeBatch":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.flush()
+
+    def _add(self, kind: str, item: dict) -> None:
+        self._pending.append((kind, item))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def add_data_object(
+        self, data_object: dict, class_name: str, uuid: str, vector: list[float] | None = None
+    ) -> None:
+        self._add("object", dict(class_name=class_name, properties=data_object, uuid=uuid, vector=vector))
+
+    def add_reference(self, **reference) -> None:
+        self._add("reference", reference)
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        self._client._request()
+        for kind, item in self._pending:
+            if kind == "object":
+                self._client.objects[item["uuid"]] = item
+            else:
+                self._client.references.append(item)
+        self._pending = []
+
+
+class _FakeQuery:
+    """Fluent query builder answering `Get` queries from the objects of the fake client"""
+
+    def __init__(self, client: "FakeWeaviateClient"):
+        self._client = client
+        self._class_name = None
+        self._properties = []
+        self._where = None
+        self._limit = None
+        self._offset = 0
+        self._after = None
+
+    def get(self, class_name: str, properties: list[str]) -> "_FakeQuery":
+        self._class_name = class_name
+        self._properties = properties
+        return self
+
+    def with_where(self, where: dict) -> "_FakeQuery":
+        self._where = where
+        return self
+
+    def with_limit(self, limit: int) -> "_FakeQuery":
+        self._limit = limit
+        return self
+
+    def with_offset(self, offset: int) -> "_FakeQuery":
+        self._offset = offset
+        return self
+
+    def with_after(self, uuid: str) -> "_FakeQuery":
+        self._after = uuid
+        return self
+
+    def with_hybrid(self, **kwargs) -> "_FakeQuery":
+        return self
+
+    def with_additional(self, properties) -> "_FakeQuery":
+        return self
+
+    def _matches(self, uuid: str, properties: dict, chunk_documents: dict[str, str]) -> bool:
+        if self._after is not None and uuid <= self._after:
+            return False
+        if self._where is None:
+            return True
+        operands = self._where.get("operands", [self._where])
+        return any(
+            # a filter on the id of the referenced document, e.g. ["fromDocument", "Document", "id"]
+            chunk_documents.get(uuid) == operand["valueText"]
+            if operand["path"][-1] == "id"
+            else properties.get(operand["path"][0]) == operand["valueText"]
+            for operand in operands
+        )
+
+    def do(self) -> dict:
+        self._client._request()
+        documents = {
+            uuid: obj for uuid, obj in self._client.objects.items() if obj["class_name"] == "Document"
+        }
+        # like Weaviate, references are only resolved when they are filtered on or requested
+        resolve_documents = any(property_.startswith("fromDocument") for property_ in self._properties)
+        filter_documents = self._where is not None and any(
+            operand["path"][-1] == "id" for operand in self._where.get("operands", [self._where])
+        )
+        chunk_documents = self._client.chunk_documents if resolve_documents or filter_documents else {}
+        results = []
+        # objects are listed by uuid, like the cursor API
+        for uuid, obj in sorted(self._client.objects.items()):
+            if obj["class_name"] != self._class_name or not self._matches(uuid, obj["properties"], chunk_documents):
+                continue
+            result = dict(obj["properties"], _additional=dict(id=uuid, score=str(1 / (len(results) + 1))))
+            if self._class_name == "Chunk":
+                result.setdefault("summary", None)
+            if self._class_name == "Chunk" and resolve_documents:
+                document_uuid = chunk_documents.get(uuid)
+                document = documents.get(document_uuid, dict(properties=dict(file_name=None)))
+                result["fromDocument"] = [
+                    dict(file_name=document["properties"]["file_name"], _additional=dict(id=document_uuid))
+                ]
+            results.append(result)
+            if self._limit is not None and len(results) == self._offset + self._limit:
+                break
+        return dict(data=dict(Get={self._class_name: results[self._offset:]}))
+
+
+class _FakeDataObject:
+    def __init__(self, client: "FakeWeaviateClient"):
+        self._client = client
+
+    def get(self, class_name: str, uuid: str) -> dict:
+        self._client._request()
+        return dict(id=uuid, properties=self._client.objects[uuid]["properties"])
+
+    def update(self, data_object: dict, class_name: str, uuid: str) -> None:
+        self._client._request()
+        self._client.objects[uuid]["properties"].update(data_object)
+
+
+class FakeWeaviateClient:
+    """In-memory stand-in for the parts of `weaviate.Client` used by the pipeline;
+    Every request (query, object read or write, batch flush) sleeps `latency` seconds
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.n_requests = 0
+        self.objects: dict[str, dict] = {}
+        self.references: list[dict] = []
+        self.batch = _FakeBatch(self)
+        self.data_object = _FakeDataObject(self)
+        self.data = self.data_object
+
+    @property
+    def query(self) -> _FakeQuery:
+        return _FakeQuery(self)
+
+    @property
+    def chunk_documents(self) -> dict[str, str]:
+        return {
+            reference["from_object_uuid"]: reference["to_object_uuid"]
+            for reference in self.references
+            if reference["from_property_name"] == "fromDocument"
+        }
+
+    def _request(self) -> None:
+        self.n_requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class _MockWeaviateHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "MockWeaviateServer"
+
+    def do_GET(self) -> None:
+        self.server.n_requests += 1
+        time.sleep(self.server.latency)
+        if self.path == "/v1/meta":
+            _send_json(self, dict(version="1.21.2", modules={}))
+        elif self.path in ("/v1/.well-known/live", "/v1/.well-known/ready"):
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self.send_error(404)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class MockWeaviateServer(http.server.ThreadingHTTPServer):
+    """Local HTTP server answering the endpoints requested to connect a `weaviate.Client`,
+    meta and health, after sleeping `latency` seconds per request; serves from a background thread
+    """
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(("127.0.0.1", 0), _MockWeaviateHandler)
+        self.latency = latency
+        self.n_requests = 0
+        threading.Thread(target=self.serve_forever, name="mock-weaviate", daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
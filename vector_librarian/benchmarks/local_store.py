@@ -0,0 +1,72 @@
+"""Measure the hybrid search latency of the local store for corpora of increasing size.
+
+    python -m benchmarks.local_store --chunks 1000 10000 50000 --queries 200
+"""
+import argparse
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from backend.local_store import LocalStore
+
+# synthetic vocabulary with Zipf-distributed frequencies, like the words of real text
+VOCABULARY = [f"w{idx}" for idx in range(20_000)]
+FREQUENCIES = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+
+def _text(rng: random.Random, n_words: int) -> str:
+    return " ".join(rng.choices(VOCABULARY, weights=FREQUENCIES, k=n_words))
+
+
+def _fill(store: LocalStore, n_chunks: int, dimensions: int, rng: np.random.Generator) -> None:
+    """Add synthetic documents of 100 chunks of 100 words with random vectors"""
+    words = random.Random(0)
+    for document_idx in range(0, n_chunks, 100):
+        chunks = [
+            dict(
+                id=f"{document_idx}-{chunk_idx}",
+                chunk_index=chunk_idx,
+                content=_text(words, 100),
+            )
+            for chunk_idx in range(min(100, n_chunks - document_idx))
+        ]
+        store.add_document(
+            document_id=str(document_idx),
+            document=dict(pdf_sha256=str(document_idx), pdf_size=0, file_name=f"document_{document_idx}"),
+            chunks=chunks,
+            vectors=rng.standard_normal((len(chunks), dimensions), dtype=np.float32),
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    words = random.Random(1)
+    print(f"{'chunks':>8}{'alpha':>8}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+    for n_chunks in args.chunks:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            _fill(LocalStore(tmp_dir), n_chunks, args.dimensions, rng)
+            # reopen, so vectors are read through a fresh memory map as after a restart
+            store = LocalStore(tmp_dir)
+            for alpha in (0.0, 0.5, 1.0):
+                durations = []
+                for _ in range(args.queries):
+                    query = _text(words, 6)
+                    query_vector = rng.standard_normal(args.dimensions, dtype=np.float32)
+                    start = time.perf_counter()
+                    store.hybrid_search(query, query_vector, alpha=alpha, limit=args.top_k)
+                    durations.append(time.perf_counter() - start)
+                p50, p95 = np.percentile(durations, [50, 95]) * 1000
+                print(f"{n_chunks:>8}{alpha:>8.2f}{p50:>12.3f}{p95:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Measure each ingestion and retrieval stage offline, on synthetic and fixture PDFs of several sizes,
+with OpenAI and Weaviate replaced by deterministic fakes answering after a fixed latency.
+Report the throughput, peak RSS and allocations of each stage as JSON.
+
+    python -m benchmarks.stages --pages 4 32 128 --fixtures ./pdfs --latency 0.05 --output stages.json
+
+Every stage calls the Hamilton node functions directly, with their upstream values computed
+beforehand, and runs in its own process so that its peak RSS isn't shadowed by previous stages.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+from backend import ingestion, pdf_extraction, retrieval
+from backend.blob_store import BlobStore
+from backend.embedding_cache import EmbeddingCache
+from benchmarks.fakes import FakeWeaviateClient, install_fake_openai, synthetic_pdf
+
+EMBEDDING_MODEL_NAME = "text-embedding-ada-002"
+
+
+def _inputs(pdf: bytes, settings: dict, tmp_dir: str) -> dict:
+    """Upstream values of all stages for one PDF, computed once and outside of the measurements"""
+    pdf_content = io.BytesIO(pdf)
+    pdf_pages = ingestion.pdf_pages(pdf_content, pdf_extraction_workers=settings["pdf_extraction_workers"])
+    tokenizer = ingestion.tokenizer()
+    chunks = ingestion.text_chunks(pdf_pages, "benchmark", tokenizer, settings["max_token_length"])
+    chunked_text = chunks["chunked_text"]
+    chunked_embeddings = ingestion.chunked_embeddings(
+        chunked_text,
+        tokenizer,
+        EMBEDDING_MODEL_NAME,
+        EmbeddingCache(f"{tmp_dir}/inputs_embedding_cache.sqlite"),
+    )
+    pdf_sha256 = ingestion.pdf_sha256(pdf_content)
+    pdf_embedded = ingestion.pdf_embedded(
+        pdf_content,
+        pdf_sha256,
+        BlobStore(f"{tmp_dir}/inputs_blobs"),
+        "document",
+        chunked_text,
+        chunks["chunk_pages"],
+        chunked_embeddings,
+    )
+    # the ingested document stands in for the corpus of the retrieval stages
+    weaviate_client = FakeWeaviateClient()
+    ingestion.store_documents__batch(weaviate_client, [pdf_embedded])
+    search_result = retrieval.document_chunk_hybrid_search_result__weaviate(
+        weaviate_client, "query", chunked_embeddings[0], retrieve_top_k=len(chunked_text)
+    )
+    # half of the chunks already have a summary, as after a few queries
+    for chunk in search_result[::2]:
+        chunk["summary"] = chunk["content"][:200]
+    return dict(
+        pdf_content=pdf_content,
+        pdf_pages=pdf_pages,
+        tokenizer=tokenizer,
+        chunked_text=chunked_text,
+        pdf_sha256=pdf_sha256,
+        pdf_embedded=pdf_embedded,
+        weaviate_client=weaviate_client,
+        search_result=search_result,
+    )
+
+
+# each stage takes the inputs, the settings and a fresh directory; it returns the call to measure
+# and the amount of work it does, as (count, unit)
+def _raw_text(inputs: dict, settings: dict, run_dir: str) -> tuple[Callable, int, str]:
+    def run():
+        pdf_pages = ingestion.pdf_pages(
+            inputs["pdf_content"], pdf_extraction_workers=settings["pdf_extraction_workers"]
+        )
+        return ingestion.raw_text(pdf_pages)
+
+    return run, len(list(inputs["pdf_pages"])), "pages"
+
+
+def _chunked_text(inputs: dict, settings: dict, run_dir: str) -> tuple[Callable, int, str]:
+    def run():
+        return ingestion.text_chunks(
+            inputs["pdf_pages"], "benchmark", inputs["tokenizer"], settings["max_token_length"]
+        )
+
+    n_tokens = sum(len(tokens) for tokens in inputs["tokenizer"].encode_batch(inputs["chunked_text"]))
+    return run, n_tokens, "tokens"
+
+
+def _chunked_embeddings(inputs: dict, settings: dict, run_dir: str) -> tuple[Callable, int, str]:
+    # an empty cache, so that every chunk is sent to the fake OpenAI
+    cache = EmbeddingCache(f"{run_dir}/embedding_cache.sqlite")
+
+    def run():
+        return ingestion.chunked_embeddings(
+            inputs["chunked_text"], inputs["tokenizer"], EMBEDDING_MODEL_NAME, cache
+        )
+
+    return run, len(inputs["chunked_text"]), "chunks"
+
+
+def _pdf_embedded(inputs: dict, settings: dict, run_dir: str) -> tuple[Callable, int, str]:
+    blob_store = BlobStore(f"{run_dir}/blobs")
+    chunked_embeddings = inputs["pdf_embedded"]["chunked_embeddings"]
+
+    def run():
+        return ingestion.pdf_embedded(
+            inputs["pdf_content"],
+            inputs["pdf_sha256"],
+            blob_store,
+            "document",
+            inputs["chunked_text"],
+            inputs["pdf_embedded"]["chunk_pages"],
+            chunked_embeddings,
+        )
+
+    return run, inputs["pdf_content"].getbuffer().nbytes, "bytes"
+
+
+def _store_documents(inputs: dict, settings: dict, run_dir: str) -> tuple[Callable, int, str]:
+    weaviate_client = FakeWeaviateClient(latency=settings["latency"])
+
+    def run():
+        ingestion.store_documents__batch(weaviate_client, [inputs["pdf_embedded"]], settings["batch_size"])
+
+    # a Document, and for each chunk the Chunk object and two references
+    return run, 1 + 3 * len(inputs["chunked_text"]), "objects"
+
+
+def _hybrid_search(inputs: dict, settings: dict, run_dir: str) -> tuple[Callable, int, str]:
+    weaviate_client = inputs["weaviate_client"]
+    weaviate_client.latency = settings["latency"]
+    query_embedding = inputs["pdf_embedded"]["chunked_embeddings"][0]
+
+    def run():
+        return retrieval.document_chunk_hybrid_search_result__weaviate(
+            weaviate_client, "query", query_embedding, retrieve_top_k=settings["top_k"]
+        )
+
+    return run, min(settings["top_k"], len(inputs["chunked_text"])), "chunks"
+
+
+def _check_if_summary_exists(inputs: dict, settings: dict, run_dir: str) -> tuple[Callable, int, str]:
+    def run():
+        split = retrieval.check_if_summary_exists(inputs["search_result"], inputs["tokenizer"])
+        return retrieval.all_chunks(split["chunks_without_summary"], split["chunks_with_summary"])
+
+    return run, len(inputs["search_result"]), "chunks"
+
+
+def _reduce_prompt(inputs: dict, settings: dict, run_dir: str) -> tuple[Callable, int, str]:
+    # every chunk with a summary, as after the map step
+    all_chunks = [dict(chunk, summary=chunk["summary"] or chunk["content"]) for chunk in inputs["search_result"]]
+
+    def run():
+        return retrieval.reduce_prompt(
+            "query",
+            all_chunks,
+            retrieval.prompt_to_reduce_summaries(),
+            inputs["tokenizer"],
+            reduce_prompt_max_tokens=settings["reduce_prompt_max_tokens"],
+        )
+
+    return run, len(all_chunks), "chunks"
+
+
+STAGES = {
+    "raw_text": _raw_text,
+    "chunked_text": _chunked_text,
+    "chunked_embeddings": _chunked_embeddings,
+    "pdf_embedded": _pdf_embedded,
+    "store_documents": _store_documents,
+    "document_chunk_hybrid_search_result": _hybrid_search,
+    "check_if_summary_exists+all_chunks": _check_if_summary_exists,
+    "reduce_prompt": _reduce_prompt,
+}
+
+
+def _peak_rss_bytes() -> int:
+    # kilobytes on Linux, bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def _measure(stage: str, document: str, pdf: bytes, settings: dict) -> dict:
+    """Run one stage on one PDF, in a worker process; the first repetition is a warm-up"""
+    install_fake_openai(settings["latency"], settings["dimensions"])
+    try:
+        return _measure_stage(stage, document, pdf, settings)
+    finally:
+        # the worker process waits for its children before exiting, stop the extraction workers
+        pdf_extraction._shutdown_extraction_pools()
+
+
+def _measure_stage(stage: str, document: str, pdf: bytes, settings: dict) -> dict:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        inputs = _inputs(pdf, settings, tmp_dir)
+        rss_before = _peak_rss_bytes()
+
+        durations = []
+        for repetition in range(settings["repeat"] + 1):
+            run, count, unit = STAGES[stage](inputs, settings, f"{tmp_dir}/run_{repetition}")
+            start = time.perf_counter()
+            run()
+            durations.append(time.perf_counter() - start)
+        seconds = statistics.median(durations[1:])
+        peak_rss = _peak_rss_bytes()
+
+        # allocations are traced in a separate repetition, tracing slows down the stage
+        run, count, unit = STAGES[stage](inputs, settings, f"{tmp_dir}/traced")
+        tracemalloc.start()
+        snapshot_before = tracemalloc.take_snapshot()
+        run()
+        snapshot_after = tracemalloc.take_snapshot()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        allocated = [
+            stat for stat in snapshot_after.compare_to(snapshot_before, "lineno") if stat.size_diff > 0
+        ]
+
+    return dict(
+        stage=stage,
+        document=document,
+        pdf_bytes=len(pdf),
+        count=count,
+        unit=unit,
+        seconds=seconds,
+        throughput=count / seconds,
+        peak_rss_bytes=peak_rss,
+        peak_rss_growth_bytes=peak_rss - rss_before,
+        traced_peak_bytes=traced_peak,
+        retained_bytes=sum(stat.size_diff for stat in allocated),
+        retained_blocks=sum(stat.count_diff for stat in allocated),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[4, 32, 128], help="sizes of synthetic PDFs")
+    parser.add_argument("--fixtures", type=Path, help="directory of PDF files to measure as well")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per OpenAI or Weaviate request")
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--max-token-length", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--reduce-prompt-max-tokens", type=int, default=3000)
+    parser.add_argument("--pdf-extraction-workers", type=int, default=4)
+    parser.add_argument("--output", type=Path, help="write the JSON report to a file instead of stdout")
+    args = parser.parse_args()
+
+    settings = dict(
+        repeat=args.repeat,
+        latency=args.latency,
+        dimensions=args.dimensions,
+        max_token_length=args.max_token_length,
+        batch_size=args.batch_size,
+        top_k=args.top_k,
+        reduce_prompt_max_tokens=args.reduce_prompt_max_tokens,
+        pdf_extraction_workers=args.pdf_extraction_workers,
+    )
+    documents = {f"synthetic_{pages}_pages": synthetic_pdf(pages) for pages in args.pages}
+    if args.fixtures:
+        documents.update((path.name, path.read_bytes()) for path in sorted(args.fixtures.glob("*.pdf")))
+
+    results = []
+    for document, pdf in documents.items():
+        for stage in args.stages:
+            # a fresh process per stage, so that peak RSS and import state are not shared
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                result = pool.submit(_measure, stage, document, pdf, settings).result()
+            print(
+                f"{document:<28}{stage:<40}{result['throughput']:>14,.0f} {result['unit']}/s",
+                file=sys.stderr,
+            )
+            results.append(result)
+
+    report = json.dumps(dict(settings=settings, results=results), indent=2)
+    if args.output:
+        args.output.write_text(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
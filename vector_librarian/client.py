@@ -1,21 +1,192 @@
+from __future__ import annotations
 
-from hamilton import driver
-from streamlit.runtime.uploaded_file_manager import UploadedFile
-import weaviate
+import base64
+import contextlib
+import contextvars
+import functools
+import io
+import json
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, ContextManager, Iterator
 
-from backend import ingestion, retrieval, vector_db, arxiv_module
+# Hamilton, the backend modules and their dependencies (openai, weaviate, pypdf, tiktoken...)
+# are imported when the driver is first built, so pages importing `client` render quickly
+if TYPE_CHECKING:
+    import numpy as np
+    import weaviate
+    from hamilton import driver
+    from streamlit.runtime.uploaded_file_manager import UploadedFile
 
+    from backend.answer_cache import AnswerCache
+    from backend.byte_cache import ByteLRUCache
+    from backend.bulk_query import SharedSummaries
+    from backend.instrumentation import Trace
+    from backend.summarizer import ChunkSummarizer, SummarizationJob
+
+_driver_lock = threading.Lock()
+
+
+def instantiate_driver(
+    ingestion_mode: str = "batch",
+    max_documents_in_flight: int = 4,
+    execution_strategy: str = "thread",
+    node_groups: dict[str, tuple[str, int]] | None = None,
+    vector_store: str = "weaviate",
+    document_schema: str = "references",
+) -> driver.Driver:
+    """Get the Hamilton Driver for these settings, built once per process and
+    shared by all Streamlit sessions and reruns;
+    Branches of `Parallelizable` nodes run with `execution_strategy` ("thread", "process" or
+    "synchronous") on `max_documents_in_flight` workers, and `node_groups` routes the branches
+    of specific nodes to their own (strategy, workers), e.g. `{"pdf_file": ("process", 8)}`.
+    With `ingestion_mode="streaming"`, each document is stored as soon as it is embedded, from
+    inside its "pdf_file" branch, so these branches can't use the "process" strategy.
+    With `vector_store="local"`, documents are stored and searched in an in-process store
+    under `./data/local_store` instead of Weaviate.
+    With `document_schema="centroid"`, chunks store their document id and file name as properties
+    instead of references, and the Document vector is computed at ingestion, see `vector_db.full_schema`;
+    a Weaviate instance must be reset to change its schema.
+    Every node is timed by an `InstrumentationAdapter`, see `last_trace` and `metrics_text`
+    """
+    with _driver_lock:
+        return _build_driver(
+            ingestion_mode,
+            max_documents_in_flight,
+            execution_strategy,
+            tuple(sorted((node_groups or {}).items())),
+            vector_store,
+            document_schema,
+        )
+
+
+@functools.lru_cache
+def _build_driver(
+    ingestion_mode: str,
+    max_documents_in_flight: int,
+    execution_strategy: str,
+    node_groups: tuple[tuple[str, tuple[str, int]], ...],
+    vector_store: str,
+    document_schema: str,
+) -> driver.Driver:
+    from hamilton import driver
+
+    from backend import arxiv_module, execution, ingestion, instrumentation, retrieval, vector_db
 
-def instantiate_driver() -> driver.Driver:
-    """Instantiate a Hamilton Driver"""
     return (
         driver.Builder()
         .enable_dynamic_execution(allow_experimental_mode=True)
         .with_modules(arxiv_module, ingestion, retrieval, vector_db)
+        .with_config(
+            dict(ingestion_mode=ingestion_mode, vector_store=vector_store, document_schema=document_schema)
+        )
+        .with_adapter(instrumentation.InstrumentationAdapter())
+        .with_execution_manager(
+            execution.execution_manager(
+                strategy=execution_strategy,
+                max_workers=max_documents_in_flight,
+                node_groups=dict(node_groups),
+            )
+        )
         .build()
     )
 
 
+def _warm_up() -> None:
+    for ingestion_mode in ("batch", "streaming"):
+        instantiate_driver(ingestion_mode=ingestion_mode)
+    if metrics_port := os.environ.get("METRICS_PORT"):
+        from backend import instrumentation
+
+        instrumentation.serve_metrics(int(metrics_port))
+    # best effort: an error loading the encoding surfaces again on first use
+    with contextlib.suppress(Exception):
+        instantiate_driver().execute(["tokenizer"])
+
+
+@functools.lru_cache
+def warm_up() -> threading.Thread:
+    """Build the drivers used by the pages and load the tokenizer in a background thread;
+    Every page calls it, only the first call of the server process starts the thread.
+    With the environment variable `METRICS_PORT`, metrics and traces are served on that port
+    """
+    thread = threading.Thread(target=_warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def _trace(name: str) -> ContextManager[Trace]:
+    from backend import instrumentation
+
+    return instrumentation.trace(name)
+
+
+def last_trace() -> Trace | None:
+    """Trace of the last client call made from this thread, with the time spent in each node,
+    `Parallelizable` branch, OpenAI and Weaviate request
+    """
+    from backend import instrumentation
+
+    return instrumentation.last_trace()
+
+
+def metrics_text() -> str:
+    """Metrics of all client calls of this process, in the Prometheus text format"""
+    from backend import instrumentation
+
+    return instrumentation.METRICS.to_prometheus()
+
+
+# cosine similarity of query embeddings above which the cached answer of a query is served for another:
+# paraphrases of a question, rarely different questions
+ANSWER_SIMILARITY_THRESHOLD = 0.97
+
+
+@functools.lru_cache
+def _answer_cache() -> AnswerCache:
+    """Answers of `rag_summary`, shared by all sessions of the server process"""
+    from backend.answer_cache import AnswerCache
+
+    return AnswerCache()
+
+
+def answer_cache_stats() -> dict:
+    """Hits, misses, hit rate and number of entries of the answer cache"""
+    return _answer_cache().stats()
+
+
+@functools.lru_cache
+def _summarizer() -> ChunkSummarizer:
+    """Background summarizer shared by all sessions of the server process"""
+    from backend.summarizer import ChunkSummarizer
+
+    return ChunkSummarizer()
+
+
+def summarize_chunks(
+    dr: driver.Driver, weaviate_client: weaviate.Client, document_ids: list[str] | None = None
+) -> SummarizationJob:
+    """Summarize in the background the chunks without summary of `document_ids`, or of all
+    documents to catch up on a corpus ingested without summaries; summaries are stored as soon
+    as they are ready, so that `rag_summary` finds them instead of calling OpenAI for each chunk.
+    Return the job tracking the progress of these chunks
+    """
+    inputs = dict() if document_ids is None else dict(summarize_document_ids=document_ids)
+    with _trace("summarize_chunks"):
+        results = dr.execute(
+            ["chunks_missing_summary", "chunk_summary_writer"],
+            inputs=inputs,
+            overrides=dict(weaviate_client=weaviate_client),
+        )
+    return _summarizer().submit(results["chunks_missing_summary"], results["chunk_summary_writer"])
+
+
+def summarization_progress() -> dict:
+    """Chunks submitted, summarized, failed and pending in the jobs still running in the background summarizer"""
+    return _summarizer().progress()
+
+
 def initialize(dr: driver.Driver, weaviate_client: weaviate.Client) -> None:
     """Initialize the Weaviate instance by creating classes"""
     dr.execute(
@@ -24,34 +195,70 @@ def initialize(dr: driver.Driver, weaviate_client: weaviate.Client) -> None:
     )
 
 
-def store_arxiv(dr: driver.Driver, weaviate_client: weaviate.Client, arxiv_ids: list[str]) -> None:
+def _store_documents(
+    dr: driver.Driver, weaviate_client: weaviate.Client, inputs: dict, overrides: dict, summarize: bool = False
+) -> None:
+    """Select the PDF files that aren't stored yet, then ingest only those and add them to the document catalog;
+    The run is skipped when there is nothing new, because Hamilton cannot
+    expand a `Parallelizable` node over an empty list.
+    With `summarize`, the chunks of the stored documents are then summarized in the background
+    """
+    overrides = dict(weaviate_client=weaviate_client, **overrides)
+    with _trace("store_documents"):
+        pdf_files_to_ingest = dr.execute(["pdf_files_to_ingest"], inputs=inputs, overrides=overrides)[
+            "pdf_files_to_ingest"
+        ]
+        if not pdf_files_to_ingest:
+            return
+
+        stored = dr.execute(
+            ["store_documents", "stored_document_ids", "cataloged_document_ids"],
+            inputs=inputs,
+            overrides=dict(pdf_files_to_ingest=pdf_files_to_ingest, **overrides),
+        )
+
+    if summarize:
+        summarize_chunks(dr, weaviate_client, document_ids=stored["stored_document_ids"])
+
+
+def store_arxiv(
+    dr: driver.Driver, weaviate_client: weaviate.Client, arxiv_ids: list[str], summarize: bool = False
+) -> None:
     """Retrieve PDF files of arxiv articles for arxiv_ids
     Read the PDF as text, create chunks, and embed them using OpenAI API
     Store chunks with embeddings in Weaviate.
+    With `summarize`, chunks are then summarized in the background, see `summarization_progress`
     """
-    dr.execute(
-        ["store_documents"],
+    _store_documents(
+        dr,
+        weaviate_client,
         inputs=dict(
             arxiv_ids=arxiv_ids,
             embedding_model_name="text-embedding-ada-002",
             data_dir="./data",
         ),
-        overrides=dict(weaviate_client=weaviate_client)
+        overrides=dict(),
+        summarize=summarize,
     )
 
 
-def store_pdfs(dr: driver.Driver, weaviate_client: weaviate.Client, pdf_files: list[UploadedFile]) -> None:
+def store_pdfs(
+    dr: driver.Driver, weaviate_client: weaviate.Client, pdf_files: list[UploadedFile], summarize: bool = False
+) -> None:
     """For each PDF file, read as text, create chunks, and embed them using OpenAI API
     Store chunks with embeddings in Weaviate.
+    With `summarize`, chunks are then summarized in the background, see `summarization_progress`
     """
-    dr.execute(
-        ["store_documents"],
+    _store_documents(
+        dr,
+        weaviate_client,
         inputs=dict(
             arxiv_ids=[],
             embedding_model_name="text-embedding-ada-002",
             data_dir="",
         ),
-        overrides=dict(local_pdfs=pdf_files, weaviate_client=weaviate_client)
+        overrides=dict(local_pdfs=pdf_files),
+        summarize=summarize,
     )
 
 
@@ -61,32 +268,333 @@ def rag_summary(
     rag_query: str,
     hybrid_search_alpha: float,
     retrieve_top_k: int,
+    use_answer_cache: bool = True,
+    answer_similarity_threshold: float | None = ANSWER_SIMILARITY_THRESHOLD,
 ):
     """Retrieve most relevant chunks stored in Weaviate using hybrid search
     Generate text summaries using ChatGPT for each chunk
     Concatenate all chunk summaries into a single query, and reduce into a
-    final summary
+    final summary; new chunk summaries are stored in the background for the next queries.
+    The query is embedded first: the answer to the same query, or to a query whose embedding has
+    a cosine similarity of at least `answer_similarity_threshold` (None for the same query only),
+    made with the same settings on the same version of the corpus is returned from the answer cache,
+    see `AnswerCache`
     """
-    return dr.execute(
-        ["rag_summary", "all_chunks"],
-        inputs=dict(
+    inputs = dict(
+        rag_query=rag_query,
+        hybrid_search_alpha=hybrid_search_alpha,
+        retrieve_top_k=retrieve_top_k,
+        embedding_model_name="text-embedding-ada-002",
+        summarize_model_name="gpt-3.5-turbo-0613",
+    )
+    overrides = dict(weaviate_client=weaviate_client)
+    with _trace("rag_summary"):
+        query = dr.execute(
+            ["query_embedding", "corpus_id", "corpus_version"], inputs=inputs, overrides=overrides
+        )
+        cache_key = dict(
             rag_query=rag_query,
+            query_vector=query["query_embedding"],
+            corpus_id=query["corpus_id"],
+            corpus_version=query["corpus_version"],
             hybrid_search_alpha=hybrid_search_alpha,
             retrieve_top_k=retrieve_top_k,
-            embedding_model_name="text-embedding-ada-002",
-            summarize_model_name="gpt-3.5-turbo-0613",
+        )
+        answer_cache = _answer_cache()
+        if (
+            use_answer_cache
+            and (answer := answer_cache.get(**cache_key, similarity_threshold=answer_similarity_threshold)) is not None
+        ):
+            return answer
+
+        results = dr.execute(
+            ["rag_summary", "all_chunks", "store_chunk_summary"],
+            inputs=inputs,
+            overrides=dict(query_embedding=query["query_embedding"], corpus_id=query["corpus_id"], **overrides),
+        )
+        answer = dict(rag_summary=results["rag_summary"], all_chunks=results["all_chunks"])
+        answer_cache.put(**cache_key, answer=answer)
+        return answer
+
+
+def rag_summary_stream(
+    dr: driver.Driver,
+    weaviate_client: weaviate.Client,
+    rag_query: str,
+    hybrid_search_alpha: float,
+    retrieve_top_k: int,
+    use_answer_cache: bool = True,
+    answer_similarity_threshold: float | None = ANSWER_SIMILARITY_THRESHOLD,
+) -> dict:
+    """Same as `rag_summary`, except that the final summary is streamed: `rag_summary` is an
+    iterator over its text as it is generated, and `all_chunks` is available right away;
+    The answer is stored in the answer cache once the iterator is exhausted, and the call is
+    traced until then. The time to the first piece of text is measured from the start of the call
+    """
+    from backend import instrumentation
+
+    inputs = dict(
+        rag_query=rag_query,
+        hybrid_search_alpha=hybrid_search_alpha,
+        retrieve_top_k=retrieve_top_k,
+        embedding_model_name="text-embedding-ada-002",
+        summarize_model_name="gpt-3.5-turbo-0613",
+    )
+    overrides = dict(weaviate_client=weaviate_client)
+    start = time.perf_counter()
+    # the trace stays open while the caller consumes the summary
+    trace_context = contextlib.ExitStack()
+    trace_context.enter_context(_trace("rag_summary_stream"))
+    try:
+        query = dr.execute(
+            ["query_embedding", "corpus_id", "corpus_version"], inputs=inputs, overrides=overrides
+        )
+        cache_key = dict(
+            rag_query=rag_query,
+            query_vector=query["query_embedding"],
+            corpus_id=query["corpus_id"],
+            corpus_version=query["corpus_version"],
+            hybrid_search_alpha=hybrid_search_alpha,
+            retrieve_top_k=retrieve_top_k,
+        )
+        answer_cache = _answer_cache()
+        cached = (
+            answer_cache.get(**cache_key, similarity_threshold=answer_similarity_threshold)
+            if use_answer_cache
+            else None
+        )
+        if cached is None:
+            results = dr.execute(
+                ["rag_summary_stream", "all_chunks", "store_chunk_summary"],
+                inputs=inputs,
+                overrides=dict(
+                    query_embedding=query["query_embedding"], corpus_id=query["corpus_id"], **overrides
+                ),
+            )
+            tokens, all_chunks = results["rag_summary_stream"], results["all_chunks"]
+        else:
+            tokens, all_chunks = iter([cached["rag_summary"]]), cached["all_chunks"]
+    except BaseException:
+        trace_context.close()
+        raise
+
+    def summary_stream() -> Iterator[str]:
+        with trace_context:
+            text = []
+            for token in tokens:
+                if not text:
+                    instrumentation.METRICS.observe(
+                        "rag_summary_time_to_first_token_seconds", time.perf_counter() - start
+                    )
+                text.append(token)
+                yield token
+            if cached is None:
+                answer = dict(rag_summary="".join(text), all_chunks=all_chunks)
+                answer_cache.put(**cache_key, answer=answer)
+
+    return dict(rag_summary=summary_stream(), all_chunks=all_chunks)
+
+
+def _bulk_answer(
+    dr: driver.Driver, inputs: dict, overrides: dict, query_vector: np.ndarray, shared: SharedSummaries
+) -> dict:
+    """Answer one query of a bulk run; the map step only summarizes the chunks that
+    no other query of the run has claimed, and reuses the summaries of the others
+    """
+    overrides = dict(query_embedding=query_vector, **overrides)
+    search = dr.execute(
+        ["document_chunk_hybrid_search_result", "chunks_without_summary"], inputs=inputs, overrides=overrides
+    )
+    owned, waiting = shared.claim(search["chunks_without_summary"])
+    summarized = []
+    if owned:
+        try:
+            summarized = dr.execute(
+                ["chunk_with_new_summary_collection", "store_chunk_summary"],
+                inputs=inputs,
+                overrides=dict(chunks_without_summary=owned, **overrides),
+            )["chunk_with_new_summary_collection"]
+        except BaseException as e:
+            shared.resolve(owned, None, error=e)
+            raise
+        shared.resolve(owned, summarized)
+
+    # chunks claimed by other queries keep the rank they have for this one
+    rank_by_id = {chunk["chunk_id"]: chunk for chunk in search["chunks_without_summary"]}
+    summarized = summarized + [
+        dict(rank_by_id[chunk_id], summary=future.result()) for chunk_id, future in waiting.items()
+    ]
+    results = dr.execute(
+        ["rag_summary", "all_chunks"],
+        inputs=inputs,
+        overrides=dict(
+            document_chunk_hybrid_search_result=search["document_chunk_hybrid_search_result"],
+            chunk_with_new_summary_collection=summarized,
+            **overrides,
         ),
-        overrides=dict(weaviate_client=weaviate_client)
     )
+    return dict(rag_summary=results["rag_summary"], all_chunks=results["all_chunks"])
 
 
-def all_documents(dr: driver.Driver, weaviate_client: weaviate.Client):
-    """Retrieve the file names of all stored PDFs in the Weaviate instance"""
-    return dr.execute(
-        ["all_documents_file_name"],
-        overrides=dict(weaviate_client=weaviate_client)
+def bulk_rag_summary(
+    dr: driver.Driver,
+    weaviate_client: weaviate.Client,
+    queries_path: str,
+    output_path: str,
+    hybrid_search_alpha: float,
+    retrieve_top_k: int,
+    max_concurrent_queries: int = 8,
+    use_answer_cache: bool = True,
+    answer_similarity_threshold: float | None = ANSWER_SIMILARITY_THRESHOLD,
+    on_result: Callable[[dict, int, int], None] | None = None,
+) -> dict:
+    """Answer every query of a CSV or JSONL file like `rag_summary`, see `bulk_query.read_queries`;
+    The queries are embedded together, then `max_concurrent_queries` are searched and answered
+    at a time. A chunk retrieved by several queries is summarized once for all of them.
+    Each answer is appended to the JSONL file `output_path` as soon as it is ready, in completion
+    order, with the `id` and `query` it answers, or the `error` that prevented it; `on_result`
+    is called with each of them, the number of queries done and the total, e.g. to show progress.
+    Return a throughput report of the run
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    from backend import instrumentation
+    from backend.bulk_query import SharedSummaries, read_queries
+
+    queries = read_queries(queries_path)
+    inputs = dict(
+        hybrid_search_alpha=hybrid_search_alpha,
+        retrieve_top_k=retrieve_top_k,
+        embedding_model_name="text-embedding-ada-002",
+        summarize_model_name="gpt-3.5-turbo-0613",
+    )
+    overrides = dict(weaviate_client=weaviate_client)
+    answer_cache = _answer_cache()
+    shared = SharedSummaries()
+    report = dict(queries=len(queries), answered=0, cached=0, failed=0)
+    start = time.perf_counter()
+
+    def answer(query: dict, query_vector: np.ndarray, corpus_id: str, corpus_version: str) -> dict:
+        query_start = time.perf_counter()
+        cache_key = dict(
+            rag_query=query["query"],
+            query_vector=query_vector,
+            corpus_id=corpus_id,
+            corpus_version=corpus_version,
+            hybrid_search_alpha=hybrid_search_alpha,
+            retrieve_top_k=retrieve_top_k,
+        )
+        cached = (
+            answer_cache.get(**cache_key, similarity_threshold=answer_similarity_threshold)
+            if use_answer_cache
+            else None
+        )
+        if cached is None:
+            result = _bulk_answer(
+                dr,
+                inputs=dict(rag_query=query["query"], **inputs),
+                overrides=dict(corpus_id=corpus_id, **overrides),
+                query_vector=query_vector,
+                shared=shared,
+            )
+            answer_cache.put(**cache_key, answer=result)
+        else:
+            result = cached
+        return dict(query, **result, cached=cached is not None, seconds=time.perf_counter() - query_start)
+
+    with _trace("bulk_rag_summary"), open(output_path, "w", encoding="utf-8") as output:
+        if queries:
+            embedded = dr.execute(
+                ["query_embeddings", "corpus_id", "corpus_version"],
+                inputs=dict(rag_queries=[query["query"] for query in queries], **inputs),
+                overrides=overrides,
+            )
+            with ThreadPoolExecutor(max_workers=max_concurrent_queries, thread_name_prefix="bulk-query") as pool:
+                # each query runs in a copy of this context, so that it is part of the trace
+                futures = {
+                    pool.submit(
+                        contextvars.copy_context().run,
+                        answer,
+                        query,
+                        vector,
+                        embedded["corpus_id"],
+                        embedded["corpus_version"],
+                    ): query
+                    for query, vector in zip(queries, embedded["query_embeddings"])
+                }
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                        report["cached" if result["cached"] else "answered"] += 1
+                    except Exception as e:
+                        result = dict(futures[future], error=f"{type(e).__name__}: {e}")
+                        report["failed"] += 1
+                    output.write(json.dumps(result, default=float) + "\n")
+                    output.flush()
+                    instrumentation.METRICS.inc(
+                        "bulk_queries_total", result="failed" if "error" in result else "answered"
+                    )
+                    if on_result is not None:
+                        n_done = report["answered"] + report["cached"] + report["failed"]
+                        on_result(result, n_done, len(queries))
+
+    seconds = time.perf_counter() - start
+    return dict(
+        report,
+        seconds=seconds,
+        queries_per_second=len(queries) / seconds if seconds else 0.0,
+        chunks_summarized=shared.stats["summarized"],
+        chunk_summaries_shared=shared.stats["shared"],
+        output_path=str(output_path),
     )
 
+
+def all_documents(dr: driver.Driver, weaviate_client: weaviate.Client):
+    """Retrieve the file names of all stored PDFs in the Weaviate instance, page by page"""
+    with _trace("all_documents"):
+        return dr.execute(
+            ["all_documents_file_name"],
+            overrides=dict(weaviate_client=weaviate_client)
+        )
+
+
+def list_documents(
+    dr: driver.Driver, weaviate_client: weaviate.Client, after: str | None = None, limit: int = 100
+) -> dict:
+    """Retrieve a page of at most `limit` stored documents, ordered by id, with the cursor API;
+    Pass the `after` of a page to get the next one, it is None after the last page
+    """
+    with _trace("list_documents"):
+        return dr.execute(
+            ["document_listing_page"],
+            inputs=dict(documents_after=after, documents_page_size=limit),
+            overrides=dict(weaviate_client=weaviate_client),
+        )["document_listing_page"]
+
+
+def search_documents(
+    dr: driver.Driver,
+    weaviate_client: weaviate.Client,
+    name_query: str = "",
+    limit: int = 50,
+    resync: bool = False,
+) -> dict:
+    """Search stored documents by file name in the document catalog, without listing them all;
+    The catalog is filled from the vector store on first use, or with `resync`, e.g. after
+    documents were ingested by another server. Return the `documents` found and the `total`
+    """
+    with _trace("search_documents"):
+        return dr.execute(
+            ["searched_documents"],
+            inputs=dict(
+                document_name_query=name_query,
+                documents_search_limit=limit,
+                resync_document_catalog=resync,
+            ),
+            overrides=dict(weaviate_client=weaviate_client),
+        )["searched_documents"]
+
+
 def chatbot_interaction(dr: driver.Driver, user_input: str):
     """Interact with the chatbot using Hamilton (placeholder)"""
     # Replace this with your actual chatbot logic
@@ -99,8 +607,140 @@ def chatbot_interaction(dr: driver.Driver, user_input: str):
 
 def get_document_by_id(dr: driver.Driver, weaviate_client: weaviate.Client, document_id: str):
     """Retrieve a document stored in Weaviate based on its id"""
-    return dr.execute(
-        ["get_document_by_id"],
-        inputs=dict(document_id=document_id),
-        overrides=dict(weaviate_client=weaviate_client)
+    with _trace("get_document_by_id"):
+        return dr.execute(
+            ["get_document_by_id"],
+            inputs=dict(document_id=document_id),
+            overrides=dict(weaviate_client=weaviate_client)
+        )
+
+
+def document_pdf_base64(dr: driver.Driver, document: dict) -> str:
+    """Encode the PDF of a document returned by `get_document_by_id` as base64;
+    The file is memory-mapped from the blob store and encoded without an intermediate copy.
+    Raise BlobNotFoundError if the PDF was stored by another server
+    """
+    if document["pdf_blob"]:
+        return document["pdf_blob"]
+
+    blob_store = dr.execute(["blob_store"])["blob_store"]
+    with blob_store.open(document["pdf_sha256"]) as pdf_bytes:
+        return base64.b64encode(pdf_bytes).decode("utf-8")
+
+
+PDF_NOT_AVAILABLE = "PDF not available on this server: it was ingested by another server"
+
+
+@functools.lru_cache
+def _reader_cache() -> ByteLRUCache:
+    """Documents, PDFs and pages read by the Reader, shared by all sessions of the server process"""
+    from backend.byte_cache import ByteLRUCache
+
+    return ByteLRUCache()
+
+
+def reader_cache_stats() -> dict:
+    """Hits, misses, entries and size in bytes of the cache of the Reader"""
+    return _reader_cache().stats()
+
+
+def _cached_document(dr: driver.Driver, weaviate_client: weaviate.Client, document_id: str) -> dict:
+    # the id of a document is derived from the content and name of its file, it never goes stale
+    document = _reader_cache().get_or_put(
+        ("document", document_id),
+        lambda: json.dumps(
+            dr.execute(
+                ["get_document_by_id"],
+                inputs=dict(document_id=document_id),
+                overrides=dict(weaviate_client=weaviate_client),
+            )["get_document_by_id"]
+        ),
+    )
+    return json.loads(document)
+
+
+def read_documents(
+    dr: driver.Driver,
+    weaviate_client: weaviate.Client,
+    document_ids: list[str],
+    max_concurrent_reads: int = 4,
+) -> list[dict]:
+    """Fetch documents and encode their PDF as base64, `max_concurrent_reads` at a time, in the order
+    of `document_ids`; documents and PDFs are kept in a cache bounded in bytes, shared by all sessions,
+    so that reruns of the Reader don't fetch them again.
+    Return dicts with `document_id`, `file_name` and `pdf_base64`, None with an `error` message
+    if the PDF was stored on the local disk of another server
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from backend.blob_store import BlobNotFoundError
+
+    def read(document_id: str) -> dict:
+        document = _cached_document(dr, weaviate_client, document_id)
+        try:
+            pdf_base64 = _reader_cache().get_or_put(
+                ("pdf", document["pdf_sha256"] or document_id), lambda: document_pdf_base64(dr, document)
+            )
+        except BlobNotFoundError:
+            return dict(
+                document_id=document_id,
+                file_name=document["file_name"],
+                pdf_base64=None,
+                error=PDF_NOT_AVAILABLE,
+            )
+        return dict(document_id=document_id, file_name=document["file_name"], pdf_base64=pdf_base64)
+
+    with _trace("read_documents"), ThreadPoolExecutor(
+        max_workers=max_concurrent_reads, thread_name_prefix="reader"
+    ) as pool:
+        # each read runs in a copy of this context, so that it is part of the trace
+        futures = [
+            pool.submit(contextvars.copy_context().run, read, document_id) for document_id in document_ids
+        ]
+        return [future.result() for future in futures]
+
+
+def _document_page_range(
+    dr: driver.Driver, document: dict, first_page: int, last_page: int
+) -> tuple[bytes, int, int]:
+    from backend.pdf_extraction import pdf_page_range
+
+    if document["pdf_blob"]:
+        return pdf_page_range(io.BytesIO(base64.b64decode(document["pdf_blob"])), first_page, last_page)
+
+    blob_store = dr.execute(["blob_store"])["blob_store"]
+    with blob_store.open(document["pdf_sha256"]) as pdf_bytes:
+        return pdf_page_range(pdf_bytes, first_page, last_page)
+
+
+def read_document_pages(
+    dr: driver.Driver,
+    weaviate_client: weaviate.Client,
+    document_id: str,
+    page_start: int,
+    page_end: int,
+    context_pages: int = 1,
+) -> dict:
+    """Fetch the pages of a document around a chunk, from `context_pages` before `page_start` to
+    `context_pages` after `page_end`, as a PDF of their own encoded as base64, e.g. to open a citation;
+    Only these pages are read from the stored PDF, and they are kept in the cache of the Reader.
+    Return a dict with `document_id`, `file_name`, `pdf_base64`, the `first_page` and `last_page`
+    shown (from 0) and the `n_pages` of the document.
+    Raise BlobNotFoundError if the PDF was stored on the local disk of another server
+    """
+    first_page = max(page_start - context_pages, 0)
+    with _trace("read_document_pages"):
+        document = _cached_document(dr, weaviate_client, document_id)
+
+        def render() -> str:
+            pdf, last_page, n_pages = _document_page_range(dr, document, first_page, page_end + context_pages)
+            return json.dumps(
+                dict(pdf_base64=base64.b64encode(pdf).decode("utf-8"), last_page=last_page, n_pages=n_pages)
+            )
+
+        pages = _reader_cache().get_or_put(
+            ("pages", document["pdf_sha256"] or document_id, first_page, page_end + context_pages), render
+        )
+    return dict(
+        document_id=document_id, file_name=document["file_name"], first_page=first_page, **json.loads(pages)
     )
@@ -1,33 +1,74 @@
 import streamlit as st
 
 import client
-from authentication import openai_connection_status, weaviate_connection_status
+from authentication import (
+    citation_viewer,
+    embed_pdf,
+    execution_breakdown,
+    openai_connection_status,
+    weaviate_connection_status,
+)
 
 
-def document_selector(dr):
-    response = client.all_documents(
-        dr=dr,
-        weaviate_client=st.session_state.get("WEAVIATE_CLIENT")
+def document_selector(dr) -> list[dict]:
+    """Search documents by file name in the document catalog and select some to read;
+    Selected documents stay selectable when the search changes
+    """
+    weaviate_client = st.session_state.get("WEAVIATE_CLIENT")
+    left, right = st.columns([4, 1])
+    with left:
+        name_query = st.text_input("Search documents by file name")
+    with right:
+        resync = st.button("Refresh", help="List the documents of the vector store into the catalog again")
+
+    response = client.search_documents(
+        dr=dr, weaviate_client=weaviate_client, name_query=name_query, limit=50, resync=resync
+    )
+    selected = st.session_state.get("READER_SELECTION", [])
+    # the selected documents are always among the options, and options are document ids, so that a
+    # selected document matches its option even when the search returns it with other fields, e.g. after a refresh
+    options = {document["document_id"]: document for document in selected + response["documents"]}
+    st.caption(f"{len(response['documents'])} matching documents shown, out of {response['total']}")
+    selected_ids = st.multiselect(
+        "Select documents",
+        list(options),
+        default=[document["document_id"] for document in selected],
+        format_func=lambda document_id: options[document_id]["file_name"],
     )
-    documents = response["all_documents_file_name"]
-    selected_documents = st.multiselect("Select documents", documents, format_func=lambda d: d["file_name"])
+    selected_documents = [options[document_id] for document_id in selected_ids]
+    st.session_state["READER_SELECTION"] = selected_documents
     return selected_documents
 
 
 def pdf_reader(dr, document_ids: list) -> None:
-    """Display the PDFs as embedded b64 strings in a markdown component"""
-    for document_id in document_ids:
-        response = client.get_document_by_id(
-            dr=dr,
-            weaviate_client=st.session_state.get("WEAVIATE_CLIENT"),
-            document_id=document_id,
-        )
-        base64_pdf = response["get_document_by_id"]["pdf_blob"]
-        pdf_str = f'<embed src="data:application/pdf;base64,{base64_pdf}" width=100% height=800 type="application/pdf">'
-        st.markdown(pdf_str, unsafe_allow_html=True)
+    """Display the PDFs as embedded b64 strings in a markdown component;
+    The documents are fetched concurrently and cached by the server
+    """
+    documents = client.read_documents(
+        dr=dr,
+        weaviate_client=st.session_state.get("WEAVIATE_CLIENT"),
+        document_ids=document_ids,
+    )
+    for document in documents:
+        if document["pdf_base64"] is None:
+            st.warning(f"{document['file_name']}: {document['error']}")
+            continue
+        embed_pdf(document["pdf_base64"])
+
+
+def cited_pages_reader(dr) -> None:
+    """Display only the pages around a chunk cited by an answer of the Retrieval page"""
+    chunks = [
+        chunk for entry in st.session_state.get("history", []) for chunk in entry["response"]["all_chunks"]
+    ]
+    if not chunks:
+        st.info("Ask a question on the Retrieval page first; the chunks cited by its answer are listed here")
+        return
+    citation_viewer(dr, chunks, key="reader_citation")
 
 
 def app() -> None:
+    client.warm_up()
     st.set_page_config(
         page_title="Library",
         page_icon="📚",
@@ -45,9 +86,15 @@ def app() -> None:
 
     dr = client.instantiate_driver()
 
-    selected_documents = document_selector(dr=dr)
-    print(selected_documents)
-    pdf_reader(dr=dr, document_ids=[doc["_additional"]["id"] for doc in selected_documents])
+    mode = st.radio("Read", ["Whole documents", "Pages around a citation"], horizontal=True)
+    if mode == "Whole documents":
+        selected_documents = document_selector(dr=dr)
+        pdf_reader(dr=dr, document_ids=[doc["document_id"] for doc in selected_documents])
+    else:
+        cited_pages_reader(dr=dr)
+
+    with st.sidebar:
+        execution_breakdown()
 
 
 if __name__ == "__main__":
@@ -2,7 +2,11 @@ import arxiv
 import streamlit as st
 
 import client
-from authentication import openai_connection_status, weaviate_connection_status
+from authentication import (
+    execution_breakdown,
+    openai_connection_status,
+    weaviate_connection_status,
+)
 
 
 def arxiv_search_container() -> None:
@@ -52,6 +56,7 @@ def article_selection_container(dr, arxiv_form: dict) -> None:
                 dr=dr,
                 weaviate_client=st.session_state.get("WEAVIATE_CLIENT"),
                 arxiv_ids=arxiv_ids,
+                summarize=st.session_state.get("SUMMARIZE_ON_INGESTION", False),
             )
 
 
@@ -64,10 +69,31 @@ def pdf_upload_container(dr):
                 dr=dr,
                 weaviate_client=st.session_state.get("WEAVIATE_CLIENT"),
                 pdf_files=uploaded_files,
+                summarize=st.session_state.get("SUMMARIZE_ON_INGESTION", False),
             )
 
 
+def summarization_container(dr) -> None:
+    """Container to summarize stored chunks in the background and follow the progress"""
+    st.checkbox(
+        "Summarize chunks of new documents in the background",
+        key="SUMMARIZE_ON_INGESTION",
+        help="Queries then use the stored summaries instead of summarizing each retrieved chunk",
+    )
+    if st.button("Summarize existing chunks", help="Catch up on the chunks stored without a summary"):
+        client.summarize_chunks(dr=dr, weaviate_client=st.session_state.get("WEAVIATE_CLIENT"))
+
+    progress = client.summarization_progress()
+    if progress["total"]:
+        finished = progress["done"] + progress["failed"]
+        st.progress(
+            finished / progress["total"],
+            text=f"{progress['done']}/{progress['total']} chunks summarized, {progress['failed']} failed",
+        )
+
+
 def app() -> None:
+    client.warm_up()
     st.set_page_config(
         page_title="📥 ingestion",
         page_icon="📚",
@@ -94,7 +120,7 @@ def app() -> None:
         """)
         return
     
-    dr = client.instantiate_driver()
+    dr = client.instantiate_driver(ingestion_mode="streaming")
 
     left, right = st.columns(2)
 
@@ -108,6 +134,12 @@ def app() -> None:
         st.subheader("Upload PDF files")
         pdf_upload_container(dr)
 
+    st.subheader("Summarize chunks")
+    summarization_container(dr)
+
+    with st.sidebar:
+        execution_breakdown()
+
 
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -1,10 +1,17 @@
 import json
+import tempfile
+from pathlib import Path
 
 import pandas as pd
 import streamlit as st
 
 import client
-from authentication import openai_connection_status, weaviate_connection_status
+from authentication import (
+    citation_viewer,
+    execution_breakdown,
+    openai_connection_status,
+    weaviate_connection_status,
+)
 
 
 def retrieval_form_container(dr) -> None:
@@ -28,20 +35,107 @@ def retrieval_form_container(dr) -> None:
             value=0.75,
             help="0: Keyword. 1: Vector.\n[Weaviate docs](https://weaviate.io/developers/weaviate/api/graphql/search-operators#hybrid)",
         )
+        answer_similarity_threshold = answer_similarity_input()
 
     if form.form_submit_button("Search"):
         with st.status("Running"):
-            response = client.rag_summary(
+            response = client.rag_summary_stream(
                 dr=dr,
                 weaviate_client=st.session_state.get("WEAVIATE_CLIENT"),
                 rag_query=rag_query,
                 hybrid_search_alpha=hybrid_search_alpha,
                 retrieve_top_k=int(retrieve_top_k),
+                answer_similarity_threshold=answer_similarity_threshold,
             )
+        response["rag_summary"] = stream_text(response["rag_summary"])
         st.session_state["history"].append(dict(query=rag_query, response=response))
 
 
-def history_display_container(history):
+def answer_similarity_input(container=st, key: str | None = None) -> float | None:
+    """Slider of the similarity above which a cached answer is served for another query;
+    1.0 serves the answers of the same query only
+    """
+    threshold = container.slider(
+        "answer cache similarity",
+        min_value=0.9,
+        max_value=1.0,
+        value=client.ANSWER_SIMILARITY_THRESHOLD,
+        step=0.005,
+        key=key,
+        help="Serve the cached answer of a query whose embedding is at least this similar. 1: the same query only",
+    )
+    return None if threshold >= 1.0 else threshold
+
+
+def stream_text(tokens) -> str:
+    """Render a response as it is generated and return it in full;
+    The rendering is cleared at the end, the full response is shown with the history
+    """
+    placeholder = st.empty()
+    text = ""
+    for token in tokens:
+        text += token
+        with placeholder.container():
+            st.subheader("Response")
+            st.markdown(text + "▌")
+    placeholder.empty()
+    return text
+
+
+def bulk_query_container(dr) -> None:
+    """Container to answer a file of queries at once and download the answers as JSONL"""
+    with st.expander("Bulk queries"):
+        form = st.form(key="bulk_query")
+        queries_file = form.file_uploader(
+            "Queries",
+            type=["csv", "jsonl"],
+            help="CSV with a `query` column, or JSONL with one query per line",
+        )
+        retrieve_top_k = form.number_input("top K", value=3, key="bulk_top_k")
+        hybrid_search_alpha = form.slider(
+            "alpha", min_value=0.0, max_value=1.0, value=0.75, key="bulk_alpha"
+        )
+        answer_similarity_threshold = answer_similarity_input(form, key="bulk_similarity")
+
+        if form.form_submit_button("Run") and queries_file is not None:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                queries_path = Path(tmp_dir, queries_file.name)
+                queries_path.write_bytes(queries_file.getvalue())
+                output_path = Path(tmp_dir, "answers.jsonl")
+                progress = st.progress(0.0, text="Answering")
+
+                def on_result(result: dict, n_done: int, n_queries: int) -> None:
+                    progress.progress(n_done / n_queries, text=f"Answered {n_done}/{n_queries}")
+
+                report = client.bulk_rag_summary(
+                    dr=dr,
+                    weaviate_client=st.session_state.get("WEAVIATE_CLIENT"),
+                    queries_path=str(queries_path),
+                    output_path=str(output_path),
+                    hybrid_search_alpha=hybrid_search_alpha,
+                    retrieve_top_k=int(retrieve_top_k),
+                    answer_similarity_threshold=answer_similarity_threshold,
+                    on_result=on_result,
+                )
+                st.session_state["BULK_ANSWERS"] = output_path.read_bytes(), report
+                progress.empty()
+
+        if bulk_answers := st.session_state.get("BULK_ANSWERS"):
+            answers, report = bulk_answers
+            st.caption(
+                f"{report['queries']} queries in {report['seconds']:.1f} s"
+                f" ({report['queries_per_second']:.2f}/s): {report['failed']} failed,"
+                f" {report['cached']} from cache, {report['chunk_summaries_shared']} chunk summaries shared"
+            )
+            st.download_button(
+                "Download answers",
+                data=answers,
+                file_name="vector-librarian-answers.jsonl",
+                mime="application/jsonl",
+            )
+
+
+def history_display_container(dr, history):
     if len(history) > 1:
         st.header("History")
         max_idx = len(history) - 1
@@ -84,8 +178,11 @@ def history_display_container(history):
                       }
     )
 
+    citation_viewer(dr, entry["response"]["all_chunks"], key="retrieval_citation")
+
 
 def app() -> None:
+    client.warm_up()
     st.set_page_config(
         page_title="📤 retrieval",
         page_icon="📚",
@@ -109,12 +206,16 @@ def app() -> None:
     dr = client.instantiate_driver()
 
     retrieval_form_container(dr)
+    bulk_query_container(dr)
 
     if history := st.session_state.get("history"):
-        history_display_container(history)
+        history_display_container(dr, history)
     else:
         st.session_state["history"] = list()
 
+    with st.sidebar:
+        execution_breakdown()
+
 
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -41,19 +41,24 @@ def main():
     # Chatbot Processing
     if st.button("Search"):
         with st.spinner("Searching..."):
-            response = client.rag_summary(
+            response = client.rag_summary_stream(
                 dr=dr,
                 weaviate_client=st.session_state.get("WEAVIATE_CLIENT"),
                 rag_query=rag_query,
                 hybrid_search_alpha=hybrid_search_alpha,
                 retrieve_top_k=int(retrieve_top_k),
-                pdf_content=uploaded_file.read() if uploaded_file else None,
             )
-        st.session_state["history"].append(dict(query=rag_query, response=response))
 
-        # Display Results
+        # Display Results, as they are generated
         st.header("Chatbot Response:")
-        st.write(response["rag_summary"])
+        placeholder = st.empty()
+        text = ""
+        for token in response["rag_summary"]:
+            text += token
+            placeholder.markdown(text + "▌")
+        placeholder.markdown(text)
+        response["rag_summary"] = text
+        st.session_state.setdefault("history", []).append(dict(query=rag_query, response=response))
 
         # Display Detailed Results
         st.subheader("Detailed Results:")